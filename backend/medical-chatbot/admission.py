@@ -0,0 +1,153 @@
+"""
+التحكم في قبول الطلبات: حد للطلبات المتزامنة لكل نقطة نهاية مع طابور انتظار محدود
+
+عند امتلاء الفتحات ينتظر الطلب في طابور بترتيب الوصول. إذا امتلأ الطابور يرفض فوراً
+(429)، وإذا طال الانتظار أكثر من queue_timeout يرفض (503). في الحالتين يرفق
+Retry-After مقدراً من متوسط زمن الخدمة وعمق الطابور، حتى يفشل الطلب بسرعة بدلاً من
+أن تتراكم الطلبات وتنتهي مهلتها كلها تحت الضغط.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Dict
+
+import numpy as np
+
+
+class AdmissionRejected(Exception):
+    """رفض الطلب لتجاوز السعة، مع الوقت المقترح لإعادة المحاولة"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """فتحة محجوزة لطلب مقبول، تحرر مرة واحدة فقط"""
+
+    def __init__(self, controller: "AdmissionController", wait_time: float):
+        self.controller = controller
+        self.wait_time = wait_time
+        self.admitted_at = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        self.controller._release(time.monotonic() - self.admitted_at)
+
+
+class AdmissionController:
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float, window: int = 1024):
+        """
+        name: اسم نقطة النهاية (للإحصائيات والرسائل)
+        max_concurrent: عدد الطلبات المنفذة في نفس الوقت
+        max_queue: أقصى عدد للطلبات المنتظرة (0 = رفض فوري عند امتلاء الفتحات)
+        queue_timeout: أقصى زمن انتظار في الطابور بالثواني
+        window: عدد أزمنة الانتظار الأخيرة المحفوظة لحساب النسب المئوية
+        """
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters = deque()
+        self._wait_times = deque(maxlen=window)
+        self._service_time = None  # المتوسط المتحرك الأسي لزمن تنفيذ الطلب
+        self._alpha = 0.2
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.max_queue_depth = 0
+
+    def _retry_after(self) -> int:
+        """تقدير الثواني حتى تتسع السعة: زمن تفريغ الطابور الحالي"""
+        if self._service_time is None:
+            return 1
+        drain = self._service_time * (len(self._waiters) + 1) / self.max_concurrent
+        return min(60, max(1, math.ceil(drain)))
+
+    async def acquire(self) -> AdmissionTicket:
+        """حجز فتحة أو الانتظار في الطابور، ويرفع AdmissionRejected عند تجاوز السعة"""
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            return self._admit(0.0)
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(429, "الخادم مشغول حالياً، حاول مرة أخرى بعد قليل", self._retry_after())
+
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            # قد تسلم الفتحة في نفس لحظة انتهاء المهلة، فيقبل الطلب
+            if not (waiter.done() and not waiter.cancelled()):
+                self._remove_waiter(waiter)
+                self.rejected_timeout += 1
+                raise AdmissionRejected(503, "انتهت مهلة الانتظار في طابور الطلبات، حاول لاحقاً", self._retry_after())
+        except asyncio.CancelledError:
+            # قطع العميل الاتصال أثناء الانتظار: إعادة الفتحة إن كانت قد سلمت له
+            if waiter.done() and not waiter.cancelled():
+                self._release(None)
+            else:
+                self._remove_waiter(waiter)
+            raise
+
+        return self._admit(time.monotonic() - start)
+
+    def _admit(self, wait_time: float) -> AdmissionTicket:
+        self.admitted += 1
+        self._wait_times.append(wait_time)
+        return AdmissionTicket(self, wait_time)
+
+    def _remove_waiter(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _release(self, service_time):
+        if service_time is not None:
+            self._service_time = service_time if self._service_time is None else (
+                self._alpha * service_time + (1 - self._alpha) * self._service_time
+            )
+        # تسليم الفتحة مباشرة لأقدم طلب منتظر (دون إنقاص العداد) حتى لا يسبقه طلب جديد
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def stats(self) -> Dict:
+        waits = np.fromiter(self._wait_times, dtype=np.float64) * 1000
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "active": self._active,
+            "queue_depth": len(self._waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_ms": {
+                "mean": round(float(waits.mean()), 2) if len(waits) else 0.0,
+                "p50": round(float(np.percentile(waits, 50)), 2) if len(waits) else 0.0,
+                "p95": round(float(np.percentile(waits, 95)), 2) if len(waits) else 0.0,
+                "max": round(float(waits.max()), 2) if len(waits) else 0.0,
+            },
+            "service_ms": round(self._service_time * 1000, 2) if self._service_time is not None else None,
+        }
@@ -0,0 +1,155 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    def __init__(self, max_size: int = 512, threshold: float = 0.92, ttl: float = 3600):
+        """
+        ذاكرة تخزين مؤقت للإجابات مبنية على تشابه تضمينات الأسئلة
+        threshold: أقل تشابه جيب تمام (cosine) لاعتبار السؤالين متطابقين
+        ttl: مدة صلاحية الإجابة بالثواني
+        الإجابات مرتبطة بإصدار قاعدة البيانات (version) الذي بُنيت عليه مصادرها:
+        أول استخدام بإصدار أحدث يفرغ الذاكرة، والإصدارات الأقدم لا تُقرأ ولا تُخزن
+        """
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        # فهرس متجهات صغير: مصفوفة محجوزة مسبقاً بصف لكل خانة
+        self._vectors: Optional[np.ndarray] = None
+        self._valid = np.zeros(max_size, dtype=bool)
+        self._expires_at = np.zeros(max_size, dtype='float64')
+        self._last_used = np.zeros(max_size, dtype='float64')
+        self._type_ids = np.full(max_size, -1, dtype='int32')
+        self._type_names: Dict[str, int] = {}
+        self._entries: List[Optional[Dict]] = [None] * max_size
+        self.version: Optional[int] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype='float32').reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _type_id(self, user_type: str) -> int:
+        if user_type not in self._type_names:
+            self._type_names[user_type] = len(self._type_names)
+        return self._type_names[user_type]
+
+    def _expire(self, now: float):
+        """إبطال الخانات المنتهية صلاحيتها"""
+        expired = self._valid & (self._expires_at <= now)
+        count = int(expired.sum())
+        if count:
+            self._valid[expired] = False
+            for slot in np.flatnonzero(expired):
+                self._entries[slot] = None
+            self.expirations += count
+
+    def _check_version(self, version: Optional[int]) -> bool:
+        """مزامنة إصدار قاعدة البيانات (تحت القفل)، وترجع False لطلب بدأ على إصدار أقدم"""
+        if version is None or version == self.version:
+            return True
+        if self.version is not None and version < self.version:
+            return False
+        # إصدار جديد: الإجابات السابقة قد تشير لمستندات تغيرت أو حذفت
+        self._clear()
+        self.version = version
+        return True
+
+    def lookup(self, user_type: str, vector: np.ndarray, version: Optional[int] = None) -> Optional[Dict]:
+        """البحث عن إجابة مخزنة لسؤال مشابه من نفس نوع المستخدم"""
+        if self.max_size <= 0:
+            return None
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            if not self._check_version(version):
+                self.misses += 1
+                return None
+            self._expire(now)
+            type_id = self._type_names.get(user_type)
+            if self._vectors is None or type_id is None:
+                self.misses += 1
+                return None
+
+            candidates = np.flatnonzero(self._valid & (self._type_ids == type_id))
+            if candidates.size == 0:
+                self.misses += 1
+                return None
+
+            similarities = self._vectors[candidates] @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            slot = int(candidates[best])
+            self._last_used[slot] = now
+            self.hits += 1
+            return dict(self._entries[slot], similarity=similarity)
+
+    def put(self, user_type: str, question: str, vector: np.ndarray, answer: str, sources: list, version: Optional[int] = None):
+        """تخزين إجابة، مع إزالة الأقدم استخداماً عند الامتلاء (الإجابة الفارغة لا تُخزن)"""
+        if self.max_size <= 0 or not answer or not answer.strip():
+            return
+        vector = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            if not self._check_version(version):
+                return
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype='float32')
+
+            self._expire(now)
+            free = np.flatnonzero(~self._valid)
+            if free.size:
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+
+            self._vectors[slot] = vector
+            self._valid[slot] = True
+            self._expires_at[slot] = now + self.ttl
+            self._last_used[slot] = now
+            self._type_ids[slot] = self._type_id(user_type)
+            self._entries[slot] = {
+                "question": question,
+                "answer": answer,
+                "sources": sources,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._valid[:] = False
+        self._entries = [None] * self.max_size
+
+    def stats(self) -> Dict:
+        """إحصائيات الاستخدام لعرضها في /status"""
+        total = self.hits + self.misses
+        return {
+            "size": int(self._valid.sum()),
+            "version": self.version,
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
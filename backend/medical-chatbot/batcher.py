@@ -0,0 +1,165 @@
+"""
+تجميع ديناميكي لطلبات الترميز: استعلامات كل الطلبات المتزامنة تُرمز بتمرير واحد للنموذج
+
+الدفعة تُرسل عند بلوغ max_batch_size استعلاماً أو بعد max_wait من وصول أول استعلام فيها.
+عدد الدفعات قيد التنفيذ محدود بـ max_in_flight (عدد خيوط البحث)، وما يصل أثناء انشغالها
+يتجمع في الدفعة التالية، فيكبر حجم الدفعة تلقائياً مع ازدياد الضغط.
+
+الإعدادات:
+    ENCODE_MAX_BATCH          أقصى عدد استعلامات في الدفعة (32)
+    ENCODE_BATCH_WINDOW_MS    أقصى انتظار لاكتمال الدفعة بالمللي ثانية (5)
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor
+from typing import Callable, Dict, List
+
+import numpy as np
+
+
+class EncodeBatcher:
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        executor: Executor,
+        max_batch_size: int = None,
+        max_wait: float = None,
+        max_in_flight: int = 1,
+        window: int = 1024,
+    ):
+        """
+        encode_fn: دالة متزامنة تُرمز قائمة نصوص وترجع مصفوفة (صف لكل نص)
+        executor: الخيوط التي تنفذ encode_fn
+        max_wait: أقصى انتظار بالثواني قبل إرسال دفعة غير مكتملة
+        window: عدد الدفعات الأخيرة المحفوظة لحساب الإحصائيات
+        """
+        self.encode_fn = encode_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size or int(os.getenv("ENCODE_MAX_BATCH", "32"))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("ENCODE_BATCH_WINDOW_MS", "5")) / 1000
+        self.max_in_flight = max(1, max_in_flight)
+
+        self._pending = deque()  # (texts, future, وقت الوصول)
+        self._pending_texts = 0
+        self._in_flight = 0
+        self._flush_handle = None
+        self._loop = None
+
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self._batch_sizes = deque(maxlen=window)
+        self._wait_times = deque(maxlen=window)
+        self._encode_times = deque(maxlen=window)
+
+    def _bind_loop(self, loop):
+        if self._loop is not loop:
+            # حلقة أحداث جديدة (مثلاً بعد asyncio.run آخر): ما بقي من السابقة لن يكتمل
+            self._pending.clear()
+            self._pending_texts = 0
+            self._in_flight = 0
+            self._flush_handle = None
+            self._loop = loop
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        """ترميز texts ضمن الدفعة الحالية، ويرجع صفاً لكل نص بنفس الترتيب"""
+        loop = asyncio.get_running_loop()
+        self._bind_loop(loop)
+
+        future = loop.create_future()
+        self._pending.append((texts, future, time.perf_counter()))
+        self._pending_texts += len(texts)
+
+        if self._pending_texts >= self.max_batch_size or self.max_wait <= 0:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        # ما بقي بعد امتلاء الدفعات الجارية يرسل عند انتهاء إحداها
+        while self._pending and self._in_flight < self.max_in_flight:
+            self._start_batch()
+
+    def _start_batch(self):
+        # طلبات كاملة بترتيب الوصول حتى max_batch_size (طلب واحد أكبر منها يرسل وحده)
+        batch, size = [], 0
+        while self._pending and (not batch or size + len(self._pending[0][0]) <= self.max_batch_size):
+            texts, future, arrived = self._pending.popleft()
+            self._pending_texts -= len(texts)
+            if future.done():
+                # ألغى صاحب الطلب انتظاره
+                continue
+            batch.append((texts, future, arrived))
+            size += len(texts)
+        if not batch:
+            return
+
+        # نفس النص من عدة طلبات يُرمز مرة واحدة
+        unique = list(dict.fromkeys(text for texts, _, _ in batch for text in texts))
+        rows = {text: row for row, text in enumerate(unique)}
+
+        start = time.perf_counter()
+        for _, _, arrived in batch:
+            self._wait_times.append(start - arrived)
+        self._in_flight += 1
+
+        def run():
+            began = time.perf_counter()
+            return self.encode_fn(unique), time.perf_counter() - began
+
+        def done(task: asyncio.Future):
+            self._in_flight -= 1
+            error = task.exception() if not task.cancelled() else asyncio.CancelledError()
+            if error is None:
+                encoded, encode_time = task.result()
+                self.batches += 1
+                self.items += len(unique)
+                self.max_batch_seen = max(self.max_batch_seen, len(unique))
+                self._batch_sizes.append(len(unique))
+                self._encode_times.append(encode_time)
+            for texts, future, _ in batch:
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(encoded[[rows[text] for text in texts]])
+            # ما تجمع أثناء التنفيذ يرسل فوراً دون انتظار النافذة
+            if self._pending:
+                self._flush()
+
+        self._loop.run_in_executor(self.executor, run).add_done_callback(done)
+
+    def stats(self) -> Dict:
+        sizes = np.fromiter(self._batch_sizes, dtype=np.float64)
+        waits = np.fromiter(self._wait_times, dtype=np.float64) * 1000
+        encode_times = np.fromiter(self._encode_times, dtype=np.float64)
+
+        def percentile(values, q):
+            return round(float(np.percentile(values, q)), 2) if len(values) else 0.0
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight,
+            "pending": self._pending_texts,
+            "batches": self.batches,
+            "items": self.items,
+            "batch_size": {
+                "mean": round(float(sizes.mean()), 2) if len(sizes) else 0.0,
+                "p95": percentile(sizes, 95),
+                "max": self.max_batch_seen,
+            },
+            "wait_ms": {"p50": percentile(waits, 50), "p95": percentile(waits, 95)},
+            "encode_ms_per_batch": round(float(encode_times.mean()) * 1000, 2) if len(encode_times) else 0.0,
+            # استعلامات لكل ثانية من زمن النموذج (على الدفعات الأخيرة)
+            "throughput_qps": round(float(sizes.sum() / encode_times.sum()), 1) if encode_times.sum() > 0 else 0.0,
+        }
@@ -0,0 +1,106 @@
+"""
+مقارنة دقة الاسترجاع (recall@k) وزمن البحث لفهارس FAISS التقريبية مع الفهرس الشامل
+
+الاستخدام:
+    python benchmarks/bench_ann_index.py --source docs --k 5
+    python benchmarks/bench_ann_index.py --source random --n 50000 --dim 384
+
+--source docs يستخدم التضمينات المحفوظة في medical_db إن وجدت، وإلا يرمّز مستنداتها بالنموذج،
+و --source random يولد تضمينات عشوائية متجمعة لمحاكاة موسوعة أكبر.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from index_factory import build_index, set_search_params
+from vector_store import load_embeddings, embeddings_paths
+from doc_store import load_documents
+
+
+def load_doc_embeddings() -> np.ndarray:
+    db_path = os.path.join(BASE_DIR, "medical_db")
+    if os.path.exists(embeddings_paths(db_path)[1]):
+        return np.asarray(load_embeddings(db_path)[0])
+    from embeddings import EmbeddingManager
+    manager = EmbeddingManager()
+    manager.add_documents(list(load_documents(db_path)))
+    return manager.embeddings
+
+
+def random_embeddings(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """تضمينات عشوائية متجمعة حول مراكز (أقرب لتوزيع النصوص من الضوضاء المنتظمة)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 50), dim)).astype('float32')
+    data = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.normal(size=(n, dim)).astype('float32')
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    return data.astype('float32')
+
+
+def make_queries(embeddings: np.ndarray, n_queries: int, seed: int = 1) -> np.ndarray:
+    """استعلامات قريبة من مستندات موجودة مع ضوضاء خفيفة"""
+    rng = np.random.default_rng(seed)
+    picks = embeddings[rng.integers(0, len(embeddings), n_queries)]
+    queries = picks + 0.05 * rng.normal(size=picks.shape).astype('float32')
+    return queries.astype('float32')
+
+
+def recall_at_k(result_ids: np.ndarray, truth_ids: np.ndarray) -> float:
+    k = truth_ids.shape[1]
+    hits = sum(len(set(r[r >= 0]) & set(t)) for r, t in zip(result_ids, truth_ids))
+    return hits / (len(truth_ids) * k)
+
+
+def measure(index, queries: np.ndarray, k: int):
+    """زمن البحث لاستعلام واحد في كل مرة (كما في الخدمة) بالمللي ثانية"""
+    ids = np.empty((len(queries), k), dtype='int64')
+    start = time.perf_counter()
+    for i in range(len(queries)):
+        _, ids[i] = index.search(queries[i:i + 1], k)
+    elapsed = time.perf_counter() - start
+    return ids, elapsed / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="recall@k مقابل الزمن لفهارس FAISS")
+    parser.add_argument("--source", choices=["docs", "random"], default="docs")
+    parser.add_argument("--n", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    embeddings = load_doc_embeddings() if args.source == "docs" else random_embeddings(args.n, args.dim)
+    queries = make_queries(embeddings, args.queries)
+    print(f"المستندات: {len(embeddings)} - البعد: {embeddings.shape[1]} - الاستعلامات: {len(queries)} - k={args.k}\n")
+
+    flat = build_index(embeddings, "flat")
+    truth, flat_ms = measure(flat, queries, args.k)
+
+    rows = [("flat", "-", 0.0, 1.0, flat_ms)]
+    sweeps = {
+        "ivf_flat": ("nprobe", [1, 4, 8, 16, 32, 64]),
+        "ivf_pq": ("nprobe", [1, 4, 8, 16, 32, 64]),
+        "hnsw": ("ef_search", [16, 32, 64, 128, 256]),
+    }
+    for index_type, (param, values) in sweeps.items():
+        start = time.perf_counter()
+        index = build_index(embeddings, index_type)
+        build_time = time.perf_counter() - start
+        for value in values:
+            set_search_params(index, **{param: value})
+            ids, ms = measure(index, queries, args.k)
+            rows.append((index_type, f"{param}={value}", build_time, recall_at_k(ids, truth), ms))
+
+    print(f"{'الفهرس':<10} {'المعامل':<14} {'البناء (ث)':>10} {'recall@k':>9} {'ms/استعلام':>11}")
+    for index_type, setting, build_time, recall, ms in rows:
+        print(f"{index_type:<10} {setting:<14} {build_time:>10.2f} {recall:>9.3f} {ms:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+مقارنة البحث المتسلسل (search لكل استعلام) مع البحث المجمّع (search_batch)
+
+الاستخدام:
+    python benchmarks/bench_batch_search.py --queries 10 --repeats 5
+
+يستخدم medical_db المحفوظة إن وجدت، وإلا يبني فهرساً من أول --docs مستند
+في مستندات medical_db.
+"""
+import argparse
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from embeddings import EmbeddingManager
+from doc_store import load_documents
+
+SAMPLE_QUERIES = [
+    "الأسبرين", "الميتفورمين", "الإنسولين", "الباراسيتامول", "أموكسيسيلين",
+    "أتورفاستاتين", "أملوديبين", "ليفوثيروكسين", "أوميبرازول", "وارفارين",
+    "صداع ودوخة", "غثيان", "تحسين الصحة العامة", "ارتفاع ضغط الدم", "السكري",
+]
+
+
+def load_manager(n_docs: int) -> EmbeddingManager:
+    manager = EmbeddingManager()
+    db_path = os.path.join(BASE_DIR, "medical_db")
+    if os.path.exists(f"{db_path}.index"):
+        manager.load(db_path)
+    else:
+        documents = load_documents(db_path)
+        manager.add_documents(documents[:n_docs])
+    return manager
+
+
+def time_it(fn, repeats: int) -> float:
+    fn()  # تمهيد
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="مقارنة search مع search_batch")
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=1)
+    args = parser.parse_args()
+
+    manager = load_manager(args.docs)
+    queries = (SAMPLE_QUERIES * (args.queries // len(SAMPLE_QUERIES) + 1))[:args.queries]
+
+    loop_time = time_it(lambda: [manager.search(q, k=args.k) for q in queries], args.repeats)
+    batch_time = time_it(lambda: manager.search_batch(queries, k=args.k), args.repeats)
+
+    # التحقق من تطابق النتائج
+    loop_ids = [[r["index"] for r in manager.search(q, k=args.k)] for q in queries]
+    batch_ids = [[r["index"] for r in results] for results in manager.search_batch(queries, k=args.k)]
+
+    print(f"عدد الاستعلامات: {len(queries)} - المستندات: {manager.index.ntotal}")
+    print(f"البحث المتسلسل: {loop_time * 1000:.1f} ms")
+    print(f"البحث المجمّع:  {batch_time * 1000:.1f} ms")
+    print(f"التسريع: {loop_time / batch_time:.2f}x")
+    print(f"تطابق النتائج: {'نعم' if loop_ids == batch_ids else 'لا'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+قياس ترميز المستندات عند بناء الفهرس: الطريقة السابقة (دفعات ثابتة من 32 بترتيب الأجزاء)
+مقابل BulkEncoder (ترتيب حسب الطول ودفعات متكيفة وعدة عمليات)
+
+الاستخدام:
+    python benchmarks/bench_bulk_encode.py --db medical_db --limit 2000
+    python benchmarks/bench_bulk_encode.py --workers 1 2 4 8
+
+بدون --db تُستخدم أجزاء تجريبية بأطوال متفاوتة. النتيجة بالأجزاء في الثانية، مع التحقق
+من أن كل الطرق تعطي نفس التضمينات.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_encoder import BulkEncoder
+from doc_store import load_documents
+from encoder_backends import load_encoder
+
+
+def synthetic_chunks(n: int):
+    random.seed(0)
+    words = ("diabetes insulin glucose pressure artery cardiac asthma airway inflammation symptom "
+             "treatment dose tablet chronic infection fever cough pain migraine nausea").split()
+    return [" ".join(random.choices(words, k=random.randint(5, 120))) for _ in range(n)]
+
+
+def encode_fixed_batches(model, texts, batch_size=32):
+    """الطريقة السابقة في add_documents"""
+    all_embeddings = []
+    for i in range(0, len(texts), batch_size):
+        all_embeddings.extend(model.encode(texts[i:i + batch_size], convert_to_numpy=True))
+    return np.array(all_embeddings).astype('float32')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس ترميز المستندات عند بناء الفهرس")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--db", default=None, help="قاعدة بيانات لأخذ الأجزاء منها")
+    parser.add_argument("--limit", type=int, default=2000, help="عدد الأجزاء المقاسة")
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4])
+    parser.add_argument("--token-budget", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.db:
+        documents = load_documents(args.db)
+        texts = [documents[i] for i in range(min(args.limit, len(documents)))]
+    else:
+        texts = synthetic_chunks(args.limit)
+    print(f"الأجزاء: {len(texts)} - متوسط الطول {np.mean([len(text) for text in texts]):.0f} حرف - المعالج: {os.cpu_count()} نواة")
+
+    model = load_encoder(args.model)
+    model.encode(texts[:8], convert_to_numpy=True)  # تمهيد
+
+    start = time.perf_counter()
+    reference = encode_fixed_batches(model, texts)
+    baseline = len(texts) / (time.perf_counter() - start)
+    print(f"\n{'الطريقة':<28} {'جزء/ثانية':>10} {'التسريع':>8} {'أقصى فرق':>10}")
+    print(f"{'دفعات ثابتة (32)':<28} {baseline:>10.1f} {1.0:>7.2f}x {0.0:>10.2e}")
+
+    for workers in args.workers:
+        encoder = BulkEncoder(model, args.model, workers=workers, token_budget=args.token_budget)
+        # تشغيل العمليات وتحميل النموذج فيها خارج القياس
+        encoder.warm_up()
+        start = time.perf_counter()
+        embeddings = encoder.encode(texts)
+        rate = len(texts) / (time.perf_counter() - start)
+        encoder.close()
+        diff = float(np.abs(embeddings - reference).max())
+        label = f"BulkEncoder ({workers} عملية)"
+        print(f"{label:<28} {rate:>10.1f} {rate / baseline:>7.2f}x {diff:>10.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+قياس إنتاجية /chat تحت حمل متزامن: الترميز والبحث على خيوط البحث مقابل تنفيذهما داخل حلقة الأحداث
+
+الاستخدام:
+    python benchmarks/bench_chat_throughput.py --requests 64 --concurrency 16
+    python benchmarks/bench_chat_throughput.py --inline        # السلوك السابق للمقارنة
+    ENCODE_MAX_BATCH=1 python benchmarks/bench_chat_throughput.py   # بدون تجميع الترميز
+    python benchmarks/bench_chat_throughput.py --db medical_db
+
+كل طلب يحمل سؤالاً مختلفاً والذاكرات المؤقتة معطلة حتى يمر كل طلب بالترميز والبحث.
+الخدمة الخارجية خادم وهمي محلي ينتظر --latency ثانية. يقاس أيضاً أقصى تأخر لحلقة
+الأحداث: مؤقت كل 10ms يسجل كم تأخر عن موعده، وهو ما يشعر به كل طلب آخر أثناء الترميز.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_concurrent_chat import start_stub_server
+
+TOPICS = [
+    "diabetes", "hypertension", "asthma", "migraine", "anemia", "arthritis", "influenza",
+    "pneumonia", "insomnia", "obesity", "hepatitis", "allergy", "bronchitis", "gout",
+]
+
+
+def make_questions(n: int):
+    return [
+        f"What are the symptoms and treatment of {TOPICS[i % len(TOPICS)]} in patient number {i}?"
+        for i in range(n)
+    ]
+
+
+async def measure_loop_lag(stop: asyncio.Event, lags: list, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def run(args):
+    import httpx
+
+    server = start_stub_server(args.latency)
+    os.environ["OPENROUTER_URL"] = f"http://127.0.0.1:{server.server_port}/api/v1/chat/completions"
+    os.environ.setdefault("OPENROUTER_API_KEY", "benchmark-key")
+    os.environ["ANSWER_CACHE_SIZE"] = "0"
+    os.environ["QUERY_CACHE_SIZE"] = "0"
+    os.environ["CHAT_MAX_CONCURRENT"] = str(args.concurrency)
+    os.environ["CHAT_MAX_QUEUE"] = str(args.requests)
+
+    import main
+
+    manager = main.embedding_manager
+    if args.db and manager.db_exists(args.db):
+        manager.load(args.db)
+    else:
+        manager.add_documents([
+            f"{topic} is a condition. Common symptoms of {topic} include fatigue and pain. Treatment of {topic} {i}."
+            for i, topic in enumerate(TOPICS * 50)
+        ])
+    main.initialization_status["is_initialized"] = True
+
+    if args.inline:
+        # السلوك السابق: الترميز والبحث مباشرة داخل حلقة الأحداث
+        async def inline_encode(queries):
+            return manager.encode_queries(queries)
+
+        async def inline_search(queries, k=5, query_embeddings=None, **kwargs):
+            return manager.hybrid_search_batch(queries, k, query_embeddings=query_embeddings, **kwargs)
+
+        manager.aencode_queries = inline_encode
+        manager.ahybrid_search_batch = inline_search
+
+    questions = make_questions(args.requests + 1)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        # طلب تمهيدي لتحميل النموذج وفتح الاتصالات
+        await client.post("/chat", json={"question": questions[-1]})
+
+        async def one(question):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/chat", json={"question": question})
+                latencies.append(time.perf_counter() - start)
+                return response.status_code
+
+        stop, lags = asyncio.Event(), []
+        lag_task = asyncio.create_task(measure_loop_lag(stop, lags))
+        batches_before = manager.batcher.batches
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*[one(question) for question in questions[:args.requests]])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await lag_task
+
+    await main.llm_client.close()
+    main.embedding_manager.close()
+    server.shutdown()
+
+    latencies = np.array(latencies) * 1000
+    lags = np.array(lags or [0.0]) * 1000
+    ok = sum(1 for status in statuses if status == 200)
+    print(f"الوضع: {'داخل حلقة الأحداث' if args.inline else f'خيوط البحث ({manager.retrieval_workers}) مع نافذة تجميع {manager.batcher.max_wait * 1000:.0f}ms'}")
+    print(f"الطلبات: {args.requests} - الناجحة: {ok} - التزامن: {args.concurrency} - زمن الخدمة الخارجية: {args.latency:.2f} ثانية")
+    print(f"الإنتاجية: {args.requests / elapsed:.1f} طلب/ثانية (الزمن الكلي {elapsed:.2f} ثانية)")
+    print(f"زمن الطلب: p50={np.percentile(latencies, 50):.0f}ms  p95={np.percentile(latencies, 95):.0f}ms")
+    print(f"تأخر حلقة الأحداث: p95={np.percentile(lags, 95):.1f}ms  max={lags.max():.1f}ms")
+    if not args.inline:
+        batches = manager.batcher.batches - batches_before
+        stats = manager.batcher.stats()
+        print(f"دفعات الترميز: {batches} (متوسط {args.requests / max(1, batches):.1f} سؤال لكل دفعة، أقصى {stats['batch_size']['max']})")
+        print(f"انتظار الدفعة: p50={stats['wait_ms']['p50']:.1f}ms  p95={stats['wait_ms']['p95']:.1f}ms - إنتاجية النموذج: {stats['throughput_qps']} سؤال/ثانية")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس إنتاجية /chat تحت حمل متزامن")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.3, help="زمن استجابة الخدمة الخارجية الوهمية")
+    parser.add_argument("--db", default=None, help="قاعدة بيانات محفوظة بدلاً من مستندات تجريبية")
+    parser.add_argument("--inline", action="store_true", help="تنفيذ الترميز والبحث داخل حلقة الأحداث (للمقارنة)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
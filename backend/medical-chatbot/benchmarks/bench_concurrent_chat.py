@@ -0,0 +1,122 @@
+"""
+قياس تزامن نقطة /chat مقابل خادم OpenRouter وهمي محلي
+
+الاستخدام:
+    python benchmarks/bench_concurrent_chat.py --requests 20 --latency 1.0
+
+الخادم الوهمي ينتظر --latency ثانية قبل الرد، لذا يجب أن تنتهي N طلبات متزامنة
+في زمن قريب من زمن استجابة واحد وليس N ضعفاً له.
+الترميز والبحث ثابتان (بدون نموذج أو فهرس)، وكل طلب يحمل سؤالاً مختلفاً مع تعطيل ذاكرة
+الإجابات ودمج الطلبات المتطابقة، حتى يصل كل طلب فعلاً إلى الخادم الوهمي.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_stub_handler(latency: float):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            time.sleep(latency)
+            body = json.dumps({
+                "choices": [{"message": {"content": "إجابة تجريبية من الخادم الوهمي"}}]
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(latency: float):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_stub_handler(latency))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+async def run(n_requests: int, latency: float):
+    import httpx
+
+    server = start_stub_server(latency)
+    os.environ["OPENROUTER_URL"] = f"http://127.0.0.1:{server.server_port}/api/v1/chat/completions"
+    os.environ.setdefault("OPENROUTER_API_KEY", "benchmark-key")
+    os.environ["ANSWER_CACHE_SIZE"] = "0"
+    os.environ["LLM_SINGLE_FLIGHT"] = "0"
+    os.environ["CHAT_MAX_CONCURRENT"] = str(n_requests)
+    os.environ["CHAT_MAX_QUEUE"] = str(n_requests)
+
+    import numpy as np
+    import main
+    from doc_store import DocumentStore
+    from embeddings import IndexSnapshot
+
+    # عزل زمن الخدمة الخارجية: ترميز ونتائج بحث ثابتة بدلاً من النموذج والفهرس الحقيقيين
+    manager = main.embedding_manager
+    manager.swap(IndexSnapshot(index=None, documents=DocumentStore.build(["نص طبي تجريبي - صفحة 1"])))
+
+    async def fixed_encode(queries):
+        return np.ones((len(queries), 8), dtype='float32')
+
+    async def fixed_search(queries, k=5, query_embeddings=None, **kwargs):
+        return [[{"text": "نص طبي تجريبي - صفحة 1", "score": 0.5, "index": 0}] for _ in queries]
+
+    manager.aencode_queries = fixed_encode
+    manager.ahybrid_search_batch = fixed_search
+    main.initialization_status["is_initialized"] = True
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        def payload(i):
+            return {"question": f"ما هي أعراض السكري؟ ({i})", "user_type": "general"}
+
+        # طلب تمهيدي لفتح الاتصالات
+        await client.post("/chat", json=payload("warmup"))
+
+        upstream_calls = main.llm_client.upstream_calls
+        start = time.time()
+        responses = await asyncio.gather(*[client.post("/chat", json=payload(i)) for i in range(n_requests)])
+        elapsed = time.time() - start
+        upstream_calls = main.llm_client.upstream_calls - upstream_calls
+
+    await main.llm_client.close()
+    server.shutdown()
+
+    ok = sum(1 for r in responses if r.status_code == 200)
+    print(f"الطلبات: {n_requests} - الناجحة: {ok} - استدعاءات الخادم الوهمي: {upstream_calls}")
+    for r in responses:
+        if r.status_code != 200:
+            print(f"❌ {r.status_code}: {r.text[:200]}")
+            break
+    print(f"زمن الخدمة الخارجية لكل طلب: {latency:.2f} ثانية")
+    print(f"الزمن الكلي: {elapsed:.2f} ثانية (التنفيذ المتسلسل كان سيستغرق ~{n_requests * latency:.2f} ثانية)")
+    print(f"النسبة إلى زمن استجابة واحد: {elapsed / latency:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس تزامن /chat")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+مقارنة واجهات تشغيل نموذج الترميز: PyTorch مقابل ONNX Runtime (fp32 و int8)
+
+الاستخدام:
+    python encoder_backends.py all-MiniLM-L6-v2 --quantize     # التصدير أولاً
+    python benchmarks/bench_encoder_backends.py
+    python benchmarks/bench_encoder_backends.py --model all-MiniLM-L6-v2 --onnx-dir models/all-MiniLM-L6-v2-onnx
+
+كل واجهة تُقاس في عملية مستقلة حتى تكون الذاكرة (أقصى RSS) وزمن التحميل (بما فيه
+استيراد المكتبات) لها وحدها. يقاس زمن ترميز سؤال واحد (p50/p95) وإنتاجية الترميز
+بدفعات 32، وتشابه جيب التمام لكل نسخة مع تضمينات PyTorch لنفس النصوص.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+VARIANTS = {
+    "torch": {"ENCODER_BACKEND": "torch"},
+    "onnx": {"ENCODER_BACKEND": "onnx", "ENCODER_QUANTIZED": "0"},
+    "onnx-int8": {"ENCODER_BACKEND": "onnx", "ENCODER_QUANTIZED": "1"},
+}
+
+TOPICS = ["diabetes", "hypertension", "asthma", "migraine", "anemia", "arthritis", "influenza", "gout"]
+
+
+def make_texts(n: int):
+    return [
+        f"What are the symptoms, causes and treatment options for {TOPICS[i % len(TOPICS)]} "
+        f"in adult patient {i}? " + "Additional clinical detail. " * (i % 6)
+        for i in range(n)
+    ]
+
+
+def worker(args):
+    """يعمل داخل العملية الفرعية: تحميل الواجهة ثم القياس، والنتيجة JSON على stdout"""
+    start = time.perf_counter()
+    from encoder_backends import load_encoder, encoder_name
+    model = load_encoder(args.model)
+    load_time = time.perf_counter() - start
+
+    queries = make_texts(args.queries)
+    model.encode(queries[:4], convert_to_numpy=True)  # تمهيد
+
+    latencies = []
+    for query in queries:
+        began = time.perf_counter()
+        model.encode([query], convert_to_numpy=True)
+        latencies.append((time.perf_counter() - began) * 1000)
+
+    corpus = make_texts(args.corpus)
+    began = time.perf_counter()
+    embeddings = model.encode(corpus, batch_size=32, convert_to_numpy=True)
+    bulk_time = time.perf_counter() - began
+
+    np.save(args.output, np.asarray(embeddings, dtype=np.float32))
+    print(json.dumps({
+        "backend": encoder_name(model),
+        "load_s": load_time,
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "bulk_per_s": len(corpus) / bulk_time,
+    }))
+
+
+def run_variant(name: str, args, output: str):
+    env = dict(os.environ, **VARIANTS[name], ENCODER_MIN_COSINE="0")
+    if args.onnx_dir:
+        env["ENCODER_ONNX_DIR"] = args.onnx_dir
+    command = [
+        sys.executable, os.path.abspath(__file__), "--worker",
+        "--model", args.model, "--queries", str(args.queries), "--corpus", str(args.corpus), "--output", output,
+    ]
+    result = subprocess.run(command, env=env, cwd=BACKEND_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"❌ فشل قياس {name}:\n{result.stderr[-2000:]}")
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="مقارنة زمن وذاكرة واجهات نموذج الترميز")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--onnx-dir", default=None, help="مجلد النموذج المصدّر (افتراضي models/<النموذج>-onnx)")
+    parser.add_argument("--queries", type=int, default=200, help="عدد الأسئلة المفردة المقاسة")
+    parser.add_argument("--corpus", type=int, default=512, help="عدد النصوص في قياس الترميز بالدفعات")
+    parser.add_argument("--variants", nargs="*", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    import tempfile
+    from encoder_backends import cosine_similarity
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        embeddings = {}
+        for name in ["torch"] + [variant for variant in args.variants if variant != "torch"]:
+            output = os.path.join(tmp, f"{name}.npy")
+            result = run_variant(name, args, output)
+            if result is None:
+                continue
+            if result["backend"] != name:
+                # ONNX غير متاح فاستخدم PyTorch: لا معنى للمقارنة
+                print(f"⚠️ {name} غير متاح (تم تحميل {result['backend']})، صدّر النموذج أولاً عبر encoder_backends.py")
+                continue
+            results[name] = result
+            embeddings[name] = np.load(output)
+
+    print(f"\n{'الواجهة':<10} {'التحميل':>9} {'RSS':>9} {'p50':>9} {'p95':>9} {'دفعات/ث':>10} {'أدنى تشابه':>11}")
+    for name, result in results.items():
+        if name in embeddings and "torch" in embeddings:
+            cosine = f"{cosine_similarity(embeddings[name], embeddings['torch']).min():.5f}"
+        else:
+            cosine = "-"
+        print(
+            f"{name:<10} {result['load_s']:>8.2f}s {result['rss_mb']:>7.0f}MB "
+            f"{result['p50_ms']:>7.2f}ms {result['p95_ms']:>7.2f}ms {result['bulk_per_s']:>10.1f} {cosine:>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+قياس سرعة استخراج صفحات PDF (صفحة/ثانية) مع عدد مختلف من العمليات
+
+الاستخدام:
+    python benchmarks/bench_pdf_extract.py --pages 400 --max-workers 8
+
+يولد ملف PDF نصياً بعدد الصفحات المطلوب (بدون مكتبات إضافية) ثم يستخرج
+صفحاته بـ 1 حتى --max-workers عملية ويتحقق من تطابق النتائج وترتيبها.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_processor import PDFProcessor
+
+WORDS = (
+    "patient blood pressure diabetes insulin dose heart kidney liver symptom "
+    "treatment infection fever pain therapy chronic acute diagnosis vaccine"
+).split()
+
+
+def generate_pdf(path: str, n_pages: int, lines_per_page: int = 60, seed: int = 0):
+    """كتابة PDF بسيط بخط Helvetica وسطور نصية عشوائية في كل صفحة"""
+    rnd = random.Random(seed)
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")
+    kids = []
+    for _ in range(n_pages):
+        lines = [" ".join(rnd.choice(WORDS) for _ in range(12)) + "." for _ in range(lines_per_page)]
+        ops = ["BT /F1 8 Tf 30 810 Td 13 TL"] + [f"({line}) Tj T*" for line in lines] + ["ET"]
+        stream = "\n".join(ops).encode("latin-1")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font_id, content_id)
+        ))
+    objects[pages_id - 1] = (
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) + b"] /Count %d >>" % n_pages
+    )
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref)
+
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس استخراج صفحات PDF بالتوازي")
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shard-size", type=int, default=25)
+    parser.add_argument("--pdf", default=None, help="استخدام ملف PDF موجود بدلاً من التوليد")
+    args = parser.parse_args()
+
+    pdf_path = args.pdf
+    if not pdf_path:
+        pdf_path = os.path.join(tempfile.mkdtemp(), "bench.pdf")
+        generate_pdf(pdf_path, args.pages)
+
+    reference = None
+    rows = []
+    workers = 1
+    while workers <= args.max_workers:
+        processor = PDFProcessor(pdf_path, workers=workers, shard_size=args.shard_size)
+        start = time.perf_counter()
+        records = list(processor.extract_pages())
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            reference = records
+        rows.append((workers, len(records), elapsed, records == reference))
+        workers *= 2
+
+    print(f"\n{'العمليات':>8} {'الصفحات':>8} {'الزمن (ث)':>10} {'صفحة/ث':>8} {'التسريع':>8} {'مطابق':>6}")
+    for workers, pages, elapsed, same in rows:
+        print(f"{workers:>8} {pages:>8} {elapsed:>10.2f} {pages / elapsed:>8.1f} "
+              f"{rows[0][2] / elapsed:>8.2f} {'نعم' if same else 'لا':>6}")
+
+
+if __name__ == "__main__":
+    main()
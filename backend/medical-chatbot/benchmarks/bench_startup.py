@@ -0,0 +1,155 @@
+"""
+قياس زمن بدء الخادم: استيراد main، ثم متى يستجيب /health ومتى يصبح /ready جاهزاً
+
+الاستخدام:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --data-dir /path/to/dir-with-medical_db
+    ENCODER_BACKEND=onnx python benchmarks/bench_startup.py --runs 3
+
+1) ملف الاستيراد: python -X importtime -c "import main" في عملية مستقلة، وأثقل الحزم
+   بالزمن التراكمي، مع التحقق من أن المكتبات الثقيلة (torch و sentence_transformers...)
+   لم تُستورد بعد
+2) التشغيل: uvicorn في عملية مستقلة (المجلد الحالي --data-dir حيث medical_db)، ويقاس
+   من لحظة تشغيل العملية حتى أول 200 من /health ثم حتى أول 200 من /ready، ومراحل
+   التحميل في الخلفية كما تسجلها /status
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["torch", "sentence_transformers", "transformers", "onnxruntime", "pdfplumber", "pypdf", "langchain"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({"import_s": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def import_profile(env, top: int):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE], cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        print(f"❌ فشل استيراد main:\n{result.stderr[-2000:]}")
+        sys.exit(1)
+    summary = json.loads(result.stdout.strip().splitlines()[-1])
+
+    # السطر: import time: self [us] | cumulative | imported package
+    # العمق حسب المسافات قبل الاسم: المستوردات المباشرة لـ main تحت عمق 1، وتُجمع حسب الحزمة
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth != 1:
+            continue
+        root = name.strip().split(".")[0]
+        packages[root] = packages.get(root, 0) + int(cumulative)
+
+    print(f"استيراد main: {summary['import_s']:.2f} ثانية")
+    print(f"\n{'الحزمة':<28} {'تراكمي':>10}")
+    for name, micros in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"{name:<28} {micros / 1000:>8.0f}ms")
+    loaded = summary["loaded"]
+    print(f"\nمكتبات ثقيلة مستوردة عند الاستيراد: {', '.join(loaded) if loaded else 'لا شيء ✅'}")
+    return summary
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_once(env, data_dir: str, timeout: float):
+    import httpx
+
+    port = free_port()
+    command = [
+        sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+    ]
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=data_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    live = ready = None
+    result = {}
+    try:
+        with httpx.Client(timeout=2) as client:
+            while time.perf_counter() - start < timeout and process.poll() is None:
+                endpoint = "/health" if live is None else "/ready"
+                try:
+                    response = client.get(base + endpoint)
+                except httpx.TransportError:
+                    time.sleep(0.01)
+                    continue
+                if live is None:
+                    live = time.perf_counter() - start
+                    continue
+                if response.status_code == 200:
+                    ready = time.perf_counter() - start
+                    break
+                if response.json().get("phase") == "failed":
+                    print(f"❌ فشلت التهيئة: {response.json().get('error')}")
+                    break
+                time.sleep(0.02)
+            try:
+                result = client.get(base + "/status").json().get("startup", {})
+            except httpx.TransportError:
+                pass
+    finally:
+        process.terminate()
+        try:
+            _, stderr = process.communicate(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            _, stderr = process.communicate()
+    if live is None:
+        print(f"❌ لم يبدأ الخادم:\n{(stderr or '')[-2000:]}")
+    return live, ready, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس زمن استيراد main وبدء الخادم وجاهزيته")
+    parser.add_argument("--data-dir", default=BACKEND_DIR, help="المجلد الذي يحتوي medical_db (مجلد تشغيل الخادم)")
+    parser.add_argument("--runs", type=int, default=1, help="عدد مرات تشغيل الخادم")
+    parser.add_argument("--top", type=int, default=12, help="عدد الحزم المعروضة في ملف الاستيراد")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--skip-serve", action="store_true", help="ملف الاستيراد فقط")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("OPENROUTER_API_KEY", "benchmark-key")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")]))
+
+    import_profile(env, args.top)
+    if args.skip_serve:
+        return
+
+    print(f"\n{'التشغيل':<8} {'/health':>9} {'/ready':>9} {'النموذج':>9} {'الفهرس':>9} {'التمهيد':>9}")
+    for run in range(1, args.runs + 1):
+        live, ready, profile = serve_once(env, os.path.abspath(args.data_dir), args.timeout)
+        if live is None:
+            return
+
+        def seconds(value):
+            return f"{value:>8.2f}s" if value is not None else f"{'-':>9}"
+
+        print(
+            f"{run:<8} {seconds(live)} {seconds(ready)} {seconds(profile.get('model_s'))} "
+            f"{seconds(profile.get('index_s'))} {seconds(profile.get('warmup_s'))}"
+        )
+
+
+if __name__ == "__main__":
+    main()
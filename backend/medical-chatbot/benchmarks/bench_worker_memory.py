@@ -0,0 +1,193 @@
+"""
+قياس ذاكرة كل عامل عند تشغيل الخادم بعدة عمليات: uvicorn --workers (كل عامل يحمل نسخته)
+مقابل serve.py (تحميل واحد قبل fork وصفحات مشتركة)
+
+الاستخدام (Linux، يحتاج /proc):
+    python benchmarks/bench_worker_memory.py --data-dir /path/to/dir-with-medical_db
+    python benchmarks/bench_worker_memory.py --workers 1 4 8 --modes prefork
+
+لكل وضع وعدد عمال: تشغيل الخادم في المجلد --data-dir، انتظار جاهزية كل العمال، ثم طلبات /chat
+(بخدمة ذكاء اصطناعي وهمية محلية) حتى يلمس كل عامل النموذج والفهرس، ثم قراءة
+/proc/<pid>/smaps_rollup لكل عمليات الخادم:
+    RSS  الذاكرة المقيمة للعملية بما فيها المشترك مع غيرها (تحسب المشترك مرة في كل عملية)
+    PSS  نصيب العملية: الصفحات المشتركة مقسومة على عدد من يشاركها، ومجموعها هو الاستهلاك الفعلي
+    USS  الصفحات الخاصة بالعملية وحدها
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bench_concurrent_chat import start_stub_server
+
+MODES = ("uvicorn", "prefork")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_command(mode: str, workers: int, port: int):
+    if mode == "uvicorn":
+        return [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR, "--host", "127.0.0.1",
+                "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    return [sys.executable, os.path.join(BACKEND_DIR, "serve.py"), "--host", "127.0.0.1",
+            "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+
+
+def descendants(root: int):
+    """root وكل العمليات المتفرعة منه"""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # الحقل الرابع بعد اسم العملية (بين قوسين وقد يحتوي مسافات)
+                    parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+    found, frontier = [root], [root]
+    while frontier:
+        frontier = [pid for pid, parent in parents.items() if parent in frontier]
+        found.extend(frontier)
+    return found
+
+
+def memory(pid: int):
+    """RSS و PSS و USS بالميجابايت من smaps_rollup"""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1]) / 1024
+    return {
+        "rss": fields.get("Rss", 0.0),
+        "pss": fields.get("Pss", 0.0),
+        "uss": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+    }
+
+
+async def wait_ready(base: str, workers: int, process, timeout: float) -> bool:
+    """كل طلب يصل لعامل ما، فننتظر عدداً متتالياً من 200 يتجاوز عدد العمال بوضوح"""
+    import httpx
+
+    deadline = time.perf_counter() + timeout
+    streak = 0
+    async with httpx.AsyncClient(timeout=5) as client:
+        while time.perf_counter() < deadline and process.poll() is None:
+            try:
+                response = await client.get(base + "/ready")
+                streak = streak + 1 if response.status_code == 200 else 0
+            except httpx.TransportError:
+                streak = 0
+            if streak >= workers * 8:
+                return True
+            await asyncio.sleep(0.05 if streak else 0.2)
+    return False
+
+
+async def exercise(base: str, requests: int, concurrency: int):
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    topics = ["diabetes", "asthma", "migraine", "anemia", "gout", "influenza", "hepatitis", "arthritis"]
+
+    async with httpx.AsyncClient(timeout=60) as client:
+        async def one(i):
+            async with semaphore:
+                response = await client.post(base + "/chat", json={"question": f"symptoms of {topics[i % len(topics)]} {i}"})
+                return response.status_code
+
+        return await asyncio.gather(*[one(i) for i in range(requests)])
+
+
+def measure(mode: str, workers: int, args, env):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(server_command(mode, workers, port), cwd=args.data_dir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        start = time.perf_counter()
+        if not asyncio.run(wait_ready(base, workers, process, args.timeout)):
+            print(f"❌ {mode} ({workers} عامل) لم يصبح جاهزاً")
+            return None
+        ready_time = time.perf_counter() - start
+        statuses = asyncio.run(exercise(base, args.requests * workers, args.concurrency))
+        time.sleep(0.5)
+
+        pids = descendants(process.pid)
+        usage = {}
+        for pid in pids:
+            try:
+                usage[pid] = memory(pid)
+            except OSError:
+                continue
+        # العمال = العمليات التي تخدم الطلبات (الأكبر ذاكرة)، والباقي عمليات إشراف
+        worker_pids = sorted(usage, key=lambda pid: -usage[pid]["rss"])[:workers]
+        total_pss = sum(item["pss"] for item in usage.values())
+        return {
+            "ready_s": ready_time,
+            "ok": sum(1 for status in statuses if status == 200),
+            "requests": len(statuses),
+            "processes": len(usage),
+            "rss": sum(usage[pid]["rss"] for pid in worker_pids) / len(worker_pids),
+            "pss": sum(usage[pid]["pss"] for pid in worker_pids) / len(worker_pids),
+            "uss": sum(usage[pid]["uss"] for pid in worker_pids) / len(worker_pids),
+            "total_pss": total_pss,
+        }
+    finally:
+        process.terminate()
+        try:
+            _, stderr = process.communicate(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            _, stderr = process.communicate()
+        if process.returncode not in (0, -15) and stderr:
+            print(stderr[-1500:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس ذاكرة كل عامل: uvicorn --workers مقابل serve.py")
+    parser.add_argument("--data-dir", default=BACKEND_DIR, help="المجلد الذي يحتوي medical_db (مجلد تشغيل الخادم)")
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 4, 8])
+    parser.add_argument("--modes", nargs="*", default=list(MODES), choices=MODES)
+    parser.add_argument("--requests", type=int, default=16, help="طلبات /chat لكل عامل قبل القياس")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+    args.data_dir = os.path.abspath(args.data_dir)
+
+    stub = start_stub_server(0.01)
+    env = dict(os.environ)
+    env.update({
+        "OPENROUTER_URL": f"http://127.0.0.1:{stub.server_port}/api/v1/chat/completions",
+        "OPENROUTER_API_KEY": env.get("OPENROUTER_API_KEY", "benchmark-key"),
+        "ANSWER_CACHE_SIZE": "0",
+        "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")])),
+    })
+
+    print(f"المعالج: {os.cpu_count()} نواة - الطلبات لكل عامل: {args.requests}")
+    print(f"\n{'الوضع':<9} {'العمال':>6} {'الجاهزية':>9} {'RSS/عامل':>10} {'PSS/عامل':>10} {'USS/عامل':>10} {'مجموع PSS':>10} {'نجاح':>8}")
+    for mode in args.modes:
+        for workers in args.workers:
+            result = measure(mode, workers, args, env)
+            if result is None:
+                continue
+            print(
+                f"{mode:<9} {workers:>6} {result['ready_s']:>8.1f}s {result['rss']:>8.0f}MB {result['pss']:>8.0f}MB "
+                f"{result['uss']:>8.0f}MB {result['total_pss']:>8.0f}MB {result['ok']:>4}/{result['requests']}"
+            )
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
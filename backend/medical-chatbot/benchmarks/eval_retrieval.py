@@ -0,0 +1,137 @@
+"""
+تقييم الاسترجاع دون اتصال: recall و MRR وزمن الاستعلام لأوضاع vector و keyword و hybrid
+
+الاستخدام:
+    python benchmarks/eval_retrieval.py --queries 200 --k 5
+    python benchmarks/eval_retrieval.py --queries-file eval_queries.jsonl
+
+بدون --queries-file تُولد استعلامات "معروفة الهدف" من medical_db نفسها:
+    terms     أندر 2-3 كلمات في جزء عشوائي (يحاكي أسماء الأدوية والمصطلحات النادرة)
+    sentence  جملة من الجزء كما هي (يحاكي سؤالاً بلغة طبيعية)
+والإجابة الصحيحة هي ذلك الجزء (وأي جزء مطابق له حرفياً).
+
+صيغة --queries-file: سطر JSON لكل استعلام {"query": "...", "relevant": [أرقام الأجزاء]}
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from embeddings import EmbeddingManager
+from keyword_index import tokenize
+
+MODES = ("vector", "keyword", "hybrid")
+
+
+def load_manager() -> EmbeddingManager:
+    # بدون ذاكرة مؤقتة للاستعلامات حتى يُقاس زمن الترميز في كل استعلام
+    manager = EmbeddingManager(query_cache_size=0)
+    manager.load(os.path.join(BASE_DIR, "medical_db"))
+    manager._ensure_keyword_index()
+    return manager
+
+
+def known_item_queries(manager: EmbeddingManager, n_queries: int, seed: int = 0):
+    """توليد استعلامات من أجزاء عشوائية مع رقم الجزء المطلوب"""
+    rng = np.random.default_rng(seed)
+    keyword_index = manager.keyword_index
+    df = np.diff(keyword_index.indptr)
+
+    by_text = {}
+    for i, text in enumerate(manager.documents):
+        by_text.setdefault(text, []).append(i)
+
+    queries = []
+    attempts = 0
+    while len(queries) < n_queries and attempts < n_queries * 20:
+        attempts += 1
+        doc_id = int(rng.integers(0, len(manager.documents)))
+        text = manager.documents[doc_id]
+        relevant = by_text[text]
+
+        if len(queries) % 2 == 0:
+            words = {token for token in tokenize(text) if len(token) >= 5 and token.isalpha()}
+            if len(words) < 3:
+                continue
+            rare = sorted(words, key=lambda token: df[keyword_index.vocab[token]])[:int(rng.integers(2, 4))]
+            queries.append({"query": " ".join(rare), "relevant": relevant, "kind": "terms"})
+        else:
+            sentences = [
+                sentence.strip() for sentence in re.split(r'(?<=[.!?؟])\s+', text.replace("\n", " "))
+                if 40 <= len(sentence.strip()) <= 200
+            ]
+            if not sentences:
+                continue
+            sentence = sentences[int(rng.integers(0, len(sentences)))]
+            queries.append({"query": sentence, "relevant": relevant, "kind": "sentence"})
+    return queries
+
+
+def run_mode(manager: EmbeddingManager, mode: str, queries, k: int):
+    """تشغيل كل استعلام منفرداً (كما في الخدمة) وإرجاع ترتيب الإجابة الصحيحة والزمن"""
+    ranks, latencies = [], []
+    for item in queries:
+        start = time.perf_counter()
+        if mode == "keyword":
+            results = manager.keyword_search_batch([item["query"]], k, with_text=False)[0]
+        else:
+            results = manager.hybrid_search_batch([item["query"]], k, mode=mode, with_text=False)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        relevant = set(item["relevant"])
+        rank = next((r for r, doc in enumerate(results, start=1) if doc["index"] in relevant), None)
+        ranks.append(rank)
+    return ranks, np.array(latencies)
+
+
+def summarize(ranks, latencies, k: int):
+    found = [r for r in ranks if r is not None]
+    return {
+        "recall@1": sum(1 for r in found if r == 1) / len(ranks),
+        f"recall@{k}": len(found) / len(ranks),
+        "mrr": sum(1.0 / r for r in found) / len(ranks),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="تقييم الاسترجاع لأوضاع vector و keyword و hybrid")
+    parser.add_argument("--queries", type=int, default=200, help="عدد الاستعلامات المولدة")
+    parser.add_argument("--queries-file", default=None, help="ملف JSONL باستعلامات وإجاباتها")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    manager = load_manager()
+    if args.queries_file:
+        with open(args.queries_file, 'r', encoding='utf-8') as f:
+            queries = [dict(json.loads(line), kind="file") for line in f if line.strip()]
+    else:
+        queries = known_item_queries(manager, args.queries, args.seed)
+    kinds = sorted({item["kind"] for item in queries})
+    print(f"المستندات: {len(manager.documents)} - الاستعلامات: {len(queries)} - k={args.k}\n")
+
+    # تمهيد (تحميل النموذج وذاكرة numpy) قبل القياس
+    for mode in MODES:
+        run_mode(manager, mode, queries[:3], args.k)
+
+    print(f"{'الوضع':<8} {'النوع':<9} {'recall@1':>9} {f'recall@{args.k}':>9} {'MRR':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode in MODES:
+        ranks, latencies = run_mode(manager, mode, queries, args.k)
+        for kind in kinds + (["all"] if len(kinds) > 1 else []):
+            picks = [i for i, item in enumerate(queries) if kind == "all" or item["kind"] == kind]
+            stats = summarize([ranks[i] for i in picks], latencies[picks], args.k)
+            print(f"{mode:<8} {kind:<9} {stats['recall@1']:>9.3f} {stats[f'recall@{args.k}']:>9.3f} "
+                  f"{stats['mrr']:>7.3f} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+ترميز كميات كبيرة من الأجزاء عند بناء الفهرس
+
+- ترتيب الأجزاء حسب الطول حتى تتقارب أطوال كل دفعة ويقل الحشو
+- حجم الدفعة يتكيف مع طول أجزائها: عدد رموز ثابت تقريباً لكل دفعة (BULK_ENCODE_TOKENS)
+- توزيع الدفعات على عدة عمليات (BULK_ENCODE_WORKERS)، كل عملية تحمل نسختها من النموذج
+- كتابة النتائج مباشرة في مصفوفة float32 محجوزة مسبقاً بترتيب الأجزاء الأصلي
+
+الإعدادات:
+    BULK_ENCODE_WORKERS   عدد عمليات الترميز (1 = داخل العملية الحالية بنموذجها المحمل)
+    BULK_ENCODE_TOKENS    عدد الرموز التقريبي لكل دفعة (8192)
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+import numpy as np
+
+from context_builder import estimate_tokens
+
+MIN_BATCH = 8
+MAX_BATCH = 256
+
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int):
+    """تحميل النموذج مرة واحدة في كل عملية، مع تقسيم أنوية المعالج بين العمليات"""
+    global _worker_model
+    os.environ["ENCODER_THREADS"] = str(threads)
+    from encoder_backends import load_encoder, encoder_name
+    _worker_model = load_encoder(model_name)
+    if encoder_name(_worker_model) == "torch":
+        import torch
+        torch.set_num_threads(threads)
+
+
+def _ready(delay: float) -> bool:
+    # يبقي العملية مشغولة قليلاً حتى تُوزع مهام التحضير على كل العمليات
+    time.sleep(delay)
+    return _worker_model is not None
+
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    return _encode_with(_worker_model, texts)
+
+
+def _encode_with(model, texts: List[str]) -> np.ndarray:
+    # الدفعة مرتبة ومحددة الحجم مسبقاً، فتُرمز بتمرير واحد
+    return np.asarray(model.encode(texts, batch_size=len(texts), convert_to_numpy=True), dtype=np.float32)
+
+
+def plan_batches(lengths: np.ndarray, token_budget: int, min_batch: int = MIN_BATCH, max_batch: int = MAX_BATCH) -> List[np.ndarray]:
+    """
+    تقسيم الأجزاء (بترتيب تنازلي حسب الطول) إلى دفعات بحجم token_budget رمزاً تقريباً
+    أطول جزء في الدفعة يحدد طولها بعد الحشو، لذا الدفعات الطويلة أصغر عدداً
+    """
+    order = np.argsort(-lengths, kind="stable")
+    batches, start = [], 0
+    while start < len(order):
+        longest = max(1, int(lengths[order[start]]))
+        size = min(max_batch, max(min_batch, token_budget // longest))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+
+class BulkEncoder:
+    def __init__(self, model, model_name: str, workers: int = None, token_budget: int = None):
+        """
+        model: النموذج المحمل في العملية الحالية (يستخدم عندما workers=1)
+        model_name: اسم النموذج الذي تحمله عمليات الترميز
+        """
+        self.model = model
+        self.model_name = model_name
+        self.workers = workers or int(os.getenv("BULK_ENCODE_WORKERS", "1"))
+        self.token_budget = token_budget or int(os.getenv("BULK_ENCODE_TOKENS", "8192"))
+        self.max_seq_length = getattr(model, "max_seq_length", None) or 512
+        self._pool = None
+        self.totals = {"chunks": 0, "seconds": 0.0}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # العمليات تبقى بين الدفعات (ingest يرمز كل checkpoint على حدة) حتى لا يعاد تحميل النموذج
+        if self._pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, threads),
+            )
+        return self._pool
+
+    def warm_up(self):
+        """تشغيل كل العمليات وتحميل النموذج فيها قبل أول ترميز"""
+        if self.workers > 1:
+            pool = self._get_pool()
+            for future in [pool.submit(_ready, 0.5) for _ in range(self.workers)]:
+                future.result()
+
+    def _lengths(self, texts: List[str]) -> np.ndarray:
+        # تقدير تقريبي يكفي للترتيب، والنموذج يقص ما يتجاوز max_seq_length
+        return np.array([min(estimate_tokens(text) + 2, self.max_seq_length) for text in texts], dtype=np.int64)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """ترميز texts وإرجاع مصفوفة float32 بنفس ترتيبها"""
+        start = time.perf_counter()
+        dimension = self.model.get_sentence_embedding_dimension()
+        embeddings = np.empty((len(texts), dimension), dtype=np.float32)
+        if not texts:
+            return embeddings
+
+        lengths = self._lengths(texts)
+        batches = plan_batches(lengths, self.token_budget)
+        done, last_report = 0, start
+
+        def store(rows, encoded):
+            nonlocal done, last_report
+            embeddings[rows] = encoded
+            done += len(rows)
+            now = time.perf_counter()
+            if now - last_report >= 5:
+                print(f"تم ترميز {done}/{len(texts)} جزء ({done / (now - start):.1f} جزء/ثانية)")
+                last_report = now
+
+        if self.workers <= 1:
+            for rows in batches:
+                store(rows, _encode_with(self.model, [texts[i] for i in rows]))
+        else:
+            pool = self._get_pool()
+            futures = {pool.submit(_encode_batch, [texts[i] for i in rows]): rows for rows in batches}
+            for future in as_completed(futures):
+                store(futures[future], future.result())
+
+        elapsed = time.perf_counter() - start
+        self.totals["chunks"] += len(texts)
+        self.totals["seconds"] += elapsed
+        # نسبة الرموز الفعلية إلى الرموز بعد الحشو (1.0 = بلا حشو)
+        padded = sum(len(rows) * int(lengths[rows].max()) for rows in batches)
+        print(
+            f"⚡ تم ترميز {len(texts)} جزء في {elapsed:.2f} ثانية ({len(texts) / elapsed:.1f} جزء/ثانية) - "
+            f"{len(batches)} دفعة، {self.workers} عملية، كفاءة الحشو {lengths.sum() / padded:.2f}"
+        )
+        return embeddings
+
+    def stats(self) -> Dict:
+        seconds = self.totals["seconds"]
+        return {
+            "workers": self.workers,
+            "token_budget": self.token_budget,
+            "chunks": self.totals["chunks"],
+            "seconds": round(seconds, 2),
+            "chunks_per_sec": round(self.totals["chunks"] / seconds, 1) if seconds else 0.0,
+        }
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,124 @@
+import re
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Iterator, List
+
+# نقسم بعد نهاية الجملة أو نهاية السطر مع الإبقاء على الفاصل في الجزء السابق
+_SEGMENT_BOUNDARY = re.compile(r'(?<=[.!?؟\n])')
+
+
+class StreamingChunker:
+    def __init__(
+        self,
+        chunk_size: int = 500,
+        overlap: int = 50,
+        length_fn: Callable[[str], int] = None,
+    ):
+        """
+        مقسم نصوص يستهلك سجلات الصفحات واحدة تلو الأخرى
+        chunk_size: الحد الأقصى لطول الجزء بوحدة length_fn (أحرف افتراضياً، أو رموز tokens)
+        overlap: طول التداخل بين الجزء والجزء الذي يليه بنفس الوحدة
+        الذاكرة المستخدمة لا تتجاوز نافذة جزء واحد مهما كان حجم الكتاب
+        """
+        if overlap >= chunk_size:
+            raise ValueError("overlap يجب أن يكون أصغر من chunk_size")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.length_fn = length_fn or len
+
+    def _segments(self, pages: Iterable[Dict]) -> Iterator[Dict]:
+        """تقسيم الصفحات إلى جمل/أسطر مع رقم الصفحة والموضع في النص الكامل"""
+        cursor = 0
+        pending = ""
+        pending_start = 0
+        for page_index, record in enumerate(pages):
+            # الصفحات متصلة بسطر جديد في النص الكامل الافتراضي
+            text = "\n" + record["text"] if page_index else record["text"]
+            for piece in _SEGMENT_BOUNDARY.split(text):
+                # المسافات وحدها تلحق بالمقطع التالي حتى لا تلتصق الجمل
+                if not piece.strip():
+                    if not pending:
+                        pending_start = cursor
+                    pending += piece
+                    cursor += len(piece)
+                    continue
+                start = pending_start if pending else cursor
+                for part in self._split_oversized(pending + piece):
+                    yield {
+                        "text": part,
+                        "page": record["page"],
+                        "start": start,
+                        "end": start + len(part),
+                        "length": self.length_fn(part),
+                    }
+                    start += len(part)
+                cursor += len(piece)
+                pending = ""
+
+    def _split_oversized(self, piece: str) -> List[str]:
+        """تقسيم جملة أطول من chunk_size على حدود الكلمات"""
+        if self.length_fn(piece) <= self.chunk_size:
+            return [piece]
+        parts = []
+        current = ""
+        for word in re.split(r'(?<=\s)', piece):
+            if current and self.length_fn(current + word) > self.chunk_size:
+                parts.append(current)
+                current = ""
+            # كلمة واحدة أطول من الحد (نادر): تقطع بالأحرف
+            while self.length_fn(word) > self.chunk_size:
+                cut = max(1, len(word) * self.chunk_size // self.length_fn(word))
+                parts.append(word[:cut])
+                word = word[cut:]
+            current += word
+        if current:
+            parts.append(current)
+        return parts
+
+    def chunks(self, pages: Iterable[Dict], source: str = None) -> Iterator[Dict]:
+        """
+        إنتاج الأجزاء بشكل كسول مع بياناتها الوصفية:
+        chunk_id, page_start, page_end, char_start, char_end (مواضع في النص الكامل للمصدر)
+        """
+        window: Deque[Dict] = deque()
+        window_length = 0
+        fresh = 0  # عدد المقاطع الجديدة في النافذة (غير المنقولة كتداخل)
+        chunk_id = 0
+
+        def emit() -> Dict:
+            text = "".join(segment["text"] for segment in window).strip()
+            return {
+                "chunk_id": chunk_id,
+                "text": text,
+                "source": source,
+                "page_start": window[0]["page"],
+                "page_end": window[-1]["page"],
+                "char_start": window[0]["start"],
+                "char_end": window[-1]["end"],
+            }
+
+        for segment in self._segments(pages):
+            if window and window_length + segment["length"] > self.chunk_size:
+                if fresh:
+                    yield emit()
+                    chunk_id += 1
+                # الإبقاء على آخر المقاطع كتداخل مع الجزء التالي
+                carried = 0
+                keep = 0
+                for previous in reversed(window):
+                    if carried + previous["length"] > self.overlap:
+                        break
+                    carried += previous["length"]
+                    keep += 1
+                while len(window) > keep:
+                    window_length -= window.popleft()["length"]
+                # إذا لم يتسع المقطع الجديد مع التداخل نتخلى عن التداخل
+                while window and window_length + segment["length"] > self.chunk_size:
+                    window_length -= window.popleft()["length"]
+                fresh = 0
+
+            window.append(segment)
+            window_length += segment["length"]
+            fresh += 1
+
+        if window and fresh:
+            yield emit()
@@ -0,0 +1,148 @@
+"""
+تجميع سياق الرسالة من الأجزاء المسترجعة ضمن ميزانية رموز (tokens)
+
+- حذف الأسطر المتكررة في كل صفحة من الموسوعة (ترويسة الصفحة وعلامات الصفحات)
+- حذف الأجزاء شبه المكررة (تشابه Jaccard على مقاطع من الكلمات المتتالية)
+- إضافة الأجزاء بترتيب أهميتها حتى امتلاء الميزانية، مع قص آخر جزء إذا بقي متسع كافٍ
+
+عدّ الرموز يستخدم tiktoken إن كان مثبتاً (نفس ترميز نماذج OpenAI)، وإلا تقديراً
+تقريبياً من طول الكلمات يكفي لضبط الميزانية.
+"""
+import math
+import os
+import re
+from typing import Dict, List, Tuple
+
+# أسطر لا تحمل معلومة: علامات الصفحات وترويسة/تذييل صفحات الموسوعة
+BOILERPLATE_PATTERNS = [
+    r'^---\s*صفحة\s+\d+\s*---$',
+    r'^(\d+\s+)?GALE ENCYCLOPEDIA OF MEDICINE \d+(\s+\d+)?$',
+    r'^GEM - \d+ to \d+ - [A-Z] \d+/\d+/\d+ .* Page \d+$',
+]
+
+_PIECE = re.compile(r'[^\W\d_]+|\d+|[^\w\s]')
+_WORD = re.compile(r'\w+')
+
+
+def _load_tiktoken():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # غير مثبت، أو لا يمكن تنزيل ملف الترميز بدون اتصال
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """تقدير عدد الرموز: الكلمات اللاتينية ~4 أحرف للرمز، العربية ~2، الأرقام ~3، وكل علامة رمز"""
+    count = 0
+    for piece in _PIECE.findall(text):
+        if piece.isdigit():
+            count += math.ceil(len(piece) / 3)
+        elif piece.isascii():
+            count += math.ceil(len(piece) / 4)
+        elif piece.isalpha():
+            count += math.ceil(len(piece) / 2)
+        else:
+            count += 1
+    return count
+
+
+class ContextBuilder:
+    def __init__(self, dedup_threshold: float = None, shingle_size: int = 3, min_tail_tokens: int = 40):
+        """
+        dedup_threshold: حد تشابه Jaccard لاعتبار جزأين مكررين (CONTEXT_DEDUP_THRESHOLD)
+        shingle_size: عدد الكلمات في كل مقطع عند حساب التشابه
+        min_tail_tokens: أقل متسع متبقٍ يستحق قص جزء إضافي بدلاً من التوقف
+        """
+        if dedup_threshold is None:
+            dedup_threshold = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.7"))
+        self.dedup_threshold = dedup_threshold
+        self.shingle_size = shingle_size
+        self.min_tail_tokens = min_tail_tokens
+        self.boilerplate = re.compile("|".join(BOILERPLATE_PATTERNS), re.MULTILINE)
+        self.encoding = _load_tiktoken()
+
+    @property
+    def tokenizer_name(self) -> str:
+        return "tiktoken:cl100k_base" if self.encoding is not None else "estimate"
+
+    def count_tokens(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return estimate_tokens(text)
+
+    def clean(self, text: str) -> str:
+        """حذف أسطر الترويسة المتكررة والأسطر الفارغة الزائدة"""
+        text = self.boilerplate.sub('', text)
+        return re.sub(r'\n\s*\n+', '\n', text).strip()
+
+    def _shingles(self, text: str) -> set:
+        words = [word.lower() for word in _WORD.findall(text)]
+        if len(words) <= self.shingle_size:
+            return {tuple(words)} if words else set()
+        return {tuple(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    @staticmethod
+    def _jaccard(a: set, b: set) -> float:
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """قص النص إلى max_tokens على حدود الكلمات (بحث ثنائي على عدد الكلمات)"""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        boundaries = [match.end() for match in re.finditer(r'\S+', text)]
+        low, high = 0, len(boundaries)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(text[:boundaries[middle - 1]]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:boundaries[low - 1]] if low else ""
+
+    def build(self, docs: List[Dict], budget: int, max_doc_tokens: int = None) -> Tuple[List[Dict], Dict]:
+        """
+        اختيار الأجزاء بترتيبها (الأهم أولاً) ضمن budget رمز
+        كل جزء مختار يحمل context_text (النص بعد التنظيف والقص) و context_tokens و context_truncated
+        max_doc_tokens: حد أقصى لكل جزء (لتوزيع الميزانية على عدة مصادر)، ولا يقل عن
+        min_tail_tokens حتى لا تُحذف كل المصادر عندما يكون عددها كبيراً؛ عندها تأخذ الأولى
+        min_tail_tokens لكل منها حتى تنفد الميزانية
+        """
+        if max_doc_tokens:
+            max_doc_tokens = max(max_doc_tokens, self.min_tail_tokens)
+        selected, selected_shingles = [], []
+        used = 0
+        info = {"budget": budget, "tokens": 0, "duplicates": 0, "dropped": 0, "truncated": 0}
+
+        for doc in docs:
+            text = self.clean(doc["text"])
+            if not text:
+                info["dropped"] += 1
+                continue
+
+            shingles = self._shingles(text)
+            if any(self._jaccard(shingles, seen) >= self.dedup_threshold for seen in selected_shingles):
+                info["duplicates"] += 1
+                continue
+
+            remaining = budget - used
+            limit = min(remaining, max_doc_tokens) if max_doc_tokens else remaining
+            tokens = self.count_tokens(text)
+            truncated = tokens > limit
+            if truncated:
+                if limit < self.min_tail_tokens:
+                    info["dropped"] += 1
+                    continue
+                text = self.truncate(text, limit)
+                tokens = self.count_tokens(text)
+                info["truncated"] += 1
+
+            selected.append(dict(doc, context_text=text, context_tokens=tokens, context_truncated=truncated))
+            selected_shingles.append(shingles)
+            used += tokens
+
+        info["tokens"] = used
+        return selected, info
@@ -0,0 +1,262 @@
+"""
+مخزن مستندات مضغوط بصيغة أعمدة بدلاً من قائمة نصوص محفوظة بـ pickle
+
+الملفات (لقاعدة بيانات باسم medical_db):
+    medical_db_docs.bin          كل النصوص متتالية بترميز UTF-8
+    medical_db_docs.offsets.npy  مواضع بداية كل نص (n+1 عنصر، int64)
+    medical_db_docs.<عمود>.npy   أعمدة البيانات الوصفية (أرقام، أو رموز لفئات نصية)
+    medical_db_docs.json         وصف الأعمدة وعدد المستندات
+
+التحميل يربط الملفات بالذاكرة (mmap) فيتم في أجزاء من الثانية، والوصول لأي مستند O(1).
+
+تحويل قاعدة بيانات قديمة:
+    python doc_store.py medical_db
+"""
+import json
+import mmap
+import os
+import pickle
+import sys
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def store_exists(filename: str) -> bool:
+    return os.path.exists(f"{filename}_docs.json")
+
+
+class DocumentStore:
+    def __init__(self, blob, offsets: np.ndarray, columns: Dict[str, np.ndarray] = None,
+                 categories: Dict[str, List[str]] = None):
+        """
+        blob: كل النصوص بترميز UTF-8 (bytes أو mmap)
+        offsets: مصفوفة n+1 بمواضع البداية، النص i هو blob[offsets[i]:offsets[i+1]]
+        columns: أعمدة البيانات الوصفية، كل عمود مصفوفة بطول n
+        categories: قيم الأعمدة النصية (العمود يحفظ رقم الفئة، و -1 للقيمة الفارغة)
+        """
+        self._blob = blob
+        self._view = memoryview(blob) if len(blob) else memoryview(b"")
+        self.offsets = offsets
+        self.columns = columns or {}
+        self.categories = categories or {}
+
+    # ---------------- البناء ----------------
+
+    @classmethod
+    def build(cls, texts: List[str], metadata: List[Dict] = None) -> "DocumentStore":
+        """بناء مخزن في الذاكرة من قائمة نصوص وبياناتها الوصفية"""
+        encoded = [text.encode('utf-8') for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype='int64')
+        if encoded:
+            np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        blob = b"".join(encoded)
+
+        columns, categories = {}, {}
+        if metadata:
+            if len(metadata) != len(texts):
+                raise ValueError("عدد عناصر البيانات الوصفية لا يطابق عدد النصوص")
+            keys = sorted({key for item in metadata for key in item})
+            for key in keys:
+                values = [item.get(key) for item in metadata]
+                if all(isinstance(value, int) or value is None for value in values):
+                    columns[key] = np.array([-1 if value is None else value for value in values], dtype='int64')
+                else:
+                    names = sorted({str(value) for value in values if value is not None})
+                    lookup = {name: code for code, name in enumerate(names)}
+                    columns[key] = np.array(
+                        [-1 if value is None else lookup[str(value)] for value in values], dtype='int32'
+                    )
+                    categories[key] = names
+
+        return cls(blob, offsets, columns, categories)
+
+    def extended(self, texts: List[str], metadata: List[Dict] = None) -> "DocumentStore":
+        """إرجاع مخزن جديد يضم المستندات الحالية والمستندات الإضافية"""
+        addition = DocumentStore.build(texts, metadata)
+        blob = bytes(self._view) + bytes(addition._view)
+        offsets = np.concatenate([self.offsets, addition.offsets[1:] + self.offsets[-1]])
+
+        # كل عمود في أي من الطرفين يبقى، والطرف الذي لا يملكه يُكمل بالقيمة الفارغة (-1)
+        # حتى تبقى كل الأعمدة بطول n ومحاذية للنصوص
+        columns, categories = {}, {}
+        for key in sorted(self.columns.keys() | addition.columns.keys()):
+            if key in self.categories or key in addition.categories:
+                old_names, old = self._category_column(key)
+                new_names, new = addition._category_column(key)
+                names = sorted(set(old_names) | set(new_names))
+                lookup = {name: code for code, name in enumerate(names)}
+                remap_old = np.array([lookup[name] for name in old_names] + [-1], dtype='int32')
+                remap_new = np.array([lookup[name] for name in new_names] + [-1], dtype='int32')
+                # الفهرس -1 يشير إلى آخر عنصر في مصفوفة التحويل وهو -1
+                columns[key] = np.concatenate([remap_old[old], remap_new[new]])
+                categories[key] = names
+            else:
+                columns[key] = np.concatenate([self._int_column(key), addition._int_column(key)])
+
+        return DocumentStore(blob, offsets, columns, categories)
+
+    def _int_column(self, key: str) -> np.ndarray:
+        """العمود الرقمي، أو عمود فارغ (-1) إذا لم يكن موجوداً"""
+        if key in self.columns:
+            return np.asarray(self.columns[key], dtype='int64')
+        return np.full(len(self), -1, dtype='int64')
+
+    def _category_column(self, key: str):
+        """(أسماء الفئات، رموزها) للعمود، مع تحويل العمود الرقمي إلى فئات نصية عند الحاجة"""
+        if key in self.categories:
+            return self.categories[key], np.asarray(self.columns[key])
+        column = self._int_column(key)
+        names = sorted({str(value) for value in column if value != -1})
+        lookup = {name: code for code, name in enumerate(names)}
+        return names, np.array([-1 if value == -1 else lookup[str(value)] for value in column], dtype='int32')
+
+    # ---------------- الحفظ والتحميل ----------------
+
+    def save(self, filename: str):
+        """حفظ المخزن (كل ملف يكتب مؤقتاً ثم يستبدل، وملف الوصف يكتب أخيراً)"""
+        prefix = f"{filename}_docs"
+
+        def replace(path: str, write):
+            with open(f"{path}.tmp", 'wb') as f:
+                write(f)
+            os.replace(f"{path}.tmp", path)
+
+        replace(f"{prefix}.bin", lambda f: f.write(self._view))
+        replace(f"{prefix}.offsets.npy", lambda f: np.save(f, np.asarray(self.offsets, dtype='int64')))
+        for key, column in self.columns.items():
+            replace(f"{prefix}.{key}.npy", lambda f, column=column: np.save(f, np.asarray(column)))
+
+        header = {
+            "format_version": FORMAT_VERSION,
+            "count": len(self),
+            "bytes": int(self.offsets[-1]),
+            "columns": {
+                key: {"dtype": str(column.dtype), "categories": self.categories.get(key)}
+                for key, column in self.columns.items()
+            },
+        }
+        replace(f"{prefix}.json", lambda f: f.write(json.dumps(header, ensure_ascii=False, indent=2).encode('utf-8')))
+
+    @classmethod
+    def load(cls, filename: str, use_mmap: bool = True) -> "DocumentStore":
+        """تحميل المخزن، مع ربط الملفات بالذاكرة للقراءة فقط افتراضياً"""
+        prefix = f"{filename}_docs"
+        with open(f"{prefix}.json", 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        if header.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"إصدار صيغة مخزن المستندات غير مدعوم: {header.get('format_version')}")
+
+        mmap_mode = 'r' if use_mmap else None
+        offsets = np.load(f"{prefix}.offsets.npy", mmap_mode=mmap_mode)
+
+        with open(f"{prefix}.bin", 'rb') as f:
+            if use_mmap and header["bytes"] > 0:
+                blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                blob = f.read()
+
+        columns, categories = {}, {}
+        for key, info in header["columns"].items():
+            columns[key] = np.load(f"{prefix}.{key}.npy", mmap_mode=mmap_mode)
+            if info.get("categories") is not None:
+                categories[key] = info["categories"]
+
+        store = cls(blob, offsets, columns, categories)
+        if len(store) != header["count"] or int(offsets[-1]) != header["bytes"]:
+            raise ValueError(f"ملفات مخزن المستندات {prefix} غير متطابقة")
+        return store
+
+    # ---------------- الوصول ----------------
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _check(self, i: int) -> int:
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(f"رقم المستند {i} خارج النطاق")
+        return i
+
+    def get_bytes(self, i: int) -> memoryview:
+        """نص المستند كـ memoryview على الملف مباشرة (بدون نسخ)"""
+        i = self._check(i)
+        return self._view[int(self.offsets[i]):int(self.offsets[i + 1])]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return str(self.get_bytes(int(i)), 'utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def snippet(self, i: int, max_chars: int) -> str:
+        """أول max_chars حرف من المستند دون فك ترميز النص كاملاً"""
+        data = self.get_bytes(i)
+        # كل حرف UTF-8 لا يتجاوز 4 بايت، والقطع في منتصف حرف يتم تجاهله
+        return str(data[:max_chars * 4], 'utf-8', errors='ignore')[:max_chars]
+
+    def text_length(self, i: int) -> int:
+        """طول المستند بالبايت"""
+        i = self._check(i)
+        return int(self.offsets[i + 1] - self.offsets[i])
+
+    def metadata(self, i: int) -> Optional[Dict]:
+        """البيانات الوصفية للمستند i أو None إذا لم توجد أعمدة"""
+        if not self.columns:
+            return None
+        i = self._check(i)
+        item = {}
+        for key, column in self.columns.items():
+            value = int(column[i])
+            if key in self.categories:
+                item[key] = self.categories[key][value] if value >= 0 else None
+            else:
+                item[key] = value if value >= 0 else None
+        return item
+
+    def has_metadata(self) -> bool:
+        return bool(self.columns)
+
+    def nbytes(self) -> int:
+        return int(self.offsets[-1]) + self.offsets.nbytes + sum(column.nbytes for column in self.columns.values())
+
+
+def load_legacy(filename: str) -> DocumentStore:
+    """قراءة {filename}_docs.pkl و {filename}_meta.json (الصيغة القديمة) إلى مخزن في الذاكرة"""
+    with open(f"{filename}_docs.pkl", 'rb') as f:
+        documents = pickle.load(f)
+
+    metadata = None
+    if os.path.exists(f"{filename}_meta.json"):
+        with open(f"{filename}_meta.json", 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        if len(metadata) != len(documents):
+            print(f"⚠️ تجاهل {filename}_meta.json: عدد العناصر لا يطابق المستندات")
+            metadata = None
+
+    return DocumentStore.build(documents, metadata)
+
+
+def load_documents(filename: str) -> DocumentStore:
+    """تحميل المستندات بالصيغة الجديدة إن وجدت، وإلا من ملف pkl القديم"""
+    if store_exists(filename):
+        return DocumentStore.load(filename)
+    return load_legacy(filename)
+
+
+def migrate(filename: str):
+    """تحويل قاعدة بيانات بالصيغة القديمة إلى صيغة المخزن"""
+    store = load_legacy(filename)
+    store.save(filename)
+    print(f"تم تحويل {len(store)} مستند إلى {filename}_docs.bin ({store.nbytes() / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    migrate(sys.argv[1] if len(sys.argv) > 1 else "medical_db")
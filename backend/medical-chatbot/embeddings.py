@@ -1,79 +1,602 @@
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
-import pickle
 import os
-from typing import List, Dict
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Dict, NamedTuple, Optional
+from query_cache import QueryEmbeddingCache
+from index_factory import build_index, set_search_params, describe_index, read_index, copy_index, enable_reconstruct, reconstruct_all
+from vector_store import save_embeddings, load_embeddings, embeddings_paths, EmbeddingStoreMismatch
+from doc_store import DocumentStore, store_exists, load_documents
+from keyword_index import BM25Index, keyword_index_path, reciprocal_rank_fusion
+from batcher import EncodeBatcher
+from encoder_backends import load_encoder, encoder_name
+from bulk_encoder import BulkEncoder
+
+RETRIEVAL_MODES = ("vector", "keyword", "hybrid")
+
+
+class IndexSnapshot(NamedTuple):
+    """
+    نسخة ثابتة من الفهرس ومستنداته وبياناتها
+    لا تُعدل بعد نشرها: أي تغيير (تحميل، إضافة، إعادة بناء) ينشئ نسخة جديدة تستبدل
+    EmbeddingManager.snapshot بإسناد واحد، فيرى كل بحث فهرساً ومستندات من نفس الإصدار
+    """
+    index: Optional[faiss.Index]
+    documents: DocumentStore
+    embeddings: Optional[np.ndarray] = None
+    embeddings_meta: Optional[Dict] = None
+    keyword_index: Optional[BM25Index] = None
+    version: int = 0
+    source: Optional[str] = None
+    load_time: float = 0.0
+    loaded_at: Optional[float] = None
+
 
 class EmbeddingManager:
-    def __init__(self, model_name: str = 'all-MiniLM-L6-v2'):
+    def __init__(self, model_name: str = 'all-MiniLM-L6-v2', query_cache_size: int = None,
+                 index_type: str = None, index_params: Dict = None, encode_workers: int = None,
+                 lazy: bool = False):
         """
         إدارة التضمينات والبحث
         يمكن استخدام نماذج عربية: 'BAAI/bge-small-ar'
+        query_cache_size: عدد تضمينات الاستعلامات المخزنة مؤقتاً (0 لتعطيل الذاكرة المؤقتة)
+        index_type: نوع فهرس FAISS (flat, ivf_flat, hnsw, ivf_pq) - انظر index_factory
+        RETRIEVAL_MODE: وضع hybrid_search_batch الافتراضي (vector, keyword, hybrid)
+        ENCODER_BACKEND: واجهة تشغيل النموذج (torch, onnx)
+        encode_workers: عدد عمليات ترميز المستندات عند بناء الفهرس (BULK_ENCODE_WORKERS)
+        INDEX_MMAP: ربط الفهرس المحمل بملفه بدل نسخه في ذاكرة العملية (1 افتراضياً، انظر read_index)
+        lazy: تأجيل تحميل النموذج إلى load_model() أو أول استخدام له (لبدء الخادم بسرعة)
         """
-        print(f"جاري تحميل النموذج: {model_name}")
-        self.model = SentenceTransformer(model_name)
-        self.index = None
-        self.documents = []
-        self.embeddings = None
-    
-    def add_documents(self, documents: List[str]):
-        """إضافة المستندات وإنشاء embeddings"""
-        self.documents = documents
-        print(f"جاري إنشاء embeddings لـ {len(documents)} مستند...")
-        
-        # إنشاء embeddings بدفعات لتوفير الذاكرة
-        batch_size = 32
-        all_embeddings = []
-        
-        for i in range(0, len(documents), batch_size):
-            batch = documents[i:i + batch_size]
-            embeddings = self.model.encode(batch, convert_to_numpy=True)
-            all_embeddings.extend(embeddings)
-            
-            if (i + batch_size) % 100 == 0:
-                print(f"تم معالجة {i + batch_size} مستند...")
+        self.model_name = model_name
+        self.encode_workers = encode_workers
+        self._model = None
+        self._bulk_encoder = None
+        self._model_lock = threading.Lock()
+        self.encoder_backend = None
+        self.model_load_time = None
+        # الفهرس والمستندات الحالية (انظر IndexSnapshot)، والقفل يحمي الاستبدال فقط وليس القراءة
+        self.snapshot = IndexSnapshot(index=None, documents=DocumentStore.build([]))
+        self._snapshot_lock = threading.Lock()
+        
+        if query_cache_size is None:
+            query_cache_size = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+        self.query_cache = QueryEmbeddingCache(max_size=query_cache_size, model_name=model_name)
+        
+        self.index_type = index_type or os.getenv("INDEX_TYPE", "flat")
+        self.index_params = index_params if index_params is not None else self._index_params_from_env()
+        self.index_mmap = os.getenv("INDEX_MMAP", "1") == "1"
+        
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "hybrid")
+        if self.retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"RETRIEVAL_MODE غير معروف: {self.retrieval_mode} (المتاح: {', '.join(RETRIEVAL_MODES)})")
+        self.rrf_k = int(os.getenv("RRF_K", "60"))
+        
+        # الترميز والبحث في الواجهة async يعملان على خيوط منفصلة حتى لا يوقفا حلقة الأحداث
+        # (PyTorch و FAISS يحرران الـ GIL أثناء الحساب)
+        self.retrieval_workers = int(os.getenv("RETRIEVAL_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.executor = ThreadPoolExecutor(max_workers=self.retrieval_workers, thread_name_prefix="retrieval")
+        # استعلامات الطلبات المتزامنة تُرمز معاً بتمرير واحد للنموذج
+        self.batcher = EncodeBatcher(self._encode_uncached, self.executor, max_in_flight=self.retrieval_workers)
+        
+        if not lazy:
+            self.load_model()
+    
+    def load_model(self):
+        """تحميل نموذج الترميز مرة واحدة (آمن من عدة خيوط)"""
+        with self._model_lock:
+            if self._model is None:
+                print(f"جاري تحميل النموذج: {self.model_name}")
+                start = time.perf_counter()
+                # PyTorch أو ONNX Runtime حسب ENCODER_BACKEND (انظر encoder_backends)
+                model = load_encoder(self.model_name)
+                self.encoder_backend = encoder_name(model)
+                self._bulk_encoder = BulkEncoder(model, self.model_name, workers=self.encode_workers)
+                self._model = model
+                self.model_load_time = time.perf_counter() - start
+                print(f"✅ تم تحميل النموذج في {self.model_load_time:.2f} ثانية")
+        return self._model
+    
+    @property
+    def model(self):
+        # مع lazy=True يُحمّل النموذج عند أول استخدام إن لم يُستدع load_model() مسبقاً
+        return self._model if self._model is not None else self.load_model()
+    
+    @property
+    def model_loaded(self) -> bool:
+        return self._model is not None
+    
+    @property
+    def bulk_encoder(self) -> BulkEncoder:
+        self.load_model()
+        return self._bulk_encoder
+    
+    def warm_up(self, snapshot: IndexSnapshot = None) -> float:
+        """
+        تمرير تمهيدي للنموذج والفهرس حتى لا يدفع أول طلب ثمن التهيئة الكسولة
+        (تخصيص ذاكرة PyTorch/ONNX Runtime، وقراءة صفحات الفهرس والمستندات)
+        لا يمر عبر الذاكرة المؤقتة للاستعلامات حتى لا يُخزن سؤال التمهيد
+        snapshot: نسخة لم تنشر بعد (مثلاً قبل swap في /reload)، والافتراضي الحالية
+        """
+        start = time.perf_counter()
+        queries = ["What are the symptoms and treatment of diabetes?"]
+        query_embeddings = np.asarray(self.model.encode(queries, convert_to_numpy=True), dtype='float32')
+        snapshot = snapshot or self.snapshot
+        if snapshot.index is not None and snapshot.index.ntotal > 0:
+            self.hybrid_search_batch(queries, k=5, query_embeddings=query_embeddings, snapshot=snapshot)
+        return time.perf_counter() - start
+    
+    # قراءة للنسخة الحالية: من يحتاج عدة حقول متسقة يأخذ self.snapshot مرة واحدة
+    @property
+    def index(self):
+        return self.snapshot.index
+    
+    @property
+    def documents(self) -> DocumentStore:
+        return self.snapshot.documents
+    
+    @property
+    def embeddings(self) -> Optional[np.ndarray]:
+        return self.snapshot.embeddings
+    
+    @property
+    def embeddings_meta(self) -> Optional[Dict]:
+        return self.snapshot.embeddings_meta
+    
+    @property
+    def keyword_index(self) -> Optional[BM25Index]:
+        return self.snapshot.keyword_index
+    
+    def check_model_dimension(self):
+        """التحقق من أن بعد النموذج يطابق الفهرس الحالي (إذا حُمل الفهرس قبل النموذج)"""
+        index = self.snapshot.index
+        dimension = self.model.get_sentence_embedding_dimension()
+        if index is not None and index.d != dimension:
+            raise EmbeddingStoreMismatch(f"بعد الفهرس {index.d} لا يطابق بعد النموذج {dimension}")
+    
+    def swap(self, snapshot: IndexSnapshot) -> IndexSnapshot:
+        """نشر نسخة جديدة برقم إصدار تالٍ، والبحث الجاري يكمل على النسخة التي بدأ بها"""
+        with self._snapshot_lock:
+            snapshot = snapshot._replace(version=self.snapshot.version + 1, loaded_at=time.time())
+            self.snapshot = snapshot
+        return snapshot
+    
+    def _update_snapshot(self, base: IndexSnapshot, **fields):
+        # تحديث حقول مشتقة (فهرس الكلمات، بيانات التضمينات) دون إصدار جديد
+        # إذا استُبدلت النسخة في هذه الأثناء لا يُكتب شيء حتى لا تُخلط إصداران
+        with self._snapshot_lock:
+            if self.snapshot is base:
+                self.snapshot = base._replace(**fields)
+    
+    @staticmethod
+    def _index_params_from_env() -> Dict:
+        """قراءة معاملات الفهرس من متغيرات البيئة (غير المحدد يأخذ القيمة الافتراضية)"""
+        env_params = {
+            "nlist": "INDEX_NLIST",
+            "nprobe": "INDEX_NPROBE",
+            "hnsw_m": "INDEX_HNSW_M",
+            "ef_construction": "INDEX_EF_CONSTRUCTION",
+            "ef_search": "INDEX_EF_SEARCH",
+            "pq_m": "INDEX_PQ_M",
+            "pq_nbits": "INDEX_PQ_NBITS",
+        }
+        return {param: int(os.getenv(var)) for param, var in env_params.items() if os.getenv(var)}
+    
+    def add_documents(self, documents: List[str], metadata: List[Dict] = None, embeddings: np.ndarray = None):
+        """
+        إضافة المستندات وإنشاء embeddings
+        metadata: بيانات وصفية لكل مستند (الصفحة، الموضع...) بنفس ترتيب المستندات
+        embeddings: تضمينات محسوبة مسبقاً بنفس الترتيب (مثلاً من ingest.py) بدلاً من الترميز
+        """
+        start = time.perf_counter()
+        store = DocumentStore.build(list(documents), metadata)
         
-        self.embeddings = np.array(all_embeddings).astype('float32')
+        if embeddings is None:
+            print(f"جاري إنشاء embeddings لـ {len(documents)} مستند...")
+            # دفعات مرتبة حسب الطول تُكتب مباشرة في مصفوفة float32 واحدة (انظر BulkEncoder)
+            embeddings = self.bulk_encoder.encode(list(documents))
         
         # إنشاء FAISS index
-        dimension = self.embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(self.embeddings)
+        index = build_index(embeddings, self.index_type, **self.index_params)
+        self.swap(IndexSnapshot(
+            index=index,
+            documents=store,
+            embeddings=embeddings,
+            keyword_index=BM25Index.build(store),
+            load_time=time.perf_counter() - start,
+        ))
+        
+        print(f"تم إنشاء index بـ {index.ntotal} عنصر")
+    
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """ترميز الاستعلامات مع استخدام الذاكرة المؤقتة، وترميز غير المخزن منها بتمرير واحد"""
+        vectors = [self.query_cache.get(query) for query in queries]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        
+        if missing:
+            encoded = self._encode_uncached([queries[i] for i in missing])
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
         
-        print(f"تم إنشاء index بـ {self.index.ntotal} عنصر")
+        return np.stack(vectors).astype('float32')
+    
+    def _encode_uncached(self, queries: List[str]) -> np.ndarray:
+        """تمرير واحد للنموذج وتخزين النتائج في الذاكرة المؤقتة"""
+        encoded = self.model.encode(queries, convert_to_numpy=True)
+        for query, vector in zip(queries, encoded):
+            self.query_cache.put(query, vector)
+        return encoded
+    
+    async def _run(self, func, *args, **kwargs):
+        """تنفيذ دالة متزامنة على خيوط البحث"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+    
+    async def aencode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        نسخة async من encode_queries
+        المخزن في الذاكرة المؤقتة يعاد فوراً، وغير المخزن يُرمز ضمن دفعة مشتركة مع
+        الطلبات المتزامنة الأخرى على خيط منفصل (انظر EncodeBatcher)
+        """
+        vectors = [self.query_cache.get(query) for query in queries]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        
+        if missing:
+            encoded = await self.batcher.encode([queries[i] for i in missing])
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+        
+        return np.stack(vectors).astype('float32')
+    
+    async def ahybrid_search_batch(self, queries: List[str], k: int = 5, query_embeddings: np.ndarray = None, **kwargs) -> List[List[Dict]]:
+        """نسخة async من hybrid_search_batch: الترميز مجمّع والبحث على خيوط البحث"""
+        if not queries:
+            return []
+        if query_embeddings is None:
+            query_embeddings = await self.aencode_queries(queries)
+        # snapshot=... في kwargs يثبت النسخة التي يبحث فيها الطلب
+        return await self._run(self.hybrid_search_batch, queries, k, query_embeddings=query_embeddings, **kwargs)
+    
+    def close(self):
+        """إيقاف خيوط البحث وعمليات الترميز"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self._bulk_encoder is not None:
+            self._bulk_encoder.close()
     
     def search(self, query: str, k: int = 5) -> List[Dict]:
         """البحث عن أقرب k مستندات"""
-        query_embedding = self.model.encode([query], convert_to_numpy=True)
-        distances, indices = self.index.search(query_embedding.astype('float32'), k)
+        return self.search_batch([query], k)[0]
+    
+    def search_batch(self, queries: List[str], k: int = 5, with_text: bool = True) -> List[List[Dict]]:
+        """
+        البحث عن أقرب k مستندات لعدة استعلامات دفعة واحدة
+        يتم ترميز كل الاستعلامات بتمرير واحد للنموذج وبحث FAISS واحد
+        """
+        if not queries:
+            return []
+        
+        return self.search_vectors(self.encode_queries(queries), k, with_text=with_text)
+    
+    def search_vectors(self, query_embeddings: np.ndarray, k: int = 5, with_text: bool = True,
+                       snapshot: IndexSnapshot = None) -> List[List[Dict]]:
+        """
+        البحث باستخدام تضمينات استعلامات جاهزة (صف لكل استعلام)
+        with_text=False لا يفك ترميز النصوص، ويمكن أخذ مقتطف عبر documents.snippet(index, n)
+        snapshot: النسخة المستخدمة (الافتراضي الحالية)، ومنها يجب قراءة النصوص لاحقاً
+        """
+        snapshot = snapshot or self.snapshot
+        distances, indices = snapshot.index.search(np.ascontiguousarray(query_embeddings, dtype='float32'), k)
+        
+        all_results = []
+        for row in range(len(query_embeddings)):
+            results = []
+            for idx, i in enumerate(indices[row]):
+                # FAISS يعيد -1 عندما يكون عدد المستندات أقل من k
+                if i < 0:
+                    continue
+                results.append(self._result(snapshot, i, float(distances[row][idx]), with_text))
+            all_results.append(results)
+        
+        return all_results
+    
+    def build_keyword_index(self):
+        """بناء فهرس BM25 على كل المستندات الحالية"""
+        snapshot = self.snapshot
+        self._update_snapshot(snapshot, keyword_index=BM25Index.build(snapshot.documents))
+    
+    def _ensure_keyword_index(self, snapshot: IndexSnapshot = None) -> BM25Index:
+        # بعد append_documents يصبح الفهرس قديماً ويعاد بناؤه عند أول استخدام
+        snapshot = snapshot or self.snapshot
+        keyword_index = snapshot.keyword_index
+        if keyword_index is None or len(keyword_index) != len(snapshot.documents):
+            print(f"جاري بناء فهرس الكلمات المفتاحية لـ {len(snapshot.documents)} مستند...")
+            keyword_index = BM25Index.build(snapshot.documents)
+            self._update_snapshot(snapshot, keyword_index=keyword_index)
+        return keyword_index
+    
+    def _result(self, snapshot: IndexSnapshot, i: int, score: float, with_text: bool = True, **extra) -> Dict:
+        result = {
+            "text": snapshot.documents[i] if with_text else None,
+            "score": score,
+            "index": int(i),
+            "metadata": snapshot.documents.metadata(i),
+        }
+        result.update(extra)
+        return result
+    
+    def _vector_distances(self, snapshot: IndexSnapshot, query_embedding: np.ndarray, ids: List[int]) -> List[float]:
+        """مسافة L2 (المربعة، مثل FAISS) بين الاستعلام ومستندات لم يرجعها البحث الدلالي"""
+        if not ids:
+            return []
+        if snapshot.embeddings is not None:
+            vectors = np.asarray(snapshot.embeddings[np.array(ids)], dtype='float32')
+        else:
+            # direct map لفهارس IVF مبني قبل نشر النسخة (enable_reconstruct)، فالقراءة هنا لا تعدل الفهرس
+            vectors = np.stack([snapshot.index.reconstruct(int(i)) for i in ids])
+        return [float(d) for d in ((vectors - query_embedding) ** 2).sum(axis=1)]
+    
+    def keyword_search_batch(self, queries: List[str], k: int = 5, with_text: bool = True,
+                             snapshot: IndexSnapshot = None) -> List[List[Dict]]:
+        """البحث بالكلمات المفتاحية فقط (score فارغة و keyword_score درجة BM25)"""
+        snapshot = snapshot or self.snapshot
+        keyword_index = self._ensure_keyword_index(snapshot)
+        return [
+            [self._result(snapshot, i, None, with_text, keyword_score=bm25, keyword_rank=rank)
+             for rank, (i, bm25) in enumerate(hits, start=1)]
+            for hits in keyword_index.search_batch(queries, k)
+        ]
+    
+    def hybrid_search_batch(
+        self,
+        queries: List[str],
+        k: int = 5,
+        query_embeddings: np.ndarray = None,
+        mode: str = None,
+        candidates: int = None,
+        with_text: bool = True,
+        snapshot: IndexSnapshot = None,
+    ) -> List[List[Dict]]:
+        """
+        بحث يدمج نتائج FAISS ونتائج BM25 بطريقة Reciprocal Rank Fusion
+        query_embeddings: تضمينات الاستعلامات إن كانت محسوبة مسبقاً
+        mode: vector أو keyword أو hybrid (الافتراضي RETRIEVAL_MODE)
+        candidates: عدد المرشحين من كل طريقة قبل الدمج
+        كل نتيجة تحمل score (مسافة L2 كما في search) و vector_rank و keyword_rank
+        (الترتيب في كل قائمة بدءاً من 1، أو None إذا لم يظهر المستند فيها)
+        snapshot: نسخة الفهرس المستخدمة (الافتراضي الحالية عند بدء البحث)
+        """
+        if not queries:
+            return []
+        snapshot = snapshot or self.snapshot
+        mode = mode or self.retrieval_mode
+        if query_embeddings is None:
+            query_embeddings = self.encode_queries(queries)
+        if mode == "vector":
+            return self.search_vectors(query_embeddings, k, with_text=with_text, snapshot=snapshot)
+        
+        candidates = candidates or max(k * 4, 20)
+        keyword_hits = self._ensure_keyword_index(snapshot).search_batch(queries, candidates)
+        if mode == "hybrid":
+            vector_hits = self.search_vectors(query_embeddings, candidates, with_text=False, snapshot=snapshot)
+        else:
+            vector_hits = [[]] * len(queries)
+        
+        all_results = []
+        for query_embedding, keyword_row, vector_row in zip(query_embeddings, keyword_hits, vector_hits):
+            keyword_ids = [i for i, _ in keyword_row]
+            vector_ids = [doc["index"] for doc in vector_row]
+            distances = {doc["index"]: doc["score"] for doc in vector_row}
+            
+            # قائمة الكلمات أولاً حتى يتقدم تطابق الاسم الحرفي عند تساوي الدرجات
+            fused = reciprocal_rank_fusion([keyword_ids, vector_ids], self.rrf_k)[:k]
+            missing = [i for i, _ in fused if i not in distances]
+            distances.update(zip(missing, self._vector_distances(snapshot, query_embedding, missing)))
+            
+            keyword_rank = {i: rank for rank, i in enumerate(keyword_ids, start=1)}
+            vector_rank = {i: rank for rank, i in enumerate(vector_ids, start=1)}
+            all_results.append([
+                self._result(
+                    snapshot, i, distances[i], with_text,
+                    rrf_score=rrf_score,
+                    vector_rank=vector_rank.get(i),
+                    keyword_rank=keyword_rank.get(i),
+                )
+                for i, rrf_score in fused
+            ])
+        
+        return all_results
+    
+    def keyword_info(self) -> Dict:
+        """معلومات وضع البحث وفهرس الكلمات المفتاحية وخيوط البحث"""
+        info = {
+            "mode": self.retrieval_mode,
+            "rrf_k": self.rrf_k,
+            "workers": self.retrieval_workers,
+        }
+        keyword_index = self.snapshot.keyword_index
+        if keyword_index is not None:
+            info.update({"documents": len(keyword_index), "terms": len(keyword_index.terms)})
+        return info
+    
+    def index_info(self) -> Dict:
+        """معلومات الفهرس الحالي"""
+        return describe_index(self.snapshot.index)
+    
+    def snapshot_info(self) -> Dict:
+        """إصدار النسخة الحالية ومصدرها وزمن تحميلها"""
+        snapshot = self.snapshot
+        return {
+            "version": snapshot.version,
+            "source": snapshot.source,
+            "documents": len(snapshot.documents),
+            "load_time_s": round(snapshot.load_time, 3),
+            "loaded_at": snapshot.loaded_at,
+        }
+    
+    def append_documents(self, documents: List[str], metadata: List[Dict] = None, embeddings: np.ndarray = None):
+        """
+        إضافة مستندات جديدة إلى الفهرس الحالي دون إعادة ترميز المستندات السابقة
+        الإضافة على نسخة من فهرس FAISS حتى لا يتغير الفهرس تحت بحث جارٍ على النسخة السابقة،
+        لذا كل استدعاء ينسخ الفهرس والمصفوفة كاملين: الإضافة على دفعات كثيرة تتم مرة واحدة
+        (انظر ingest.py)
+        embeddings: تضمينات محسوبة مسبقاً للمستندات الجديدة بدلاً من الترميز
+        """
+        current = self.snapshot
+        if current.index is None:
+            self.add_documents(list(documents), metadata, embeddings=embeddings)
+            return
         
-        results = []
-        for idx, i in enumerate(indices[0]):
-            results.append({
-                "text": self.documents[i],
-                "score": float(distances[0][idx]),
-                "index": int(i)
-            })
+        start = time.perf_counter()
+        new_embeddings = self.bulk_encoder.encode(list(documents)) if embeddings is None else embeddings
+        index = copy_index(current.index)
+        index.add(new_embeddings)
         
-        return results
+        # قواعد البيانات القديمة بدون ملف تضمينات لا يمكن استكمال مصفوفتها
+        embeddings = None
+        if current.embeddings is not None:
+            embeddings = np.concatenate([current.embeddings, new_embeddings])
+        elif index.ntotal == len(new_embeddings):
+            embeddings = new_embeddings
+        else:
+            # بدون مصفوفة تُقرأ مسافات نتائج الكلمات من الفهرس نفسه (_vector_distances)
+            enable_reconstruct(index)
+        
+        self.swap(IndexSnapshot(
+            index=index,
+            # الأعمدة الناقصة في أي من الطرفين تُكمل بقيمة فارغة (انظر DocumentStore.extended)
+            documents=current.documents.extended(list(documents), metadata),
+            embeddings=embeddings,
+            # فهرس الكلمات يعاد بناؤه مرة واحدة عند الحاجة بدلاً من كل دفعة
+            keyword_index=None,
+            source=current.source,
+            load_time=time.perf_counter() - start,
+        ))
+        
+        print(f"تمت إضافة {len(documents)} مستند - المجموع {index.ntotal}")
+    
+    def rebuild_index(self):
+        """
+        إعادة بناء الفهرس من التضمينات المحفوظة (مثلاً بعد الإضافة لفهرس IVF/HNSW)
+        قواعد البيانات القديمة بدون ملف تضمينات: المتجهات تُسترجع من الفهرس نفسه، إلا إذا
+        كان مضغوطاً (IVF-PQ) فيبقى الفهرس الحالي
+        """
+        current = self.snapshot
+        start = time.perf_counter()
+        embeddings = current.embeddings
+        if embeddings is None:
+            # الفهرس المنشور بدون تضمينات له direct map مسبقاً (انظر append_documents و read_snapshot)
+            embeddings = reconstruct_all(current.index)
+            if embeddings is None:
+                print(
+                    f"⚠️ لا يمكن إعادة بناء فهرس {type(current.index).__name__} بدون ملف تضمينات "
+                    "(متجهاته تقريبية): يبقى الفهرس الحالي، وأعد بناء قاعدة البيانات بالكامل لتدريبه من جديد"
+                )
+                return
+        index = build_index(embeddings, self.index_type, **self.index_params)
+        if current.embeddings is None:
+            # مسافات نتائج الكلمات تُقرأ من الفهرس الجديد أيضاً (_vector_distances)
+            enable_reconstruct(index)
+        self.swap(current._replace(index=index, load_time=time.perf_counter() - start))
     
     def save(self, filename: str = "medical_db"):
         """حفظ الـ index والمستندات"""
+        snapshot = self.snapshot
+        # الكتابة في ملفات مؤقتة ثم الاستبدال حتى لا يبقى ملف تالف عند التوقف المفاجئ
         # حفظ FAISS index
-        faiss.write_index(self.index, f"{filename}.index")
+        faiss.write_index(snapshot.index, f"{filename}.index.tmp")
+        os.replace(f"{filename}.index.tmp", f"{filename}.index")
         
-        # حفظ المستندات
-        with open(f"{filename}_docs.pkl", 'wb') as f:
-            pickle.dump(self.documents, f)
+        # حفظ المستندات وبياناتها الوصفية (الصفحات والمواضع) بصيغة الأعمدة - انظر doc_store
+        snapshot.documents.save(filename)
+        
+        # فهرس الكلمات يحفظ فقط إذا كان مطابقاً للمستندات الحالية
+        if snapshot.keyword_index is not None and len(snapshot.keyword_index) == len(snapshot.documents):
+            snapshot.keyword_index.save(filename)
+        
+        # حفظ مصفوفة التضمينات لإعادة الاستخدام دون إعادة الترميز
+        if snapshot.embeddings is not None:
+            self._update_snapshot(snapshot, embeddings_meta=save_embeddings(filename, snapshot.embeddings, self.model_name))
         
         print(f"تم حفظ قاعدة البيانات في {filename}")
     
-    def load(self, filename: str = "medical_db"):
-        """تحميل الـ index والمستندات المحفوظة"""
-        self.index = faiss.read_index(f"{filename}.index")
+    @staticmethod
+    def db_exists(filename: str = "medical_db") -> bool:
+        """هل توجد قاعدة بيانات محفوظة (بصيغة المخزن الجديدة أو ملف pkl القديم)"""
+        return os.path.exists(f"{filename}.index") and (
+            store_exists(filename) or os.path.exists(f"{filename}_docs.pkl")
+        )
+    
+    def load(self, filename: str = "medical_db") -> IndexSnapshot:
+        """تحميل الـ index والمستندات المحفوظة ونشرها كنسخة جديدة"""
+        snapshot = self.swap(self.read_snapshot(filename))
+        print(f"تم تحميل قاعدة البيانات من {filename} (الإصدار {snapshot.version}، {snapshot.load_time:.2f} ثانية)")
+        return snapshot
+    
+    def read_snapshot(self, filename: str = "medical_db") -> IndexSnapshot:
+        """
+        قراءة الـ index والمستندات المحفوظة في نسخة جديدة دون المساس بالنسخة الحالية
+        يمكن تشغيلها على خيط منفصل أثناء خدمة الطلبات ثم نشر النتيجة عبر swap()
+        """
+        start = time.perf_counter()
+        index = read_index(f"{filename}.index", mmap=self.index_mmap)
+        
+        # معاملات البحث لا تُحفظ دائماً مع الفهرس، لذا تُطبق من الإعدادات الحالية
+        set_search_params(
+            index,
+            nprobe=self.index_params.get("nprobe"),
+            ef_search=self.index_params.get("ef_search")
+        )
+        
+        if not store_exists(filename):
+            print(f"⚠️ {filename}_docs.pkl بالصيغة القديمة، للتحويل: python doc_store.py {filename}")
+        documents = load_documents(filename)
+        
+        if len(documents) != index.ntotal:
+            raise EmbeddingStoreMismatch(
+                f"عدد المستندات {len(documents)} لا يطابق عدد عناصر الفهرس {index.ntotal}"
+            )
+        
+        keyword_index = None
+        if os.path.exists(keyword_index_path(filename)):
+            keyword_index = BM25Index.load(filename)
+            if len(keyword_index) != len(documents):
+                print(f"⚠️ فهرس الكلمات في {keyword_index_path(filename)} قديم، سيعاد بناؤه")
+                keyword_index = None
+        if keyword_index is None and self.retrieval_mode != "vector":
+            print(f"جاري بناء فهرس الكلمات المفتاحية لـ {len(documents)} مستند...")
+            keyword_index = BM25Index.build(documents)
         
-        with open(f"{filename}_docs.pkl", 'rb') as f:
-            self.documents = pickle.load(f)
+        # تحميل التضمينات كمصفوفة مربوطة بالذاكرة مع التحقق من تطابق النموذج
+        # قبل تحميل النموذج (main.preload) يُقارن ببعد الفهرس، وبالنموذج لاحقاً في check_model_dimension
+        dimension = self.model.get_sentence_embedding_dimension() if self.model_loaded else index.d
+        if os.path.exists(embeddings_paths(filename)[1]):
+            embeddings, embeddings_meta = load_embeddings(
+                filename,
+                model_name=self.model_name,
+                dimension=dimension,
+                count=index.ntotal
+            )
+        else:
+            # قواعد بيانات قديمة بدون ملف تضمينات: نتحقق من البعد على الأقل
+            if index.d != dimension:
+                raise EmbeddingStoreMismatch(
+                    f"بعد الفهرس {index.d} لا يطابق بعد النموذج {dimension}"
+                )
+            embeddings = None
+            embeddings_meta = None
+            print(f"⚠️ لا يوجد ملف تضمينات لـ {filename}، إعادة الفهرسة ستتطلب إعادة الترميز")
+            # بدون مصفوفة تُقرأ مسافات نتائج الكلمات من الفهرس نفسه (_vector_distances)
+            enable_reconstruct(index)
         
-        print(f"تم تحميل قاعدة البيانات من {filename}")
\ No newline at end of file
+        return IndexSnapshot(
+            index=index,
+            documents=documents,
+            embeddings=embeddings,
+            embeddings_meta=embeddings_meta,
+            keyword_index=keyword_index,
+            source=filename,
+            load_time=time.perf_counter() - start,
+        )
@@ -0,0 +1,281 @@
+"""
+واجهات تشغيل نموذج الترميز: PyTorch (SentenceTransformer) أو ONNX Runtime مع تكميم int8 اختياري
+
+واجهة ONNX لا تستورد torch عند التشغيل (ذاكرة أقل وتحميل أسرع)، وتنفذ نفس خطوات
+SentenceTransformer بعد المحول: تجميع المتوسط (أو CLS) ثم التطبيع إن كان في النموذج الأصلي.
+
+الإعدادات:
+    ENCODER_BACKEND         torch (افتراضي) أو onnx
+    ENCODER_ONNX_DIR        مجلد النموذج المصدّر (افتراضي models/<اسم النموذج>-onnx)
+    ENCODER_QUANTIZED       1 لاستخدام النسخة المكممة int8
+    ENCODER_MIN_COSINE      أدنى تشابه جيب تمام مقبول مع تضمينات المرجع (0.99)
+    ENCODER_THREADS         عدد خيوط ONNX Runtime لكل عملية ترميز (افتراضي: حسب المعالج)
+
+التصدير مرة واحدة (يحتاج torch)، ويحفظ معه تضمينات مرجعية للتحقق عند كل تحميل:
+    pip install onnxruntime onnx
+    python encoder_backends.py all-MiniLM-L6-v2 --quantize
+"""
+import argparse
+import json
+import os
+from typing import Dict, List, Union
+
+import numpy as np
+
+ENCODER_BACKENDS = ("torch", "onnx")
+
+# جمل التحقق: عربية وإنجليزية كما في الأسئلة ونصوص الموسوعة
+REFERENCE_TEXTS = [
+    "ما هي أعراض مرض السكري؟",
+    "كيف أتعامل مع ارتفاع ضغط الدم؟",
+    "هل يمكن تناول الأسبرين مع الطعام؟",
+    "الصداع النصفي والغثيان",
+    "Diabetes mellitus is a chronic disease characterized by high blood sugar.",
+    "Common side effects of metformin include nausea and diarrhea.",
+    "Asthma is a chronic inflammation of the airways.",
+    "Hypertension increases the risk of stroke and heart attack.",
+    "Take the medication twice daily after meals.",
+    "Symptoms of influenza include fever, cough and muscle aches.",
+]
+
+
+def default_onnx_dir(model_name: str) -> str:
+    return os.path.join("models", f"{os.path.basename(model_name.rstrip('/'))}-onnx")
+
+
+class FastTokenizer:
+    def __init__(self, model_dir: str, max_length: int):
+        """
+        مرمّز tokenizer.json عبر مكتبة tokenizers مباشرة
+        (transformers تستورد torch عند وجوده، وهو ما نريد تجنبه في واجهة ONNX)
+        """
+        from tokenizers import Tokenizer
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        with open(os.path.join(model_dir, "tokenizer_config.json"), encoding="utf-8") as f:
+            pad_token = json.load(f).get("pad_token") or "[PAD]"
+        if isinstance(pad_token, dict):
+            pad_token = pad_token["content"]
+        self._tokenizer.enable_truncation(max_length)
+        self._tokenizer.enable_padding(pad_id=self._tokenizer.token_to_id(pad_token), pad_token=pad_token)
+
+    def tokenize(self, text: str) -> List[str]:
+        """نفس tokenize في transformers (بدون الرموز الخاصة)، يستخدمه ingest لقياس الطول"""
+        return self._tokenizer.encode(text, add_special_tokens=False).tokens
+
+    def __call__(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        encodings = self._tokenizer.encode_batch(texts)
+        return {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+
+
+class OnnxEncoder:
+    def __init__(self, model_dir: str, quantized: bool = False, threads: int = None):
+        """
+        تحميل نموذج مصدّر بـ export_onnx
+        الواجهة مطابقة لما يستخدمه EmbeddingManager من SentenceTransformer:
+        encode و get_sentence_embedding_dimension و tokenizer و max_seq_length
+        """
+        import onnxruntime as ort
+
+        with open(os.path.join(model_dir, "encoder.json"), encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.model_dir = model_dir
+        self.quantized = quantized
+        self.max_seq_length = self.config["max_seq_length"]
+        self.tokenizer = FastTokenizer(model_dir, self.max_seq_length)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = threads or int(os.getenv("ENCODER_THREADS", "0"))
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = "model_int8.onnx" if quantized else "model.onnx"
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+    @property
+    def name(self) -> str:
+        return "onnx-int8" if self.quantized else "onnx"
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dimension"]
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(texts)
+        feed = {name: inputs[name] for name in self.input_names}
+        hidden = self.session.run(None, feed)[0]
+
+        if self.config["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.config["normalize"]:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """ترميز نص أو قائمة نصوص (بقية معاملات SentenceTransformer.encode تُتجاهل)"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # ترتيب حسب الطول حتى تتقارب أطوال كل دفعة ويقل الحشو
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        embeddings = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            embeddings[rows] = self._encode_batch([texts[i] for i in rows])
+        return embeddings[0] if single else embeddings
+
+    def validate(self, min_cosine: float) -> Dict:
+        """مقارنة تضمينات جمل المرجع بتضمينات النموذج الأصلي المحفوظة عند التصدير"""
+        reference = np.load(os.path.join(self.model_dir, "reference.npz"))
+        texts = [str(text) for text in reference["texts"]]
+        cosine = cosine_similarity(self.encode(texts), reference["embeddings"])
+        result = {"min_cosine": round(float(cosine.min()), 5), "mean_cosine": round(float(cosine.mean()), 5)}
+        if result["min_cosine"] < min_cosine:
+            raise ValueError(
+                f"تضمينات {self.name} تختلف عن المرجع: أدنى تشابه {result['min_cosine']} < {min_cosine}"
+            )
+        return result
+
+
+def cosine_similarity(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """تشابه جيب التمام لكل صف من a مع نظيره في b"""
+    a = a / np.clip(np.linalg.norm(a, axis=1, keepdims=True), 1e-12, None)
+    b = b / np.clip(np.linalg.norm(b, axis=1, keepdims=True), 1e-12, None)
+    return (a * b).sum(axis=1)
+
+
+def load_encoder(model_name: str, backend: str = None):
+    """
+    تحميل نموذج الترميز حسب ENCODER_BACKEND
+    إذا تعذر تحميل نسخة ONNX أو لم تجتز التحقق يستخدم نموذج PyTorch الأصلي
+    """
+    backend = backend or os.getenv("ENCODER_BACKEND", "torch")
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"ENCODER_BACKEND غير معروف: {backend} (المتاح: {', '.join(ENCODER_BACKENDS)})")
+
+    if backend == "onnx":
+        model_dir = os.getenv("ENCODER_ONNX_DIR") or default_onnx_dir(model_name)
+        quantized = os.getenv("ENCODER_QUANTIZED", "0") == "1"
+        try:
+            encoder = OnnxEncoder(model_dir, quantized=quantized)
+            check = encoder.validate(float(os.getenv("ENCODER_MIN_COSINE", "0.99")))
+            print(f"✅ نموذج الترميز عبر ONNX Runtime ({encoder.name}) - أدنى تشابه مع المرجع {check['min_cosine']}")
+            return encoder
+        except Exception as e:
+            print(f"⚠️ تعذر استخدام ONNX Runtime ({e})، سيستخدم نموذج PyTorch")
+
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def encoder_name(model) -> str:
+    return model.name if isinstance(model, OnnxEncoder) else "torch"
+
+
+def _pooling_mode(pooling) -> str:
+    # sentence-transformers 6 يحفظ الوضع كنص، والإصدارات الأقدم توفر get_pooling_mode_str
+    mode = getattr(pooling, "pooling_mode", None)
+    return mode if isinstance(mode, str) else pooling.get_pooling_mode_str()
+
+
+def export_onnx(model_name: str, out_dir: str = None, quantize: bool = False, opset: int = 17) -> str:
+    """
+    تصدير محول SentenceTransformer إلى ONNX (مع نسخة int8 بالتكميم الديناميكي)
+    وحفظ المرمّز وإعدادات التجميع وتضمينات مرجعية للتحقق
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    out_dir = out_dir or default_onnx_dir(model_name)
+    os.makedirs(out_dir, exist_ok=True)
+
+    model = SentenceTransformer(model_name, device="cpu")
+    model.eval()
+    transformer = model[0].auto_model
+    tokenizer = model.tokenizer
+    if not tokenizer.is_fast:
+        raise ValueError("التصدير يحتاج مرمّزاً سريعاً (tokenizer.json)")
+    pooling = next((module for module in model if isinstance(module, Pooling)), None)
+    pooling_mode = _pooling_mode(pooling) if pooling is not None else None
+    if pooling_mode not in ("mean", "cls"):
+        raise ValueError("التصدير يدعم نماذج بتجميع mean أو cls فقط")
+
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids")
+                   if name in tokenizer.model_input_names]
+
+    class HiddenStates(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    sample = tokenizer(["نص للتصدير", "sample text for export"], padding=True, return_tensors="pt")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    model_path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            HiddenStates(transformer),
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            dynamo=False,
+        )
+    print(f"✅ تم تصدير {model_name} إلى {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_path, os.path.join(out_dir, "model_int8.onnx"), weight_type=QuantType.QInt8)
+        print("✅ تم إنشاء النسخة المكممة model_int8.onnx")
+
+    tokenizer.save_pretrained(out_dir)
+    with open(os.path.join(out_dir, "encoder.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": model_name,
+            "pooling": pooling_mode,
+            "normalize": any(isinstance(module, Normalize) for module in model),
+            "max_seq_length": model.max_seq_length,
+            "dimension": model.get_sentence_embedding_dimension(),
+        }, f, ensure_ascii=False, indent=2)
+    np.savez(
+        os.path.join(out_dir, "reference.npz"),
+        texts=np.array(REFERENCE_TEXTS),
+        embeddings=model.encode(REFERENCE_TEXTS, convert_to_numpy=True).astype(np.float32),
+    )
+
+    for quantized in ([False, True] if quantize else [False]):
+        encoder = OnnxEncoder(out_dir, quantized=quantized)
+        check = encoder.validate(0.0)
+        print(f"📐 {encoder.name}: أدنى تشابه مع PyTorch {check['min_cosine']} - المتوسط {check['mean_cosine']}")
+    return out_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="تصدير نموذج الترميز إلى ONNX")
+    parser.add_argument("model_name", nargs="?", default="all-MiniLM-L6-v2")
+    parser.add_argument("--out", default=None, help="مجلد الإخراج (افتراضي models/<النموذج>-onnx)")
+    parser.add_argument("--quantize", action="store_true", help="إنشاء نسخة int8 أيضاً")
+    args = parser.parse_args()
+    export_onnx(args.model_name, args.out, quantize=args.quantize)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import math
+from typing import Dict, Optional
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+# فهارس تحفظ المتجهات كما هي، فاسترجاعها يعطي التضمينات الأصلية
+EXACT_INDEXES = (faiss.IndexFlat, faiss.IndexIVFFlat, faiss.IndexHNSWFlat)
+
+# FAISS يحتاج تقريباً 39 نقطة تدريب لكل مركز (centroid)
+_MIN_POINTS_PER_CENTROID = 39
+
+
+def _default_nlist(n: int) -> int:
+    """عدد القوائم الافتراضي لفهارس IVF: حوالي 4 * جذر عدد المستندات"""
+    return max(1, int(4 * math.sqrt(n)))
+
+
+def _clamp_nlist(nlist: int, n: int) -> int:
+    return max(1, min(nlist, n // _MIN_POINTS_PER_CENTROID))
+
+
+def _default_pq_m(dimension: int) -> int:
+    """أكبر عدد مقاطع PQ يقسم البعد، بحيث يكون كل مقطع 8 أبعاد على الأقل"""
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dimension % m == 0 and dimension // m >= 8:
+            return m
+    return 1
+
+
+def build_index(
+    embeddings: np.ndarray,
+    index_type: str = "flat",
+    nlist: int = None,
+    nprobe: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 80,
+    ef_search: int = 64,
+    pq_m: int = None,
+    pq_nbits: int = 8,
+) -> faiss.Index:
+    """
+    إنشاء فهرس FAISS حسب النوع المطلوب وتدريبه على التضمينات ثم إضافتها
+    index_type: flat (بحث شامل) أو ivf_flat أو hnsw أو ivf_pq
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"نوع فهرس غير معروف: {index_type} (المتاح: {', '.join(INDEX_TYPES)})")
+
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    n, dimension = embeddings.shape
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+
+    else:
+        nlist = _clamp_nlist(nlist or _default_nlist(n), n)
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            pq_m = pq_m or _default_pq_m(dimension)
+            if dimension % pq_m != 0:
+                raise ValueError(f"pq_m={pq_m} يجب أن يقسم بعد التضمينات {dimension}")
+            # كل مقطع يحتاج 2^nbits مركزاً على الأقل من نقاط التدريب
+            while pq_nbits > 1 and (2 ** pq_nbits) > n:
+                pq_nbits -= 1
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, pq_nbits)
+
+        print(f"جاري تدريب فهرس {index_type} على {n} تضمين (nlist={nlist})...")
+        index.train(embeddings)
+
+    index.add(embeddings)
+    set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+    return index
+
+
+def set_search_params(index: faiss.Index, nprobe: int = None, ef_search: int = None):
+    """ضبط معاملات البحث: nprobe لفهارس IVF و efSearch لفهارس HNSW"""
+    if nprobe is not None and hasattr(index, "nprobe"):
+        index.nprobe = min(nprobe, index.nlist)
+    if ef_search is not None and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+
+
+def describe_index(index: faiss.Index) -> Dict:
+    """وصف مختصر للفهرس لعرضه في /status"""
+    if index is None:
+        return {}
+    info = {"type": type(index).__name__, "ntotal": int(index.ntotal)}
+    if hasattr(index, "nprobe"):
+        info.update({"nlist": int(index.nlist), "nprobe": int(index.nprobe)})
+    if hasattr(index, "hnsw"):
+        info.update({"ef_search": int(index.hnsw.efSearch), "ef_construction": int(index.hnsw.efConstruction)})
+    return info
+
+
+def read_index(path: str, mmap: bool = True) -> faiss.Index:
+    """
+    قراءة فهرس محفوظ، مع mmap تبقى متجهاته مربوطة بالملف (IO_FLAG_MMAP_IFC) بدل نسخها
+    في ذاكرة العملية: صفحاته في ذاكرة النظام المؤقتة تتشاركها كل العمليات التي تقرأ نفس الملف
+    الفهرس المربوط للقراءة فقط، فالإضافة إليه تتم على نسخة (faiss.clone_index)
+    """
+    if mmap:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"⚠️ تعذر ربط {path} بالذاكرة ({e})، سيُقرأ بالكامل")
+    return faiss.read_index(path)
+
+
+def copy_index(index: faiss.Index) -> faiss.Index:
+    """نسخة مستقلة قابلة للتعديل (clone_index يبقي متجهات الفهرس المربوط بالملف مشتركة فيفشل add)"""
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def enable_reconstruct(index: faiss.Index):
+    """
+    فهارس IVF تحتاج direct map لاسترجاع المتجهات بأرقامها (reconstruct)، وبناؤه يعدل الفهرس
+    فلا يتم أثناء البحث من عدة خيوط: يُبنى مرة واحدة قبل نشر الفهرس في نسخة جديدة
+    """
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return
+    if ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+
+
+def reconstruct_all(index: faiss.Index) -> Optional[np.ndarray]:
+    """
+    كل متجهات الفهرس بترتيبها (لقواعد البيانات القديمة بدون ملف تضمينات)
+    يرجع None للفهارس المضغوطة (IVF-PQ) لأن متجهاتها تقريبية وليست التضمينات الأصلية
+    فهارس IVF تحتاج direct map مبنياً مسبقاً (انظر enable_reconstruct)
+    """
+    if not isinstance(index, EXACT_INDEXES):
+        return None
+    return index.reconstruct_n(0, index.ntotal)
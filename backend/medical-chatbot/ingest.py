@@ -0,0 +1,315 @@
+"""
+خط معالجة تدريجي وقابل للاستئناف لإضافة ملفات PDF إلى قاعدة البيانات
+
+الاستخدام:
+    python ingest.py medical_book.pdf [another.pdf ...] --db medical_db
+
+- يحسب بصمة (sha256) لكل ملف ولكل صفحة ولكل جزء
+- الملف الذي لم تتغير بصمته ولم تكتمل معالجته يُتخطى بالكامل
+- الملف المتغير تُستخرج وتُقسم كل صفحاته (الأجزاء تمتد عبر حدود الصفحات)، وبصمات الصفحات
+  تُسجل فقط لإحصاء الصفحات المتغيرة: التخطي الفعلي على مستوى الأجزاء، فلا يُرمز إلا
+  الجزء الذي لم يُضف سابقاً
+- يقسم النص بشكل متدفق مع حفظ الصفحات ومواضع الأحرف لكل جزء
+- كل --checkpoint-every جزء جديد تُرمز الأجزاء وتُلحق بملفي مرحلة على القرص
+  (<db>_staged.jsonl للنصوص و <db>_staged.f32 للتضمينات) ويُسجل عددها في ملف الاستئناف،
+  فتكلفة نقطة الاستئناف بحجم الدفعة لا بحجم قاعدة البيانات. إذا توقفت المعالجة تستأنف
+  من آخر نقطة محفوظة بدلاً من البداية
+- في النهاية تُضاف كل الأجزاء المرحلية إلى الفهرس وتُحفظ قاعدة البيانات مرة واحدة
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from embeddings import EmbeddingManager
+from pdf_processor import PDFProcessor
+
+MANIFEST_VERSION = 1
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestionPipeline:
+    def __init__(
+        self,
+        embedding_manager: EmbeddingManager,
+        db_filename: str = "medical_db",
+        chunk_size: int = 500,
+        checkpoint_every: int = 256,
+        workers: int = None,
+        overlap: int = 50,
+        chunk_unit: str = "chars",
+    ):
+        """
+        embedding_manager: مدير التضمينات الذي تُضاف إليه الأجزاء
+        checkpoint_every: عدد الأجزاء الجديدة بين كل حفظ على القرص
+        workers: عدد العمليات لاستخراج صفحات PDF بالتوازي
+        chunk_unit: وحدة chunk_size و overlap: chars (أحرف) أو tokens (رموز tokenizer النموذج)
+        """
+        self.embedding_manager = embedding_manager
+        self.db_filename = db_filename
+        self.chunk_size = chunk_size
+        self.checkpoint_every = checkpoint_every
+        self.workers = workers
+        self.overlap = overlap
+        self.chunk_unit = chunk_unit
+        self.length_fn = None
+        if chunk_unit == "tokens":
+            tokenizer = embedding_manager.model.tokenizer
+            self.length_fn = lambda text: len(tokenizer.tokenize(text))
+        self.manifest_path = f"{db_filename}_manifest.json"
+        self.staged_texts_path = f"{db_filename}_staged.jsonl"
+        self.staged_vectors_path = f"{db_filename}_staged.f32"
+        self.manifest = self._load_manifest()
+        self.chunk_hashes = set()
+        self.db_hashes = set()
+        self.pending: List[Dict] = []
+        self.stats = {"pages_unchanged": 0, "pages_changed": 0, "chunks_skipped": 0, "chunks_added": 0}
+
+    def _load_manifest(self) -> Dict:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                return manifest
+            print(f"⚠️ تجاهل {self.manifest_path}: إصدار غير مدعوم")
+        return {
+            "version": MANIFEST_VERSION,
+            "model_name": self.embedding_manager.model_name,
+            "chunk_size": self.chunk_size,
+            "overlap": self.overlap,
+            "chunk_unit": self.chunk_unit,
+            "sources": {},
+        }
+
+    def _staged(self) -> Dict:
+        """حالة الأجزاء المرحلية: العدد والبعد وحجم ملف النصوص عند آخر نقطة استئناف"""
+        return self.manifest.setdefault("staged", {"count": 0, "dimension": None, "text_bytes": 0})
+
+    def _save_manifest(self):
+        self.manifest["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _load_existing(self):
+        """تحميل قاعدة البيانات الموجودة والأجزاء المرحلية وبناء مجموعة بصمات الأجزاء المضافة"""
+        if self.embedding_manager.index is None and os.path.exists(f"{self.db_filename}.index"):
+            self.embedding_manager.load(self.db_filename)
+        # البصمات تُحسب من المستندات المحفوظة نفسها، فتبقى صحيحة حتى لو توقفت
+        # المعالجة بين حفظ الفهرس وحفظ ملف الاستئناف
+        self.db_hashes = {sha256_text(doc) for doc in self.embedding_manager.documents}
+        self.chunk_hashes = set(self.db_hashes)
+
+        if self._staged()["count"] and not self._staged_files_intact():
+            self._reset_lost_staged()
+        # ما كُتب بعد آخر نقطة استئناف (توقف أثناء الكتابة) يُقتطع
+        staged = self._staged()
+        if staged["count"]:
+            os.truncate(self.staged_texts_path, staged["text_bytes"])
+            os.truncate(self.staged_vectors_path, staged["count"] * staged["dimension"] * 4)
+            for record in self._read_staged_texts():
+                self.chunk_hashes.add(sha256_text(record["text"]))
+            print(f"🔁 استئناف مع {staged['count']} جزء مرحلي لم يُضف للفهرس بعد")
+        else:
+            for path in (self.staged_texts_path, self.staged_vectors_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _staged_files_intact(self) -> bool:
+        """ملفا المرحلة موجودان ولا يقلان عن الحجم المسجل في ملف الاستئناف"""
+        staged = self._staged()
+        sizes = (
+            (self.staged_texts_path, staged["text_bytes"]),
+            (self.staged_vectors_path, staged["count"] * staged["dimension"] * 4),
+        )
+        return all(os.path.exists(path) and os.path.getsize(path) >= size for path, size in sizes)
+
+    def _reset_lost_staged(self):
+        """
+        ملفا المرحلة حُذفا أو نقصا: تُنسى الأجزاء المرحلية وتُعاد معالجة كل المصادر، وما
+        أضيف منها لقاعدة البيانات سابقاً يُتخطى ببصمات الأجزاء
+        """
+        print(
+            f"⚠️ ملفات المرحلة ناقصة ({self.staged_texts_path}, {self.staged_vectors_path}): "
+            f"إعادة معالجة المصادر بدلاً من {self._staged()['count']} جزء مرحلي مفقود"
+        )
+        self.manifest["staged"] = {"count": 0, "dimension": None, "text_bytes": 0}
+        for source in self.manifest["sources"].values():
+            source["completed"] = False
+        self._save_manifest()
+
+    def _read_staged_texts(self) -> List[Dict]:
+        with open(self.staged_texts_path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def _flush(self):
+        """ترميز الأجزاء المعلقة وإلحاقها بملفي المرحلة ثم حفظ نقطة استئناف"""
+        if self.pending:
+            texts = [chunk["text"] for chunk in self.pending]
+            vectors = np.ascontiguousarray(self.embedding_manager.bulk_encoder.encode(texts), dtype='float32')
+            lines = "".join(json.dumps(chunk, ensure_ascii=False) + "\n" for chunk in self.pending)
+
+            # البيانات تُكتب وتُثبت على القرص قبل تسجيل عددها في ملف الاستئناف
+            for path, data in ((self.staged_vectors_path, vectors.tobytes()), (self.staged_texts_path, lines.encode('utf-8'))):
+                with open(path, 'ab') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            staged = self._staged()
+            staged["count"] += len(self.pending)
+            staged["dimension"] = int(vectors.shape[1])
+            staged["text_bytes"] = os.path.getsize(self.staged_texts_path)
+            self.stats["chunks_added"] += len(self.pending)
+            self.pending = []
+        self._save_manifest()
+
+    def _commit_staged(self):
+        """إضافة كل الأجزاء المرحلية إلى الفهرس دفعة واحدة وحفظ قاعدة البيانات مرة واحدة"""
+        staged = self._staged()
+        records = self._read_staged_texts()
+        vectors = np.fromfile(self.staged_vectors_path, dtype='float32').reshape(staged["count"], staged["dimension"])
+        # إذا توقفت المعالجة بعد حفظ قاعدة البيانات وقبل تصفير المرحلة، تكون الأجزاء مضافة بالفعل
+        keep = [i for i, record in enumerate(records) if sha256_text(record["text"]) not in self.db_hashes]
+        if keep:
+            self.embedding_manager.append_documents(
+                [records[i]["text"] for i in keep],
+                [{key: value for key, value in records[i].items() if key != "text"} for i in keep],
+                embeddings=vectors[keep],
+            )
+            # فهارس IVF/HNSW تُدرَّب على أول دفعة فقط، لذا يُعاد بناؤها من التضمينات الكاملة
+            if self.embedding_manager.index_type != "flat":
+                print("جاري إعادة بناء الفهرس على كامل التضمينات...")
+                self.embedding_manager.rebuild_index()
+            # فهرس الكلمات المفتاحية يبنى مرة واحدة بعد إضافة كل الأجزاء
+            self.embedding_manager.build_keyword_index()
+            self.embedding_manager.save(self.db_filename)
+
+        self.manifest["staged"] = {"count": 0, "dimension": None, "text_bytes": 0}
+        self._save_manifest()
+        for path in (self.staged_texts_path, self.staged_vectors_path):
+            os.remove(path)
+
+    def ingest(self, pdf_path: str):
+        """إضافة ملف PDF واحد، مع تخطي الأجزاء المضافة سابقاً"""
+        file_hash = sha256_file(pdf_path)
+        sources = self.manifest["sources"]
+        source = sources.get(pdf_path)
+        if source and source.get("file_hash") == file_hash and source.get("completed"):
+            print(f"✅ {pdf_path} تمت معالجته سابقاً، لا توجد تغييرات")
+            return
+        previous_pages = (source or {}).get("pages", {})
+        source = {"file_hash": file_hash, "completed": False, "pages": previous_pages}
+        sources[pdf_path] = source
+
+        print(f"جاري معالجة {pdf_path}...")
+        processor = PDFProcessor(pdf_path, chunk_size=self.chunk_size, overlap=self.overlap, workers=self.workers)
+        page_hashes: Dict[str, str] = {}
+
+        def hashed_pages():
+            for record in processor.extract_pages():
+                page_key = str(record["page"])
+                page_hashes[page_key] = sha256_text(record["text"])
+                if previous_pages.get(page_key) == page_hashes[page_key]:
+                    self.stats["pages_unchanged"] += 1
+                else:
+                    self.stats["pages_changed"] += 1
+                yield record
+
+        # الأجزاء قد تمتد عبر حدود الصفحات، لذا تمر كل الصفحات على المقسم (بصمات الصفحات
+        # للإحصاء فقط) ويتم تخطي الترميز (الجزء المكلف) للأجزاء المعروفة فقط
+        for chunk in processor.iter_chunks(hashed_pages(), length_fn=self.length_fn):
+            chunk_hash = sha256_text(chunk["text"])
+            if chunk_hash in self.chunk_hashes:
+                self.stats["chunks_skipped"] += 1
+                continue
+            self.chunk_hashes.add(chunk_hash)
+            self.pending.append(chunk)
+
+            if len(self.pending) >= self.checkpoint_every:
+                self._flush()
+
+        source["pages"] = page_hashes
+        source["completed"] = True
+        self._flush()
+
+    def run(self, pdf_paths: List[str]) -> Dict:
+        """معالجة قائمة ملفات وإرجاع إحصائيات التشغيل"""
+        start_time = time.time()
+        self._load_existing()
+
+        for pdf_path in pdf_paths:
+            self.ingest(pdf_path)
+
+        # يشمل الأجزاء المرحلية من تشغيل سابق توقف قبل إضافتها
+        if self._staged()["count"]:
+            self._commit_staged()
+
+        self.stats["total_chunks"] = len(self.embedding_manager.documents)
+        self.stats["encode_chunks_per_sec"] = self.embedding_manager.bulk_encoder.stats()["chunks_per_sec"]
+        self.stats["elapsed"] = round(time.time() - start_time, 2)
+        print(f"✅ انتهت المعالجة: {self.stats}")
+        return self.stats
+
+
+def save_chunks(documents: List[str], output_file: str):
+    """حفظ الأجزاء في ملف للمراجعة"""
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for i, chunk in enumerate(documents):
+            f.write(f"--- Chunk {i+1} ---\n")
+            f.write(chunk)
+            f.write("\n\n")
+    print(f"تم حفظ الأجزاء في {output_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="إضافة ملفات PDF إلى قاعدة البيانات بشكل تدريجي")
+    parser.add_argument("pdfs", nargs="+", help="ملفات PDF المراد إضافتها")
+    parser.add_argument("--db", default="medical_db", help="اسم قاعدة البيانات")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--overlap", type=int, default=50)
+    parser.add_argument("--chunk-unit", choices=["chars", "tokens"], default="chars",
+                        help="وحدة الحجم والتداخل (مع tokens استخدم حجماً أقل من حد النموذج، مثلاً 200)")
+    parser.add_argument("--checkpoint-every", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=None, help="عدد عمليات استخراج الصفحات")
+    parser.add_argument("--encode-workers", type=int, default=None,
+                        help="عدد عمليات ترميز الأجزاء (كل عملية تحمل نسخة من النموذج)")
+    parser.add_argument("--chunks-output", default=None, help="حفظ كل الأجزاء في ملف نصي للمراجعة")
+    args = parser.parse_args()
+
+    pipeline = IngestionPipeline(
+        EmbeddingManager(encode_workers=args.encode_workers),
+        db_filename=args.db,
+        chunk_size=args.chunk_size,
+        checkpoint_every=args.checkpoint_every,
+        workers=args.workers,
+        overlap=args.overlap,
+        chunk_unit=args.chunk_unit,
+    )
+    try:
+        pipeline.run(args.pdfs)
+    finally:
+        pipeline.embedding_manager.close()
+
+    if args.chunks_output:
+        save_chunks(pipeline.embedding_manager.documents, args.chunks_output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+فهرس كلمات مفتاحية (BM25) على نفس أجزاء قاعدة البيانات
+
+يكمل البحث الدلالي في أسماء الأدوية والمصطلحات النادرة التي لا يمثلها نموذج
+التضمين جيداً. الفهرس مقلوب بصيغة CSR: لكل كلمة قائمة المستندات ووزن BM25
+المحسوب مسبقاً، فيكون تقييم الاستعلام جمع بضع شرائح numpy.
+"""
+import os
+import re
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+_DIACRITICS = re.compile(r'[ً-ْـ]')
+_TOKEN = re.compile(r'\w+')
+# كلمات مقسومة بشرطة في نهاية السطر كما تخرج من PDF (nega-\ntive)
+_HYPHEN_BREAK = re.compile(r'-[ \t]*\n\s*')
+_ARABIC_LETTERS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي"})
+
+STOPWORDS = frozenset({
+    "في", "من", "على", "الى", "عن", "مع", "هذا", "هذه", "ذلك", "التي", "الذي", "او", "ثم",
+    "كان", "كانت", "ان", "لا", "ما", "هو", "هي", "قد", "كل", "بين", "عند", "بعد", "قبل",
+    "the", "of", "and", "or", "to", "in", "is", "are", "for", "with", "on", "by", "as", "be", "an", "at",
+})
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    تقسيم النص إلى كلمات مع توحيد الكتابة العربية:
+    حذف التشكيل والتطويل، توحيد الألف والياء والتاء المربوطة، وحذف "ال" التعريف
+    """
+    text = _HYPHEN_BREAK.sub('', text)
+    text = _DIACRITICS.sub('', text).translate(_ARABIC_LETTERS).lower()
+    tokens = []
+    for token in _TOKEN.findall(text):
+        if token.startswith("ال") and len(token) > 4:
+            token = token[2:]
+        if len(token) > 1 and token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def keyword_index_path(filename: str) -> str:
+    return f"{filename}_bm25.npz"
+
+
+class BM25Index:
+    def __init__(self, terms: List[str], indptr: np.ndarray, doc_ids: np.ndarray, weights: np.ndarray,
+                 doc_count: int, k1: float = 1.5, b: float = 0.75):
+        """
+        terms: الكلمات بترتيب معرفاتها
+        indptr/doc_ids/weights: قوائم المستندات لكل كلمة (الكلمة t في المدى indptr[t]:indptr[t+1])
+        weights: وزن BM25 للكلمة في المستند (idf مضروب في وزن التكرار المطبع بطول المستند)
+        """
+        self.terms = list(terms)
+        self.vocab = {term: i for i, term in enumerate(self.terms)}
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.doc_count = doc_count
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(cls, documents: Iterable[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """بناء الفهرس من نصوص المستندات (بترتيب أرقامها في قاعدة البيانات)"""
+        vocab = {}
+        rows, cols, counts = [], [], []
+        lengths = []
+        for doc_id, text in enumerate(documents):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            tf = {}
+            for token in tokens:
+                term_id = vocab.setdefault(token, len(vocab))
+                tf[term_id] = tf.get(term_id, 0) + 1
+            rows.extend(tf.keys())
+            cols.extend([doc_id] * len(tf))
+            counts.extend(tf.values())
+
+        doc_count = len(lengths)
+        term_ids = np.array(rows, dtype='int64')
+        doc_ids = np.array(cols, dtype='int32')
+        tf = np.array(counts, dtype='float32')
+        lengths = np.array(lengths, dtype='float32')
+
+        # ترتيب المدخلات حسب الكلمة لبناء CSR (المستندات تبقى مرتبة داخل كل كلمة)
+        order = np.argsort(term_ids, kind='stable')
+        term_ids, doc_ids, tf = term_ids[order], doc_ids[order], tf[order]
+        df = np.bincount(term_ids, minlength=len(vocab))
+        indptr = np.zeros(len(vocab) + 1, dtype='int64')
+        np.cumsum(df, out=indptr[1:])
+
+        idf = np.log1p((doc_count - df + 0.5) / (df + 0.5)).astype('float32')
+        avg_length = float(lengths.mean()) if doc_count else 0.0
+        norm = k1 * (1 - b + b * lengths[doc_ids] / max(avg_length, 1e-9))
+        weights = (idf[term_ids] * tf * (k1 + 1) / (tf + norm)).astype('float32')
+
+        terms = [None] * len(vocab)
+        for term, term_id in vocab.items():
+            terms[term_id] = term
+        return cls(terms, indptr, doc_ids, weights, doc_count, k1, b)
+
+    def __len__(self) -> int:
+        return self.doc_count
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[int, float]]:
+        """أفضل k مستندات (رقم المستند، درجة BM25)، فقط المستندات التي تحتوي كلمة من الاستعلام"""
+        term_ids = {self.vocab[token] for token in tokenize(query) if token in self.vocab}
+        if not term_ids or k <= 0:
+            return []
+
+        scores = np.zeros(self.doc_count, dtype='float32')
+        for term_id in term_ids:
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            # المستند يظهر مرة واحدة في قائمة كل كلمة لذا الجمع المفهرس آمن
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind='stable')]
+        return [(int(i), float(scores[i])) for i in matched]
+
+    def search_batch(self, queries: List[str], k: int = 5) -> List[List[Tuple[int, float]]]:
+        return [self.search(query, k) for query in queries]
+
+    def save(self, filename: str):
+        """حفظ الفهرس في {filename}_bm25.npz (كتابة مؤقتة ثم استبدال)"""
+        path = keyword_index_path(filename)
+        with open(f"{path}.tmp", 'wb') as f:
+            np.savez(
+                f,
+                format_version=FORMAT_VERSION,
+                terms=np.array(self.terms, dtype=str),
+                indptr=self.indptr,
+                doc_ids=self.doc_ids,
+                weights=self.weights,
+                doc_count=self.doc_count,
+                params=np.array([self.k1, self.b], dtype='float64'),
+            )
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, filename: str) -> "BM25Index":
+        with np.load(keyword_index_path(filename)) as data:
+            if int(data["format_version"]) != FORMAT_VERSION:
+                raise ValueError(f"إصدار صيغة فهرس الكلمات غير مدعوم: {int(data['format_version'])}")
+            k1, b = data["params"].tolist()
+            return cls(
+                data["terms"].tolist(), data["indptr"], data["doc_ids"], data["weights"],
+                int(data["doc_count"]), k1, b,
+            )
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], rrf_k: int = 60) -> List[Tuple[int, float]]:
+    """
+    دمج عدة قوائم مرتبة بطريقة Reciprocal Rank Fusion:
+    درجة المستند = مجموع 1 / (rrf_k + ترتيبه) على القوائم التي يظهر فيها
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
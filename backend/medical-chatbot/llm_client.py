@@ -0,0 +1,445 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import time
+import logging
+from typing import List, Dict, Optional, AsyncIterator, Awaitable, Callable
+
+import httpx
+
+from metrics import REGISTRY
+from resilience import RetryPolicy, CircuitBreaker, OPEN
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_RESPONSES = REGISTRY.counter(
+    "afya_llm_upstream_responses_total", "ردود OpenRouter حسب النموذج والحالة (رمز HTTP أو timeout أو transport_error)",
+    ["model", "status"]
+)
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "afya_llm_upstream_seconds", "زمن محاولة واحدة لدى OpenRouter (بدون البث) حتى قراءة الاستجابة", ["model"]
+)
+TOKENS = REGISTRY.counter(
+    "afya_llm_tokens_total", "الرموز المستخدمة كما يذكرها حقل usage في الاستجابة", ["model", "type"]
+)
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# حالات من الخدمة تستحق إعادة المحاولة (ضغط مؤقت أو عطل في الخادم)
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+# حالات خاصة بالنموذج (غير متاح أو لا يقبل الطلب): ننتقل للنموذج التالي دون إعادة المحاولة
+FALLBACK_STATUSES = {400, 404}
+
+
+class LLMError(Exception):
+    """خطأ من خدمة الذكاء الاصطناعي مع رمز HTTP المناسب لإرجاعه للعميل"""
+
+    def __init__(
+        self,
+        status_code: int,
+        detail: str,
+        retryable: bool = False,
+        upstream_status: int = None,
+        retry_after: float = None,
+    ):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retryable = retryable
+        self.upstream_status = upstream_status
+        self.retry_after = retry_after
+
+
+class LLMClient:
+    def __init__(
+        self,
+        url: str = None,
+        max_connections: int = None,
+        max_keepalive: int = None,
+        max_concurrency: int = None,
+    ):
+        """
+        عميل غير متزامن مشترك لـ OpenRouter
+        يعيد استخدام الاتصالات (keep-alive) ويحد من عدد الطلبات المتزامنة
+        الطلبات المتطابقة المتزامنة في complete تتشارك استدعاءً واحداً (LLM_SINGLE_FLIGHT=0 للتعطيل)
+        الأعطال المؤقتة يعاد فيها المحاولة، ولكل نموذج قاطع دائرة، وعند فشل نموذج يُجرب التالي
+        في LLM_MODELS (قائمة مفصولة بفواصل بالترتيب) - انظر resilience
+        """
+        self.url = url or os.getenv("OPENROUTER_URL", OPENROUTER_URL)
+        self.max_connections = max_connections or int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+        self.max_keepalive = max_keepalive or int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = 0
+        
+        self.single_flight = os.getenv("LLM_SINGLE_FLIGHT", "1") != "0"
+        self._pending: Dict[str, asyncio.Task] = {}
+        self.upstream_calls = 0
+        self.coalesced = 0
+        
+        self.models = [m.strip() for m in os.getenv("LLM_MODELS", "gpt-3.5-turbo").split(",") if m.strip()]
+        self.retry_policy = RetryPolicy()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.retries = 0
+        self.fallbacks = 0
+        self.short_circuited = 0
+
+    async def start(self):
+        """إنشاء مجمع الاتصالات (يُستدعى عند بدء التطبيق)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                ),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+
+    async def close(self):
+        """إغلاق مجمع الاتصالات (يُستدعى عند إيقاف التطبيق)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def _status_error(response: httpx.Response) -> LLMError:
+        """بناء خطأ من استجابة غير ناجحة (يجب قراءة المحتوى مسبقاً)"""
+        error_detail = "خطأ غير معروف"
+        if response.text:
+            try:
+                error_data = response.json()
+                error_detail = error_data.get('error', {}).get('message', response.text[:200])
+            except Exception:
+                error_detail = response.text[:200]
+
+        retry_after = None
+        try:
+            retry_after = float(response.headers.get("Retry-After", ""))
+        except ValueError:
+            pass
+
+        logger.error(f"❌ خطأ من OpenRouter API ({response.status_code}): {error_detail}")
+        return LLMError(
+            500,
+            f"خطأ في خدمة الذكاء الاصطناعي: {error_detail}",
+            retryable=response.status_code in RETRYABLE_STATUSES,
+            upstream_status=response.status_code,
+            retry_after=retry_after,
+        )
+
+    @staticmethod
+    def _timeout_error() -> LLMError:
+        logger.error("⏰ انتهت مهلة الاتصال بـ OpenRouter API")
+        return LLMError(504, "انتهت مهلة الاتصال بخدمة الذكاء الاصطناعي", retryable=True)
+
+    @staticmethod
+    def _transport_error() -> LLMError:
+        logger.error("🔌 خطأ في الاتصال بـ OpenRouter API")
+        return LLMError(503, "تعذر الاتصال بخدمة الذكاء الاصطناعي", retryable=True)
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        if model not in self._breakers:
+            self._breakers[model] = CircuitBreaker(model)
+        return self._breakers[model]
+
+    def _model_chain(self, model: Optional[str]) -> List[str]:
+        """النموذج المطلوب أولاً ثم بقية نماذج LLM_MODELS بترتيبها"""
+        if not model:
+            return list(self.models)
+        return [model] + [m for m in self.models if m != model]
+
+    async def _with_resilience(self, model: Optional[str], timeout: float, attempt: Callable[[str, float], Awaitable]):
+        """
+        تنفيذ attempt(model, remaining_timeout) مع إعادة المحاولة وقاطع الدائرة والنماذج البديلة
+        timeout هو المهلة الكلية لكل المحاولات معاً
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        chain = self._model_chain(model)
+        last_error: Optional[LLMError] = None
+
+        for position, current in enumerate(chain):
+            breaker = self._breaker(current)
+            if not breaker.allow():
+                continue
+
+            for attempt_number in range(self.retry_policy.max_attempts):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise last_error or self._timeout_error()
+                try:
+                    result = await attempt(current, remaining)
+                except LLMError as e:
+                    last_error = e
+                    if not e.retryable:
+                        if e.upstream_status in FALLBACK_STATUSES:
+                            break
+                        raise
+                    breaker.record_failure()
+                    if attempt_number + 1 >= self.retry_policy.max_attempts or breaker.state == OPEN:
+                        break
+                    delay = self.retry_policy.delay(attempt_number, e.retry_after)
+                    if delay >= deadline - loop.time():
+                        break
+                    self.retries += 1
+                    logger.warning(f"🔁 إعادة المحاولة مع {current} بعد {delay:.2f} ثانية ({e.detail})")
+                    await asyncio.sleep(delay)
+                    continue
+
+                breaker.record_success()
+                if position > 0:
+                    self.fallbacks += 1
+                    logger.warning(f"↪️ تمت الإجابة بالنموذج البديل {current}")
+                return result
+
+        if last_error is None:
+            # كل النماذج دوائرها مفتوحة: رفض فوري بدلاً من زيادة الضغط على الخدمة
+            self.short_circuited += 1
+            retry_after = min(self._breaker(current).retry_after() for current in chain)
+            raise LLMError(
+                503,
+                "خدمة الذكاء الاصطناعي غير متاحة مؤقتاً، يرجى المحاولة لاحقاً",
+                retry_after=max(1, math.ceil(retry_after)),
+            )
+        raise last_error
+
+    def _headers(self, title: str) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
+            "HTTP-Referer": "http://localhost:8000",
+            "X-Title": title,
+        }
+
+    def _payload_key(self, payload: Dict) -> str:
+        """بصمة الطلب: الرسائل كاملة ومعاملات النموذج (بترتيب ثابت للمفاتيح)"""
+        body = json.dumps({"url": self.url, **payload}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _consume_exception(task: asyncio.Task):
+        # إذا ألغى كل المنتظرين طلباتهم لا يبقى من يقرأ الخطأ، فنقرأه هنا لتجنب تحذير asyncio
+        if not task.cancelled():
+            task.exception()
+
+    async def complete(
+        self,
+        messages: List[Dict],
+        title: str = "AFYA CARE - Medical RAG Chatbot",
+        model: str = None,
+        temperature: float = 0.3,
+        max_tokens: int = 1000,
+        top_p: float = 0.9,
+        timeout: float = 45,
+    ) -> str:
+        """
+        إرسال طلب إكمال وإرجاع نص الإجابة
+        إذا كان طلب مطابق (نفس الرسائل والمعاملات) قيد التنفيذ ينتظر نتيجته بدلاً من طلب جديد،
+        ومهلة الطلب الأول هي المطبقة على الجميع
+        model: النموذج المفضل (الافتراضي أول LLM_MODELS)، وبقية القائمة بدائل له
+        """
+        if self._client is None:
+            await self.start()
+
+        payload = {
+            "model": model or self.models[0],
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": top_p,
+        }
+
+        if not self.single_flight:
+            return await self._complete(payload, title, timeout)
+
+        key = self._payload_key(payload)
+        task = self._pending.get(key)
+        if task is None:
+            # الطلب يعمل كمهمة مستقلة حتى لا يلغيه انقطاع العميل الأول عن الآخرين
+            task = asyncio.ensure_future(self._complete(payload, title, timeout))
+            self._pending[key] = task
+            task.add_done_callback(lambda done, key=key: self._pending.pop(key, None))
+            task.add_done_callback(self._consume_exception)
+        else:
+            self.coalesced += 1
+            logger.info(f"🔗 دمج طلب مطابق قيد التنفيذ ({self.coalesced} حتى الآن)")
+
+        return await asyncio.shield(task)
+
+    async def _complete(self, payload: Dict, title: str, timeout: float) -> str:
+        """استدعاء OpenRouter مع إعادة المحاولة والنماذج البديلة"""
+        return await self._with_resilience(
+            payload["model"],
+            timeout,
+            lambda model, remaining: self._post_once(dict(payload, model=model), title, remaining),
+        )
+
+    async def _post_once(self, payload: Dict, title: str, timeout: float) -> str:
+        """محاولة واحدة لدى OpenRouter"""
+        self.upstream_calls += 1
+        async with self._semaphore:
+            self.in_flight += 1
+            api_start = time.time()
+            try:
+                response = await self._client.post(
+                    self.url,
+                    headers=self._headers(title),
+                    json=payload,
+                    timeout=timeout,
+                )
+            except httpx.TimeoutException:
+                UPSTREAM_RESPONSES.labels(payload["model"], "timeout").inc()
+                raise self._timeout_error()
+            except httpx.TransportError:
+                UPSTREAM_RESPONSES.labels(payload["model"], "transport_error").inc()
+                raise self._transport_error()
+            finally:
+                self.in_flight -= 1
+
+        api_time = time.time() - api_start
+        UPSTREAM_SECONDS.labels(payload["model"]).observe(api_time)
+        UPSTREAM_RESPONSES.labels(payload["model"], response.status_code).inc()
+        logger.info(f"📄 استجابة API ({payload['model']}) في {api_time:.2f} ثانية - الحالة: {response.status_code}")
+
+        if response.status_code != 200:
+            raise self._status_error(response)
+
+        try:
+            response_data = response.json()
+        except ValueError:
+            raise LLMError(500, "استجابة غير صالحة من خدمة الذكاء الاصطناعي", retryable=True, upstream_status=200)
+
+        if not response_data.get("choices") or not response_data["choices"]:
+            raise LLMError(500, "استجابة فارغة من خدمة الذكاء الاصطناعي", retryable=True, upstream_status=200)
+
+        self._count_tokens(payload["model"], response_data.get("usage"))
+        return response_data["choices"][0]["message"]["content"]
+
+    async def stream(
+        self,
+        messages: List[Dict],
+        title: str = "AFYA CARE - Medical RAG Chatbot",
+        model: str = None,
+        temperature: float = 0.3,
+        max_tokens: int = 1000,
+        top_p: float = 0.9,
+        timeout: float = 45,
+    ) -> AsyncIterator[str]:
+        """
+        إرسال طلب إكمال بوضع البث وإرجاع أجزاء النص فور وصولها
+        إعادة المحاولة والنماذج البديلة تطبق حتى وصول أول جزء فقط، بعده يصل الخطأ للعميل
+        """
+        if self._client is None:
+            await self.start()
+
+        payload = {
+            "model": model or self.models[0],
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": top_p,
+            "stream": True,
+        }
+
+        async def open_stream(current: str, remaining: float):
+            tokens = self._stream_once(dict(payload, model=current), title, remaining)
+            try:
+                first = await tokens.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except BaseException:
+                await tokens.aclose()
+                raise
+            return tokens, first
+
+        # البث لا يُدمج: كل عميل يحتاج أجزاءه فور وصولها
+        tokens, first = await self._with_resilience(payload["model"], timeout, open_stream)
+        try:
+            if first is None:
+                return
+            yield first
+            async for token in tokens:
+                yield token
+        finally:
+            await tokens.aclose()
+
+    async def _stream_once(self, payload: Dict, title: str, timeout: float) -> AsyncIterator[str]:
+        """محاولة بث واحدة لدى OpenRouter"""
+        self.upstream_calls += 1
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                async with self._client.stream(
+                    "POST",
+                    self.url,
+                    headers=self._headers(title),
+                    json=payload,
+                    timeout=timeout,
+                ) as response:
+                    UPSTREAM_RESPONSES.labels(payload["model"], response.status_code).inc()
+                    if response.status_code != 200:
+                        await response.aread()
+                        raise self._status_error(response)
+
+                    async for line in response.aiter_lines():
+                        # تجاهل الأسطر الفارغة وتعليقات SSE مثل ": OPENROUTER PROCESSING"
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                        except ValueError:
+                            continue
+                        if chunk.get("error"):
+                            raise LLMError(
+                                500,
+                                f"خطأ في خدمة الذكاء الاصطناعي: {chunk['error'].get('message', '')}",
+                                retryable=True,
+                                upstream_status=200,
+                            )
+                        # usage يصل عادة في آخر جزء (إن أرسلته الخدمة)
+                        self._count_tokens(payload["model"], chunk.get("usage"))
+                        choices = chunk.get("choices") or []
+                        if not choices:
+                            continue
+                        token = (choices[0].get("delta") or {}).get("content")
+                        if token:
+                            yield token
+            except httpx.TimeoutException:
+                UPSTREAM_RESPONSES.labels(payload["model"], "timeout").inc()
+                raise self._timeout_error()
+            except httpx.TransportError:
+                UPSTREAM_RESPONSES.labels(payload["model"], "transport_error").inc()
+                raise self._transport_error()
+            finally:
+                self.in_flight -= 1
+
+    @staticmethod
+    def _count_tokens(model: str, usage: Optional[Dict]):
+        if not isinstance(usage, dict):
+            return
+        for kind in ("prompt", "completion"):
+            count = usage.get(f"{kind}_tokens")
+            if isinstance(count, (int, float)) and count > 0:
+                TOKENS.labels(model, kind).inc(count)
+
+    def stats(self) -> Dict:
+        """إحصائيات العميل لعرضها في /status"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_connections": self.max_connections,
+            "in_flight": self.in_flight,
+            "single_flight": self.single_flight,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "pending_keys": len(self._pending),
+            "models": self.models,
+            "retries": self.retries,
+            "fallbacks": self.fallbacks,
+            "short_circuited": self.short_circuited,
+            "breakers": {model: breaker.stats() for model, breaker in self._breakers.items()},
+        }
@@ -1,13 +1,19 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from pydantic import BaseModel
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import requests
+from starlette.background import BackgroundTask
 import os
 import time
 from dotenv import load_dotenv
 from embeddings import EmbeddingManager
-from pdf_processor import PDFProcessor
+from llm_client import LLMClient, LLMError
+from answer_cache import SemanticAnswerCache
+from reranker import Reranker
+from context_builder import ContextBuilder
+from admission import AdmissionController, AdmissionRejected
+from resilience import CLOSED
+from metrics import REGISTRY, CONTENT_TYPE, MetricsMiddleware, observe_stages, mark_handler_done
 import asyncio
 import logging
 import json
@@ -36,7 +42,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-embedding_manager = EmbeddingManager()
+# زمن كل طلب حسب المسار والحالة، وزمن تسلسل الاستجابة (انظر /metrics)
+app.add_middleware(MetricsMiddleware)
+
+# النموذج والفهرس يُحمّلان في الخلفية بعد بدء الخادم (انظر startup_event)
+embedding_manager = EmbeddingManager(lazy=True)
+llm_client = LLMClient()
+# نموذج إعادة الترتيب (إن وُجد RERANKER_MODEL) يُحمّل أيضاً في الخلفية مع نموذج الترميز
+reranker = Reranker(lazy=True)
+context_builder = ContextBuilder()
+answer_cache = SemanticAnswerCache(
+    max_size=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+)
+
+# نتائج البحث بالكلمات ضمن هذا الترتيب تقبل حتى لو تجاوزت حد المسافة الدلالية
+KEYWORD_TRUST_RANK = int(os.getenv("KEYWORD_TRUST_RANK", "3"))
+
+# ميزانية رموز السياق المسترجع في الرسالة لكل نقطة نهاية
+CONTEXT_BUDGET_CHAT = int(os.getenv("CONTEXT_BUDGET_CHAT", "1200"))
+CONTEXT_BUDGET_MEDICAL = int(os.getenv("CONTEXT_BUDGET_MEDICAL", "600"))
+
+# حدود التزامن وطوابير الانتظار للنقاط المكلفة (ترميز السؤال واستدعاء الذكاء الاصطناعي)
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+admission = {
+    "chat": AdmissionController(
+        "chat",
+        max_concurrent=int(os.getenv("CHAT_MAX_CONCURRENT", "8")),
+        max_queue=int(os.getenv("CHAT_MAX_QUEUE", "32")),
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT
+    ),
+    "daily_report": AdmissionController(
+        "daily_report",
+        max_concurrent=int(os.getenv("DAILY_REPORT_MAX_CONCURRENT", "4")),
+        max_queue=int(os.getenv("DAILY_REPORT_MAX_QUEUE", "16")),
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT
+    ),
+    "medication_schedule": AdmissionController(
+        "medication_schedule",
+        max_concurrent=int(os.getenv("MEDICATION_SCHEDULE_MAX_CONCURRENT", "4")),
+        max_queue=int(os.getenv("MEDICATION_SCHEDULE_MAX_QUEUE", "16")),
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT
+    ),
+}
 
 class ChatRequest(BaseModel):
     question: str
@@ -48,6 +97,7 @@ class ChatResponse(BaseModel):
     sources: list
     processing_time: float
     user_type: str
+    processing_breakdown: dict = None
 
 class QuestionnaireRequest(BaseModel):
     user_type: str
@@ -85,11 +135,91 @@ class MedicationScheduleResponse(BaseModel):
 
 
 # متغير عام لتخزين حالة التهيئة
+# phase: starting -> loading_model -> (loading_reranker) -> loading_index -> warming_up -> ready (أو failed)
+# is_initialized تصبح True فقط عند ready، أي بعد تحميل النموذج والفهرس وتمرير تمهيدي
 initialization_status = {
     "is_initialized": False,
+    "phase": "starting",
     "message": "جاري التهيئة...",
-    "error": None
+    "error": None,
+    "startup": {}
 }
+_warm_start_task = None
+
+# إعادة تحميل واحدة في كل مرة، وحالة آخر إعادة تحميل تظهر في /status
+_reload_lock = asyncio.Lock()
+reload_status = {"state": "idle", "started_at": None, "duration_s": None, "error": None}
+
+# مقاييس /metrics: أزمنة المراحل في afya_stage_seconds (انظر metrics.py)، وجودة الاسترجاع هنا،
+# وبقية العدادات تُقرأ من stats() الموجودة لحظة القراءة فلا تكلف المسار الساخن شيئاً
+RETRIEVAL_TOP_SCORE = REGISTRY.histogram(
+    "afya_retrieval_top_score", "مسافة أقرب نتيجة مسترجعة لكل استعلام (الأقل أقرب)", ["endpoint"],
+    buckets=(0.25, 0.5, 0.75, 1.0, 1.25, 1.5, 1.8, 2.0, 2.5, 3.0, 5.0)
+)
+RETRIEVAL_RESULTS = REGISTRY.counter(
+    "afya_retrieval_results_total", "نتيجة الاسترجاع لكل استعلام: reranked أو relevant أو fallback أو none",
+    ["endpoint", "result"]
+)
+
+def _observe_retrieval(endpoint: str, docs: list, result: str):
+    if docs:
+        RETRIEVAL_TOP_SCORE.labels(endpoint).observe(min(doc["score"] for doc in docs))
+    RETRIEVAL_RESULTS.labels(endpoint, result).inc()
+
+def _register_stats_metrics():
+    def per_admission(key):
+        return lambda: {name: controller.stats()[key] for name, controller in admission.items()}
+    
+    def caches(key):
+        return lambda: {"query": embedding_manager.query_cache.stats()[key], "answer": answer_cache.stats()[key]}
+    
+    def llm(key):
+        return lambda: llm_client.stats()[key]
+    
+    def admission_rejected():
+        values = {}
+        for name, controller in admission.items():
+            stats = controller.stats()
+            values[(name, "queue_full")] = stats["rejected_queue_full"]
+            values[(name, "timeout")] = stats["rejected_timeout"]
+        return values
+    
+    REGISTRY.callback("afya_ready", "1 بعد تحميل النموذج والفهرس والتمرير التمهيدي",
+                      lambda: initialization_status["is_initialized"])
+    REGISTRY.callback("afya_index_documents", "عدد المستندات في نسخة الفهرس الحالية",
+                      lambda: len(embedding_manager.snapshot.documents))
+    REGISTRY.callback("afya_index_version", "إصدار نسخة الفهرس الحالية (يزيد مع كل /reload)",
+                      lambda: embedding_manager.snapshot.version)
+    REGISTRY.callback("afya_admission_active", "الطلبات قيد التنفيذ لكل نقطة", per_admission("active"), ["endpoint"])
+    REGISTRY.callback("afya_admission_queue_depth", "الطلبات المنتظرة في الطابور لكل نقطة",
+                      per_admission("queue_depth"), ["endpoint"])
+    REGISTRY.callback("afya_admission_rejected_total", "الطلبات المرفوضة لتجاوز السعة",
+                      admission_rejected, ["endpoint", "reason"], kind="counter")
+    REGISTRY.callback("afya_cache_hits_total", "إصابات الذاكرة المؤقتة", caches("hits"), ["cache"], kind="counter")
+    REGISTRY.callback("afya_cache_misses_total", "إخفاقات الذاكرة المؤقتة", caches("misses"), ["cache"], kind="counter")
+    REGISTRY.callback("afya_cache_entries", "عدد العناصر في الذاكرة المؤقتة", caches("size"), ["cache"])
+    REGISTRY.callback("afya_encode_batches_total", "دفعات ترميز الاستعلامات",
+                      lambda: embedding_manager.batcher.stats()["batches"], kind="counter")
+    REGISTRY.callback("afya_encode_batch_items_total", "الاستعلامات المرمزة ضمن الدفعات",
+                      lambda: embedding_manager.batcher.stats()["items"], kind="counter")
+    REGISTRY.callback(
+        "afya_rerank_total", "قرارات إعادة الترتيب: reranked أو skipped_busy أو skipped_budget",
+        lambda: {key: value for key, value in reranker.stats().items() if key in ("reranked", "skipped_busy", "skipped_budget")},
+        ["outcome"], kind="counter"
+    )
+    REGISTRY.callback("afya_llm_in_flight", "طلبات OpenRouter الجارية", llm("in_flight"))
+    REGISTRY.callback("afya_llm_coalesced_total", "طلبات مدمجة مع طلب مطابق قيد التنفيذ", llm("coalesced"), kind="counter")
+    REGISTRY.callback("afya_llm_retries_total", "إعادات المحاولة لدى OpenRouter", llm("retries"), kind="counter")
+    REGISTRY.callback("afya_llm_fallbacks_total", "إجابات من نموذج بديل", llm("fallbacks"), kind="counter")
+    REGISTRY.callback("afya_llm_short_circuited_total", "طلبات رُفضت لأن كل الدوائر مفتوحة",
+                      llm("short_circuited"), kind="counter")
+    REGISTRY.callback(
+        "afya_llm_breaker_open", "1 إذا كانت دائرة النموذج مفتوحة أو نصف مفتوحة",
+        lambda: {model: breaker["state"] != CLOSED for model, breaker in llm_client.stats()["breakers"].items()},
+        ["model"]
+    )
+
+_register_stats_metrics()
 
 def validate_environment():
     """التحقق من إعدادات البيئة"""
@@ -101,51 +231,79 @@ def validate_environment():
     
     return True, "جميع الإعدادات صحيحة"
 
-@app.on_event("startup")
-async def startup_event():
-    """تهيئة التطبيق عند البدء"""
-    global initialization_status
-    
-    # التحقق من إعدادات البيئة
-    env_valid, env_message = validate_environment()
-    if not env_valid:
-        initialization_status["error"] = env_message
-        logger.error(f"خطأ في إعدادات البيئة: {env_message}")
-        return
-    
+async def _call_llm(messages: list, **kwargs) -> str:
+    """استدعاء خدمة الذكاء الاصطناعي عبر العميل المشترك وتحويل الأخطاء إلى HTTPException"""
+    try:
+        return await llm_client.complete(messages, **kwargs)
+    except LLMError as e:
+        # Retry-After عند فتح قاطع الدائرة حتى لا يعيد العملاء المحاولة فوراً
+        headers = {"Retry-After": str(int(e.retry_after))} if e.status_code == 503 and e.retry_after else None
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=headers)
+
+async def _admit(endpoint: str):
+    """حجز فتحة تنفيذ للنقطة أو رفض الطلب فوراً مع Retry-After عند تجاوز السعة"""
+    try:
+        return await admission[endpoint].acquire()
+    except AdmissionRejected as e:
+        logger.warning(f"🚦 رفض طلب {endpoint} ({e.status_code}): {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+def _set_phase(phase: str, message: str):
+    initialization_status.update({"phase": phase, "message": message})
+    logger.info(f"⏳ {message}")
+
+def _load_database():
+    """
+    تحميل النموذج ثم قاعدة البيانات (أو بنائها من PDF) ثم تمرير تمهيدي
+    تعمل على خيط منفصل حتى يبقى الخادم يستجيب لـ /health و /ready أثناء التحميل
+    """
     pdf_path = "medical_book.pdf"
     db_filename = "medical_db"
+    profile = initialization_status["startup"]
+    start_time = time.time()
     
-    try:
-        start_time = time.time()
-        
-        # التحقق من وجود قاعدة بيانات محفوظة مسبقاً
-        if os.path.exists(f"{db_filename}.index") and os.path.exists(f"{db_filename}_docs.pkl"):
-            logger.info("جاري تحميل قاعدة البيانات المحفوظة...")
-            embedding_manager.load(db_filename)
-            initialization_status.update({
-                "is_initialized": True,
-                "message": "تم التهيئة بنجاح من البيانات المحفوظة",
-                "load_time": f"{time.time() - start_time:.2f} ثانية"
-            })
-            logger.info(f"✅ تم تحميل {len(embedding_manager.documents)} مستند في {time.time() - start_time:.2f} ثانية")
-            return
-        
+    _set_phase("loading_model", "جاري تحميل نموذج الترميز...")
+    phase_start = time.perf_counter()
+    embedding_manager.load_model()
+    profile["model_s"] = round(time.perf_counter() - phase_start, 3)
+    
+    if reranker.load_state == "pending":
+        _set_phase("loading_reranker", "جاري تحميل نموذج إعادة الترتيب...")
+        phase_start = time.perf_counter()
+        reranker.load_model()
+        profile["reranker_s"] = round(time.perf_counter() - phase_start, 3)
+    
+    _set_phase("loading_index", "جاري تحميل قاعدة البيانات...")
+    phase_start = time.perf_counter()
+    # مع serve.py يكون الفهرس محملاً في العملية الرئيسية قبل fork ومشتركاً بين العمال
+    if embedding_manager.snapshot.index is not None:
+        embedding_manager.check_model_dimension()
+        message = "تم التهيئة بنجاح من الفهرس المحمل مسبقاً"
+    # التحقق من وجود قاعدة بيانات محفوظة مسبقاً
+    elif EmbeddingManager.db_exists(db_filename):
+        embedding_manager.load(db_filename)
+        message = "تم التهيئة بنجاح من البيانات المحفوظة"
+    else:
         # معالجة ملف PDF
         if not os.path.exists(pdf_path):
             initialization_status.update({
+                "phase": "failed",
                 "message": f"لم يتم العثور على {pdf_path}",
                 "error": "ملف PDF غير موجود"
             })
             logger.error(f"ملف PDF غير موجود: {pdf_path}")
             return
         
-        logger.info(f"جاري معالجة {pdf_path}...")
-        processor = PDFProcessor(pdf_path, chunk_size=500)
-        chunks = processor.process()
+        # يفضل تشغيل المعالجة مسبقاً عبر: python ingest.py medical_book.pdf
+        from ingest import IngestionPipeline, save_chunks
+        logger.info(f"جاري معالجة {pdf_path} (يمكن تشغيلها مسبقاً عبر ingest.py)...")
+        pipeline = IngestionPipeline(embedding_manager, db_filename=db_filename, chunk_size=500)
+        pipeline.run([pdf_path])
+        chunks = embedding_manager.documents
         
         if not chunks:
             initialization_status.update({
+                "phase": "failed",
                 "message": "لم يتم استخراج أي محتوى من PDF",
                 "error": "PDF فارغ أو غير قابل للقراءة"
             })
@@ -153,29 +311,95 @@ async def startup_event():
             return
         
         # حفظ الأجزاء للمراجعة
-        processor.save_chunks("chunks_output.txt")
-        
-        # إنشاء embeddings
-        logger.info("جاري إنشاء embeddings وحفظ قاعدة البيانات...")
-        embedding_manager.add_documents(chunks)
-        embedding_manager.save(db_filename)
-        
-        initialization_status.update({
-            "is_initialized": True,
-            "message": "تم التهيئة بنجاح من ملف PDF",
-            "load_time": f"{time.time() - start_time:.2f} ثانية",
-            "total_chunks": len(chunks)
-        })
-        
-        logger.info(f"✅ تمت التهيئة بنجاح! {len(chunks)} جزء في {time.time() - start_time:.2f} ثانية")
-        
+        save_chunks(chunks, "chunks_output.txt")
+        initialization_status["total_chunks"] = len(chunks)
+        message = "تم التهيئة بنجاح من ملف PDF"
+    profile["index_s"] = round(time.perf_counter() - phase_start, 3)
+    
+    _set_phase("warming_up", "جاري التمرير التمهيدي للنموذج والفهرس...")
+    profile["warmup_s"] = round(embedding_manager.warm_up(), 3)
+    
+    initialization_status.update({
+        "is_initialized": True,
+        "phase": "ready",
+        "message": message,
+        "load_time": f"{time.time() - start_time:.2f} ثانية"
+    })
+    logger.info(f"✅ جاهز: {len(embedding_manager.documents)} مستند في {time.time() - start_time:.2f} ثانية {profile}")
+
+def preload(db_filename: str = "medical_db"):
+    """
+    تحميل النموذج والفهرس قبل بدء الخادم، في العملية الرئيسية لـ serve.py قبل fork
+    نموذج PyTorch يُحمل هنا دون تشغيله فتتشارك العمال أوزانه (التمرير التمهيدي في كل عامل
+    بعد fork عبر _load_database). جلسة ONNX Runtime لا تُنشأ هنا: تشغل استدلالاً للتحقق عند
+    الإنشاء، ومجمع خيوطها يُحدد من ENCODER_THREADS عندها ولا ينتقل بأمان مع fork، فيحملها
+    كل عامل بعد ضبط حصته من الخيوط
+    """
+    if os.getenv("ENCODER_BACKEND", "torch") == "torch":
+        embedding_manager.load_model()
+    # Cross-Encoder نموذج PyTorch أيضاً: يُحمل دون تشغيل فتتشارك العمال أوزانه
+    reranker.load_model()
+    if EmbeddingManager.db_exists(db_filename):
+        embedding_manager.load(db_filename)
+
+async def _warm_start():
+    """تشغيل _load_database في الخلفية وتسجيل أي خطأ في حالة التهيئة"""
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(_load_database)
     except Exception as e:
         error_msg = f"خطأ في التهيئة: {str(e)}"
         initialization_status.update({
+            "phase": "failed",
             "message": error_msg,
             "error": str(e)
         })
         logger.error(f"❌ خطأ في التهيئة: {e}")
+    finally:
+        initialization_status["startup"]["total_s"] = round(time.perf_counter() - started, 3)
+
+@app.on_event("startup")
+async def startup_event():
+    """
+    تهيئة التطبيق عند البدء
+    الخادم يبدأ الاستماع فوراً، والنموذج والفهرس يُحمّلان في مهمة خلفية
+    (/health يستجيب مباشرة، و /ready يعيد 503 حتى يصبح البحث جاهزاً)
+    """
+    global _warm_start_task
+    
+    await llm_client.start()
+    
+    # تحميل تضمينات الاستعلامات المحفوظة من التشغيل السابق
+    query_cache_path = os.getenv("QUERY_CACHE_PATH")
+    if query_cache_path:
+        try:
+            embedding_manager.query_cache.load(query_cache_path)
+        except Exception as e:
+            logger.warning(f"⚠️ تعذر تحميل ذاكرة الاستعلامات المؤقتة: {e}")
+    
+    # التحقق من إعدادات البيئة
+    env_valid, env_message = validate_environment()
+    if not env_valid:
+        initialization_status.update({"phase": "failed", "error": env_message})
+        logger.error(f"خطأ في إعدادات البيئة: {env_message}")
+        return
+    
+    _warm_start_task = asyncio.create_task(_warm_start())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """إغلاق الاتصالات المفتوحة عند إيقاف التطبيق"""
+    if _warm_start_task is not None and not _warm_start_task.done():
+        _warm_start_task.cancel()
+    await llm_client.close()
+    embedding_manager.close()
+    
+    query_cache_path = os.getenv("QUERY_CACHE_PATH")
+    if query_cache_path:
+        try:
+            embedding_manager.query_cache.save(query_cache_path)
+        except Exception as e:
+            logger.warning(f"⚠️ تعذر حفظ ذاكرة الاستعلامات المؤقتة: {e}")
 
 @app.get("/")
 async def root():
@@ -194,11 +418,30 @@ async def status():
     
     status_info = {
         "initialized": initialization_status["is_initialized"],
+        "phase": initialization_status["phase"],
         "message": initialization_status["message"],
         "environment_ok": env_valid,
         "environment_message": env_message,
         "total_documents": len(embedding_manager.documents) if embedding_manager.documents else 0,
-        "model": embedding_manager.model.get_sentence_embedding_dimension() if hasattr(embedding_manager.model, 'get_sentence_embedding_dimension') else "Unknown"
+        # لا يُطلب النموذج قبل تحميله في الخلفية حتى لا تحمّله /status بنفسها
+        "model": embedding_manager.model.get_sentence_embedding_dimension() if embedding_manager.model_loaded else "Unknown",
+        "encoder_backend": embedding_manager.encoder_backend,
+        "llm_client": llm_client.stats(),
+        "query_cache": embedding_manager.query_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "index": embedding_manager.index_info(),
+        "index_snapshot": dict(embedding_manager.snapshot_info(), reload=reload_status),
+        "retrieval": embedding_manager.keyword_info(),
+        "encode_batcher": embedding_manager.batcher.stats(),
+        "reranker": reranker.stats(),
+        "context": {
+            "tokenizer": context_builder.tokenizer_name,
+            "budget_chat": CONTEXT_BUDGET_CHAT,
+            "budget_medical": CONTEXT_BUDGET_MEDICAL,
+        },
+        "admission": {name: controller.stats() for name, controller in admission.items()},
+        "embeddings": embedding_manager.embeddings_meta,
+        "startup": initialization_status["startup"]
     }
     
     if "error" in initialization_status and initialization_status["error"]:
@@ -229,13 +472,15 @@ async def analyze_daily_report(request: DailyReportRequest):
             detail="مفتاح OpenRouter API غير موجود. تأكد من إعداد ملف .env"
         )
     
+    ticket = await _admit("daily_report")
     try:
         # بناء تقرير مفصل عن الأدوية والإجابات
         medications_summary = _build_medications_summary(request.medications)
         questionnaire_summary = _build_questionnaire_summary(request.questionnaire_answers)
         
         # البحث عن معلومات طبية ذات صلة
-        medical_context = _get_medical_context(request.medications, request.questionnaire_answers)
+        stages = {"queue": ticket.wait_time}
+        medical_context = await _get_medical_context(request.medications, request.questionnaire_answers, stages)
         
         # إعداد رسالة الذكاء الاصطناعي
         messages = [
@@ -304,64 +549,27 @@ async def analyze_daily_report(request: DailyReportRequest):
         ]
         
         # استدعاء OpenRouter API
-        api_start = time.time()
-        try:
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
-                    "HTTP-Referer": "http://localhost:8000",
-                    "X-Title": "AFYA CARE - Medical RAG Chatbot",
-                },
-                json={
-                    "model": "gpt-3.5-turbo",
-                    "messages": messages,
-                    "temperature": 0.3,
-                    "max_tokens": 1500,
-                    "top_p": 0.9,
-                },
-                timeout=60
-            )
-            
-            api_time = time.time() - api_start
-            logger.info(f"📄 استجابة API لتقرير اليوم في {api_time:.2f} ثانية - الحالة: {response.status_code}")
-            
-            if response.status_code != 200:
-                error_detail = "خطأ غير معروف"
-                if response.text:
-                    try:
-                        error_data = response.json()
-                        error_detail = error_data.get('error', {}).get('message', response.text[:200])
-                    except:
-                        error_detail = response.text[:200]
-                
-                logger.error(f"❌ خطأ من OpenRouter API: {error_detail}")
-                raise HTTPException(
-                    status_code=500, 
-                    detail=f"خطأ في خدمة الذكاء الاصطناعي: {error_detail}"
-                )
-            
-            response_data = response.json()
-            
-            if not response_data.get("choices") or not response_data["choices"]:
-                raise HTTPException(status_code=500, detail="استجابة فارغة من خدمة الذكاء الاصطناعي")
-            
-            ai_response = response_data["choices"][0]["message"]["content"]
-            
-        except requests.exceptions.Timeout:
-            logger.error("⏰ انتهت مهلة الاتصال بـ OpenRouter API")
-            raise HTTPException(status_code=504, detail="انتهت مهلة الاتصال بخدمة الذكاء الاصطناعي")
-        except requests.exceptions.ConnectionError:
-            logger.error("🔌 خطأ في الاتصال بـ OpenRouter API")
-            raise HTTPException(status_code=503, detail="تعذر الاتصال بخدمة الذكاء الاصطناعي")
+        llm_start = time.perf_counter()
+        ai_response = await _call_llm(
+            messages,
+            title="AFYA CARE - Medical RAG Chatbot",
+            temperature=0.3,
+            max_tokens=1500,
+            timeout=60
+        )
+        stages["llm"] = time.perf_counter() - llm_start
         
         # معالجة استجابة الذكاء الاصطناعي
+        parse_start = time.perf_counter()
         analysis, recommendations, health_score, warning_level = _parse_ai_response(ai_response)
+        stages["parse"] = time.perf_counter() - parse_start
         
         total_time = time.time() - start_time
         
         logger.info(f"✅ تم تحليل تقرير اليوم في {total_time:.2f} ثانية - الدرجة: {health_score} - الإنذار: {warning_level}")
         
+        observe_stages("daily_report", stages)
+        mark_handler_done("daily_report")
         return DailyReportResponse(
             analysis=analysis,
             recommendations=recommendations,
@@ -378,6 +586,8 @@ async def analyze_daily_report(request: DailyReportRequest):
             status_code=500, 
             detail=f"خطأ داخلي في المعالجة: {str(e)}"
         )
+    finally:
+        ticket.release()
 
 def _build_medications_summary(medications: list) -> str:
     """بناء ملخص للأدوية"""
@@ -421,34 +631,78 @@ def _build_questionnaire_summary(answers: dict) -> str:
     
     return summary
 
-def _get_medical_context(medications: list, answers: dict) -> str:
-    """الحصول على السياق الطبي ذو الصلة"""
-    context_parts = []
+def _is_relevant(doc: dict, max_score: float) -> bool:
+    """
+    قبول النتيجة إذا كانت قريبة دلالياً، أو من أفضل نتائج البحث بالكلمات
+    (أسماء الأدوية النادرة تطابق حرفياً رغم بعدها في فضاء التضمين)
+    """
+    if doc['score'] < max_score:
+        return True
+    return doc.get('keyword_rank') is not None and doc['keyword_rank'] <= KEYWORD_TRUST_RANK
+
+async def _get_medical_context(medications: list, answers: dict, stages: dict = None) -> str:
+    """
+    الحصول على السياق الطبي ذو الصلة
+    stages: إن وُجد تُضاف إليه أزمنة encode و search و context بالثواني
+    """
+    stages = {} if stages is None else stages
+    # تجميع كل الاستعلامات: (نص البحث، عنوان السياق، حد الدرجة)
+    lookups = []
     
     # البحث عن معلومات حول الأدوية
     for med in medications:
         med_name = med.get('name', '')
         if med_name:
-            relevant_docs = embedding_manager.search(med_name, k=2)
-            for doc in relevant_docs[:1]:  # أفضل نتيجة لكل دواء
-                if doc['score'] < 1.8:
-                    context_parts.append(f"معلومات عن {med_name}: {doc['text'][:300]}...")
+            lookups.append((med_name, f"معلومات عن {med_name}", 1.8))
     
     # البحث عن معلومات حول الأعراض
     side_effects = answers.get('side_effects', '')
     if side_effects and 'لا توجد أعراض' not in side_effects:
-        relevant_docs = embedding_manager.search(side_effects, k=2)
-        for doc in relevant_docs[:1]:
-            if doc['score'] < 1.8:
-                context_parts.append(f"معلومات عن {side_effects}: {doc['text'][:300]}...")
+        lookups.append((side_effects, f"معلومات عن {side_effects}", 1.8))
     
     # البحث عن معلومات عامة
     general_feeling = answers.get('general_feeling', '')
     if general_feeling and 'جيد' not in general_feeling:
-        relevant_docs = embedding_manager.search("تحسين الصحة العامة", k=1)
+        lookups.append(("تحسين الصحة العامة", "نصائح للصحة العامة", 2.0))
+    
+    if not lookups:
+        return "لا توجد معلومات طبية إضافية متاحة"
+    
+    # بحث واحد مجمّع (دلالي + كلمات مفتاحية) بدلاً من بحث لكل استعلام
+    # النصوص تُقرأ من مخزن المستندات للنتائج المختارة فقط، ومن نفس النسخة التي بُحث فيها
+    snapshot = embedding_manager.snapshot
+    queries = [query for query, _, _ in lookups]
+    encode_start = time.perf_counter()
+    query_embeddings = await embedding_manager.aencode_queries(queries)
+    search_start = time.perf_counter()
+    batch_results = await embedding_manager.ahybrid_search_batch(
+        queries, k=2, query_embeddings=query_embeddings, with_text=False, snapshot=snapshot
+    )
+    context_start = time.perf_counter()
+    stages.update(encode=search_start - encode_start, search=context_start - search_start)
+    
+    selected = []
+    for (_, label, max_score), relevant_docs in zip(lookups, batch_results):
+        # أول نتيجة مقبولة لكل استعلام
         for doc in relevant_docs:
-            if doc['score'] < 2.0:
-                context_parts.append(f"نصائح للصحة العامة: {doc['text'][:300]}...")
+            if _is_relevant(doc, max_score):
+                selected.append(dict(doc, text=snapshot.documents[doc['index']], label=label))
+                _observe_retrieval("daily_report", relevant_docs, "relevant")
+                break
+        else:
+            _observe_retrieval("daily_report", relevant_docs, "none")
+    
+    # توزيع الميزانية بالتساوي على المصادر مع حذف المكرر منها (مع أدوية كثيرة يصل الحد لكل
+    # مصدر إلى min_tail_tokens فتأخذ المصادر الأولى الميزانية بدلاً من حذفها كلها)
+    context_parts = []
+    if selected:
+        packed, _ = context_builder.build(
+            selected, CONTEXT_BUDGET_MEDICAL, max_doc_tokens=CONTEXT_BUDGET_MEDICAL // len(selected)
+        )
+        for doc in packed:
+            suffix = "..." if doc["context_truncated"] else ""
+            context_parts.append(f"{doc['label']}: {doc['context_text']}{suffix}")
+    stages["context"] = time.perf_counter() - context_start
     
     return "\n\n".join(context_parts) if context_parts else "لا توجد معلومات طبية إضافية متاحة"
 
@@ -682,57 +936,70 @@ def generate_welcome_message(user_type: str):
     else:
         return "مرحباً! أنا مساعدك الصحي. كيف يمكنني مساعدتك في الحفاظ على صحتك؟ 🌿"
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    """الإجابة على الأسئلة الطبية"""
-    start_time = time.time()
+async def _retrieve_chat_docs(question: str, query_embedding, snapshot, endpoint: str = "chat") -> tuple:
+    """
+    البحث عن النصوص ذات الصلة بالسؤال وتضمينه وتصفية النتائج ذات الجودة المنخفضة
+    مع إعادة الترتيب (إن كانت مفعلة) يُسترجع عدد أكبر من المرشحين ويبقى أفضلها فقط
+    الأجزاء المختارة تُنظف وتُحذف المكررة منها وتُجمع ضمن CONTEXT_BUDGET_CHAT رمز
+    يرجع (الأجزاء، {"rerank": معلومات إعادة الترتيب، "context": معلومات تجميع السياق،
+    "timings": زمن البحث وتجميع السياق بالثواني})
+    snapshot: نسخة الفهرس التي يثبتها الطلب، ومنها تُقرأ المصادر في _build_sources_response
+    """
+    k = reranker.candidates if reranker.enabled else 5
+    search_start = time.perf_counter()
+    relevant_docs = (await embedding_manager.ahybrid_search_batch(
+        [question], k=k, query_embeddings=query_embedding, snapshot=snapshot
+    ))[0]
+    search_time = time.perf_counter() - search_start
     
-    if not initialization_status["is_initialized"]:
-        raise HTTPException(
-            status_code=503, 
-            detail=initialization_status.get("message", "التطبيق قيد الإعداد. حاول لاحقاً")
-        )
-    
-    # التحقق من وجود مفتاح API
-    if not os.getenv('OPENROUTER_API_KEY'):
-        raise HTTPException(
-            status_code=500, 
-            detail="مفتاح OpenRouter API غير موجود. تأكد من إعداد ملف .env"
-        )
-    
-    try:
-        # تسجيل السؤال
-        logger.info(f"🔍 معالجة سؤال: {request.question} - نوع المستخدم: {request.user_type}")
-        
-        # البحث عن النصوص ذات الصلة
-        relevant_docs = embedding_manager.search(request.question, k=5)
+    if reranker.enabled:
+        # النموذج يعمل في خيط منفصل حتى لا يوقف حلقة الأحداث
+        reranked, rerank_info = await asyncio.to_thread(reranker.rerank, question, relevant_docs)
+    else:
+        reranked, rerank_info = reranker.rerank(question, relevant_docs)
+    if reranked:
+        docs, result = reranked, "reranked"
+    else:
+        if rerank_info["skipped"] not in ("disabled", "few_candidates"):
+            logger.info(f"⏭️ تخطي إعادة الترتيب: {rerank_info['skipped']}")
         
-        # تصفية النتائج ذات الجودة المنخفضة
-        filtered_docs = [doc for doc in relevant_docs if doc['score'] < 1.8]
+        relevant_docs = relevant_docs[:5]
+        docs, result = [doc for doc in relevant_docs if _is_relevant(doc, 1.8)], "relevant"
         
-        if not filtered_docs:
-            filtered_docs = relevant_docs[:2]
+        if not docs:
+            docs, result = relevant_docs[:2], "fallback" if relevant_docs else "none"
             logger.warning("⚠️ لم توجد نتائج عالية الجودة، استخدام أفضل النتائج المتاحة")
-        
-        search_time = time.time() - start_time
-        logger.info(f"🔎 تم العثور على {len(filtered_docs)} وثيقة ذات صلة في {search_time:.2f} ثانية")
-        
-        # بناء السياق مع معلومات المستخدم
-        context = "\n\n".join([f"[مصدر {i+1} - درجة الثقة: {1/(1+doc['score']):.2f}]\n{doc['text']}" 
-                              for i, doc in enumerate(filtered_docs)])
-        
-        # إعداد رسالة مخصصة بناءً على نوع المستخدم
-        user_context = ""
-        if request.user_type == "treatment":
-            user_context = "المستخدم حالياً تحت العلاج الطبي ويحتاج لمعلومات دقيقة عن الأدوية والعلاجات."
-        elif request.user_type == "prevention":
-            user_context = "المستخدم يهتم بالوقاية الصحية والعادات السليمة."
-        
-        # إعداد الرسالة المحسنة
-        messages = [
-            {
-                "role": "system",
-                "content": f"""أنت مساعد طبي ذكي في تطبيق AFYA CARE. 
+    _observe_retrieval(endpoint, relevant_docs, result)
+    
+    context_start = time.perf_counter()
+    packed, retrieval_info = _pack_chat_context(docs, rerank_info)
+    retrieval_info["timings"] = {"search": search_time, "context": time.perf_counter() - context_start}
+    return packed, retrieval_info
+
+def _pack_chat_context(docs: list, rerank_info: dict) -> tuple:
+    packed, context_info = context_builder.build(docs, CONTEXT_BUDGET_CHAT)
+    if context_info["duplicates"] or context_info["truncated"] or context_info["dropped"]:
+        logger.info(f"✂️ تجميع السياق: {context_info}")
+    return packed, {"rerank": rerank_info, "context": context_info}
+
+def _build_chat_messages(request: ChatRequest, filtered_docs: list) -> list:
+    """بناء رسائل الذكاء الاصطناعي لسؤال المستخدم"""
+    # بناء السياق مع معلومات المستخدم
+    context = "\n\n".join([f"[مصدر {i+1} - درجة الثقة: {1/(1+doc['score']):.2f}]\n{doc['context_text']}" 
+                          for i, doc in enumerate(filtered_docs)])
+    
+    # إعداد رسالة مخصصة بناءً على نوع المستخدم
+    user_context = ""
+    if request.user_type == "treatment":
+        user_context = "المستخدم حالياً تحت العلاج الطبي ويحتاج لمعلومات دقيقة عن الأدوية والعلاجات."
+    elif request.user_type == "prevention":
+        user_context = "المستخدم يهتم بالوقاية الصحية والعادات السليمة."
+    
+    # إعداد الرسالة المحسنة
+    messages = [
+        {
+            "role": "system",
+            "content": f"""أنت مساعد طبي ذكي في تطبيق AFYA CARE. 
                 
 🎯 **المهمة**: تقديم معلومات طبية دقيقة بناءً على المصادر المقدمة فقط.
 
@@ -756,10 +1023,10 @@ async def chat(request: ChatRequest):
 - تشخيص الحالات الشخصية
 - إعطاء وعود شفاء
 - التكهن بمضاعفات محددة"""
-            },
-            {
-                "role": "user",
-                "content": f"""**المعلومات الطبية المتاحة من الموسوعة الطبية:**
+        },
+        {
+            "role": "user",
+            "content": f"""**المعلومات الطبية المتاحة من الموسوعة الطبية:**
 
 {context}
 
@@ -774,87 +1041,151 @@ async def chat(request: ChatRequest):
 - لا تخترع معلومات غير موجودة في المصادر
 - إذا كانت المعلومات غير كافية، اذكر ذلك بوضوح
 - ركز على الدقة الطبية والوضوح"""
-            }
-        ]
+        }
+    ]
+    
+    return messages
+
+def _build_sources_response(filtered_docs: list, documents) -> list:
+    """إعداد المصادر للإرجاع"""
+    sources_response = []
+    for doc in filtered_docs:
+        source_text = doc["text"]
+        page_num = None
+        if doc.get("metadata"):
+            page_num = doc["metadata"].get("page_start")
+        elif "صفحة" in source_text:
+            # قواعد البيانات القديمة بدون بيانات وصفية: استخراج رقم الصفحة من النص
+            page_match = re.search(r'صفحة\s+(\d+)', source_text)
+            if page_match:
+                page_num = int(page_match.group(1))
         
-        # استدعاء OpenRouter API
-        api_start = time.time()
-        try:
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
-                    "HTTP-Referer": "http://localhost:8000",
-                    "X-Title": "AFYA CARE - Medical RAG Chatbot",
-                },
-                json={
-                    "model": "gpt-3.5-turbo",
-                    "messages": messages,
-                    "temperature": 0.3,
-                    "max_tokens": 1000,
-                    "top_p": 0.9,
-                },
-                timeout=45
+        snippet = documents.snippet(doc["index"], 251)
+        sources_response.append({
+            "text": snippet[:250] + "..." if len(snippet) > 250 else snippet,
+            "relevance_score": float(doc["score"]),
+            "confidence": 1/(1+doc["score"]),
+            "page_number": page_num
+        })
+    
+    return sources_response
+
+def _check_chat_ready():
+    """التحقق من جاهزية التطبيق ومفتاح API قبل معالجة السؤال"""
+    if not initialization_status["is_initialized"]:
+        raise HTTPException(
+            status_code=503, 
+            detail=initialization_status.get("message", "التطبيق قيد الإعداد. حاول لاحقاً")
+        )
+    
+    # التحقق من وجود مفتاح API
+    if not os.getenv('OPENROUTER_API_KEY'):
+        raise HTTPException(
+            status_code=500, 
+            detail="مفتاح OpenRouter API غير موجود. تأكد من إعداد ملف .env"
+        )
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    """الإجابة على الأسئلة الطبية"""
+    start_time = time.time()
+    
+    _check_chat_ready()
+    
+    ticket = await _admit("chat")
+    try:
+        # تسجيل السؤال
+        logger.info(f"🔍 معالجة سؤال: {request.question} - نوع المستخدم: {request.user_type}")
+        
+        # ترميز السؤال مرة واحدة لاستخدامه في ذاكرة الإجابات والبحث
+        encode_start = time.time()
+        query_embedding = await embedding_manager.aencode_queries([request.question])
+        encode_time = time.time() - encode_start
+
+        # نسخة واحدة من الفهرس للذاكرة المؤقتة والبحث والمصادر حتى لو استُبدلت أثناء الطلب (انظر /reload)
+        snapshot = embedding_manager.snapshot
+
+        # البحث عن إجابة محفوظة لسؤال مشابه على نفس إصدار قاعدة البيانات
+        cached = answer_cache.lookup(request.user_type, query_embedding[0], version=snapshot.version)
+        if cached:
+            total_time = time.time() - start_time
+            logger.info(f"⚡ إجابة من الذاكرة المؤقتة (تشابه {cached['similarity']:.3f}) في {total_time:.3f} ثانية")
+            observe_stages("chat", {"queue": ticket.wait_time, "encode": encode_time})
+            mark_handler_done("chat")
+            return ChatResponse(
+                answer=cached["answer"],
+                sources=cached["sources"],
+                processing_time=total_time,
+                user_type=request.user_type,
+                processing_breakdown={
+                    "queue": ticket.wait_time,
+                    "encode": encode_time,
+                    "cache_hit": True,
+                    "cache_similarity": cached["similarity"],
+                    "total": total_time
+                }
             )
-            
-            api_time = time.time() - api_start
-            logger.info(f"📄 استجابة API في {api_time:.2f} ثانية - الحالة: {response.status_code}")
-            
-            if response.status_code != 200:
-                error_detail = "خطأ غير معروف"
-                if response.text:
-                    try:
-                        error_data = response.json()
-                        error_detail = error_data.get('error', {}).get('message', response.text[:200])
-                    except:
-                        error_detail = response.text[:200]
-                
-                logger.error(f"❌ خطأ من OpenRouter API: {error_detail}")
-                raise HTTPException(
-                    status_code=500, 
-                    detail=f"خطأ في خدمة الذكاء الاصطناعي: {error_detail}"
-                )
-            
-            response_data = response.json()
-            
-            if not response_data.get("choices") or not response_data["choices"]:
-                raise HTTPException(status_code=500, detail="استجابة فارغة من خدمة الذكاء الاصطناعي")
-            
-            answer = response_data["choices"][0]["message"]["content"]
-            
-        except requests.exceptions.Timeout:
-            logger.error("⏰ انتهت مهلة الاتصال بـ OpenRouter API")
-            raise HTTPException(status_code=504, detail="انتهت مهلة الاتصال بخدمة الذكاء الاصطناعي")
-        except requests.exceptions.ConnectionError:
-            logger.error("🔌 خطأ في الاتصال بـ OpenRouter API")
-            raise HTTPException(status_code=503, detail="تعذر الاتصال بخدمة الذكاء الاصطناعي")
         
-        total_time = time.time() - start_time
+        # البحث عن النصوص ذات الصلة
+        search_start = time.time()
+        filtered_docs, retrieval_info = await _retrieve_chat_docs(request.question, query_embedding, snapshot)
         
-        # إعداد المصادر للإرجاع
-        sources_response = []
-        for doc in filtered_docs:
-            source_text = doc["text"]
-            page_num = None
-            if "صفحة" in source_text:
-                page_match = re.search(r'صفحة\s+(\d+)', source_text)
-                if page_match:
-                    page_num = int(page_match.group(1))
-            
-            sources_response.append({
-                "text": source_text[:250] + "..." if len(source_text) > 250 else source_text,
-                "relevance_score": float(doc["score"]),
-                "confidence": 1/(1+doc["score"]),
-                "page_number": page_num
-            })
+        search_time = time.time() - search_start
+        logger.info(f"🔎 تم العثور على {len(filtered_docs)} وثيقة ذات صلة في {search_time:.2f} ثانية")
+        
+        prompt_start = time.perf_counter()
+        messages = _build_chat_messages(request, filtered_docs)
+        prompt_time = time.perf_counter() - prompt_start
+        
+        # استدعاء OpenRouter API
+        llm_start = time.time()
+        answer = await _call_llm(
+            messages,
+            title="AFYA CARE - Medical RAG Chatbot",
+            temperature=0.3,
+            max_tokens=1000,
+            timeout=45
+        )
+        llm_time = time.time() - llm_start
+        
+        sources_start = time.perf_counter()
+        sources_response = _build_sources_response(filtered_docs, snapshot.documents)
+        # إجابة فارغة من الخدمة لا تُخزن حتى لا تُعاد لكل سؤال مشابه حتى انتهاء صلاحيتها
+        if answer and answer.strip():
+            answer_cache.put(request.user_type, request.question, query_embedding[0], answer, sources_response, version=snapshot.version)
+        sources_time = time.perf_counter() - sources_start
+        
+        total_time = time.time() - start_time
         
         logger.info(f"✅ تمت معالجة السؤال في {total_time:.2f} ثانية")
         
+        timings = retrieval_info["timings"]
+        observe_stages("chat", {
+            "queue": ticket.wait_time,
+            "encode": encode_time,
+            "search": timings["search"],
+            "rerank": retrieval_info["rerank"]["time"] if retrieval_info["rerank"]["reranked"] else None,
+            "context": timings["context"] + prompt_time,
+            "llm": llm_time,
+            "sources": sources_time,
+        })
+        mark_handler_done("chat")
         return ChatResponse(
             answer=answer,
             sources=sources_response,
             processing_time=total_time,
-            user_type=request.user_type
+            user_type=request.user_type,
+            processing_breakdown={
+                "queue": ticket.wait_time,
+                "encode": encode_time,
+                "cache_hit": False,
+                "search": search_time,
+                "rerank": retrieval_info["rerank"]["time"],
+                "reranked": retrieval_info["rerank"]["reranked"],
+                "context_tokens": retrieval_info["context"]["tokens"],
+                "llm": llm_time,
+                "total": total_time
+            }
         )
     
     except HTTPException:
@@ -865,6 +1196,137 @@ async def chat(request: ChatRequest):
             status_code=500, 
             detail=f"خطأ داخلي في المعالجة: {str(e)}"
         )
+    finally:
+        ticket.release()
+
+def _sse_event(event: str, data: dict) -> str:
+    """تنسيق حدث Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    الإجابة على الأسئلة الطبية كبث مباشر (SSE)
+    الأحداث بالترتيب: sources ثم token (متكرر) ثم done، أو error عند الفشل
+    """
+    start_time = time.time()
+    
+    _check_chat_ready()
+    
+    logger.info(f"🔍 معالجة سؤال (بث مباشر): {request.question} - نوع المستخدم: {request.user_type}")
+    
+    # الفتحة تبقى محجوزة طوال البث وتحرر عند انتهائه
+    ticket = await _admit("chat")
+    try:
+        encode_start = time.perf_counter()
+        query_embedding = await embedding_manager.aencode_queries([request.question])
+        stages = {"queue": ticket.wait_time, "encode": time.perf_counter() - encode_start}
+        snapshot = embedding_manager.snapshot
+        cached = answer_cache.lookup(request.user_type, query_embedding[0], version=snapshot.version)
+        if cached:
+            sources_response = cached["sources"]
+        else:
+            filtered_docs, retrieval_info = await _retrieve_chat_docs(
+                request.question, query_embedding, snapshot, endpoint="chat_stream"
+            )
+            messages = _build_chat_messages(request, filtered_docs)
+            sources_response = _build_sources_response(filtered_docs, snapshot.documents)
+            stages.update(retrieval_info["timings"])
+            if retrieval_info["rerank"]["reranked"]:
+                stages["rerank"] = retrieval_info["rerank"]["time"]
+    except Exception as e:
+        ticket.release()
+        logger.error(f"💥 خطأ غير متوقع في معالجة السؤال: {str(e)}")
+        raise HTTPException(
+            status_code=500, 
+            detail=f"خطأ داخلي في المعالجة: {str(e)}"
+        )
+    
+    search_time = time.time() - start_time
+    
+    async def event_generator():
+        # المصادر تُرسل أولاً قبل أي نص
+        yield _sse_event("sources", {"sources": sources_response, "user_type": request.user_type})
+        
+        if cached:
+            time_to_first_token = time.time() - start_time
+            yield _sse_event("token", {"text": cached["answer"]})
+            total_time = time.time() - start_time
+            logger.info(f"⚡ إجابة من الذاكرة المؤقتة (بث مباشر) في {total_time:.3f} ثانية")
+            observe_stages("chat_stream", stages)
+            yield _sse_event("done", {
+                "processing_time": total_time,
+                "search_time": search_time,
+                "queue_time": ticket.wait_time,
+                "time_to_first_token": time_to_first_token,
+                "total_time": total_time,
+                "cache_hit": True
+            })
+            return
+        
+        tokens = []
+        time_to_first_token = None
+        llm_start = time.time()
+        try:
+            async for token in llm_client.stream(
+                messages,
+                title="AFYA CARE - Medical RAG Chatbot",
+                temperature=0.3,
+                max_tokens=1000,
+                timeout=45
+            ):
+                if time_to_first_token is None:
+                    time_to_first_token = time.time() - start_time
+                tokens.append(token)
+                yield _sse_event("token", {"text": token})
+        except LLMError as e:
+            yield _sse_event("error", {"status_code": e.status_code, "detail": e.detail, "retry_after": e.retry_after})
+            return
+        
+        if not "".join(tokens).strip():
+            # بث انتهى دون نص: خطأ للعميل بدلاً من done، ولا يُخزن في ذاكرة الإجابات
+            logger.warning("⚠️ بث فارغ من خدمة الذكاء الاصطناعي")
+            yield _sse_event("error", {"status_code": 502, "detail": "استجابة فارغة من خدمة الذكاء الاصطناعي", "retry_after": None})
+            return
+        
+        answer_cache.put(
+            request.user_type, request.question, query_embedding[0], "".join(tokens), sources_response,
+            version=snapshot.version,
+        )
+        
+        total_time = time.time() - start_time
+        observe_stages("chat_stream", dict(
+            stages,
+            first_token=start_time + time_to_first_token - llm_start if time_to_first_token is not None else None,
+            llm=time.time() - llm_start,
+        ))
+        logger.info(
+            f"✅ تمت معالجة السؤال (بث مباشر) في {total_time:.2f} ثانية - "
+            f"أول جزء بعد {time_to_first_token or 0:.2f} ثانية"
+        )
+        yield _sse_event("done", {
+            "processing_time": total_time,
+            "search_time": search_time,
+            "queue_time": ticket.wait_time,
+            "time_to_first_token": time_to_first_token,
+            "total_time": total_time,
+            "cache_hit": False
+        })
+    
+    async def released_events():
+        try:
+            async for event in event_generator():
+                yield event
+        finally:
+            ticket.release()
+    
+    # background يحرر الفتحة أيضاً إذا انقطع الاتصال قبل بدء البث (التحرير يتم مرة واحدة)
+    return StreamingResponse(
+        released_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(ticket.release)
+    )
 
 @app.post("/suggest_medication_schedule", response_model=MedicationScheduleResponse)
 async def suggest_medication_schedule(request: MedicationScheduleRequest):
@@ -883,6 +1345,7 @@ async def suggest_medication_schedule(request: MedicationScheduleRequest):
             detail="مفتاح OpenRouter API غير موجود. تأكد من إعداد ملف .env"
         )
     
+    ticket = await _admit("medication_schedule")
     try:
         # بناء قائمة الأدوية
         medications_list = "\n".join([f"• {med}" for med in request.medications])
@@ -929,61 +1392,21 @@ async def suggest_medication_schedule(request: MedicationScheduleRequest):
         ]
         
         # استدعاء OpenRouter API
-        api_start = time.time()
-        try:
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
-                    "HTTP-Referer": "http://localhost:8000",
-                    "X-Title": "AFYA CARE - Medication Scheduler",
-                },
-                json={
-                    "model": "gpt-3.5-turbo",
-                    "messages": messages,
-                    "temperature": 0.4,
-                    "max_tokens": 1200,
-                    "top_p": 0.9,
-                },
-                timeout=45
-            )
-            
-            api_time = time.time() - api_start
-            logger.info(f"⏰ استجابة API للجدولة في {api_time:.2f} ثانية - الحالة: {response.status_code}")
-            
-            if response.status_code != 200:
-                error_detail = "خطأ غير معروف"
-                if response.text:
-                    try:
-                        error_data = response.json()
-                        error_detail = error_data.get('error', {}).get('message', response.text[:200])
-                    except:
-                        error_detail = response.text[:200]
-                
-                logger.error(f"❌ خطأ من OpenRouter API: {error_detail}")
-                raise HTTPException(
-                    status_code=500, 
-                    detail=f"خطأ في خدمة الذكاء الاصطناعي: {error_detail}"
-                )
-            
-            response_data = response.json()
-            
-            if not response_data.get("choices") or not response_data["choices"]:
-                raise HTTPException(status_code=500, detail="استجابة فارغة من خدمة الذكاء الاصطناعي")
-            
-            ai_response = response_data["choices"][0]["message"]["content"]
-            
-        except requests.exceptions.Timeout:
-            logger.error("⏰ انتهت مهلة الاتصال بـ OpenRouter API")
-            raise HTTPException(status_code=504, detail="انتهت مهلة الاتصال بخدمة الذكاء الاصطناعي")
-        except requests.exceptions.ConnectionError:
-            logger.error("🔌 خطأ في الاتصال بـ OpenRouter API")
-            raise HTTPException(status_code=503, detail="تعذر الاتصال بخدمة الذكاء الاصطناعي")
+        llm_start = time.perf_counter()
+        ai_response = await _call_llm(
+            messages,
+            title="AFYA CARE - Medication Scheduler",
+            temperature=0.4,
+            max_tokens=1200,
+            timeout=45
+        )
         
         total_time = time.time() - start_time
         
         logger.info(f"✅ تم إنشاء اقتراح الجدولة في {total_time:.2f} ثانية")
         
+        observe_stages("medication_schedule", {"queue": ticket.wait_time, "llm": time.perf_counter() - llm_start})
+        mark_handler_done("medication_schedule")
         return MedicationScheduleResponse(
             suggested_schedule=ai_response,
             explanation="تم إنشاء الاقتراح بناءً على معلوماتك والأسس الطبية العامة",
@@ -998,15 +1421,18 @@ async def suggest_medication_schedule(request: MedicationScheduleRequest):
             status_code=500, 
             detail=f"خطأ داخلي في المعالجة: {str(e)}"
         )
+    finally:
+        ticket.release()
 
 
 @app.get("/health")
 async def health():
-    """فحص صحة النظام"""
+    """فحص حياة العملية: يستجيب فوراً حتى أثناء تحميل النموذج (للجاهزية انظر /ready)"""
     health_status = {
         "status": "healthy",
         "timestamp": time.time(),
         "initialized": initialization_status["is_initialized"],
+        "phase": initialization_status["phase"],
         "database_loaded": len(embedding_manager.documents) > 0 if embedding_manager.documents else False,
         "environment_ok": validate_environment()[0]
     }
@@ -1019,19 +1445,71 @@ async def health():
     
     return health_status
 
+@app.get("/ready")
+async def ready():
+    """فحص الجاهزية: 200 فقط بعد تحميل النموذج والفهرس والتمرير التمهيدي، وإلا 503"""
+    ready_status = {
+        "ready": initialization_status["is_initialized"],
+        "phase": initialization_status["phase"],
+        "message": initialization_status["message"],
+        "reranker": reranker.load_state,
+        "startup": initialization_status["startup"]
+    }
+    if not initialization_status["is_initialized"]:
+        if initialization_status.get("error"):
+            ready_status["error"] = initialization_status["error"]
+        return JSONResponse(status_code=503, content=ready_status)
+    return ready_status
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """
+    المقاييس بصيغة Prometheus: أزمنة المراحل لكل نقطة (afya_stage_seconds)، زمن الطلبات،
+    ردود OpenRouter والرموز المستخدمة، جودة الاسترجاع، وعدادات الطوابير والذاكرة المؤقتة
+    """
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+def _read_warm_snapshot(db_filename: str):
+    """قراءة النسخة الجديدة وتمريرها التمهيدي على خيط منفصل قبل نشرها"""
+    snapshot = embedding_manager.read_snapshot(db_filename)
+    embedding_manager.warm_up(snapshot)
+    return snapshot
+
 @app.post("/reload")
 async def reload_database():
-    """إعادة تحميل قاعدة البيانات (للاستخدام في التطوير)"""
+    """
+    إعادة تحميل قاعدة البيانات دون توقف الخدمة
+    النسخة الجديدة تُقرأ وتُمهد على خيط منفصل بينما تستمر الطلبات على النسخة الحالية،
+    ثم تُنشر بإسناد واحد: الطلبات الجارية تكمل على النسخة التي بدأت بها
+    """
     if not os.path.exists("medical_db.index"):
         raise HTTPException(status_code=404, detail="قاعدة البيانات غير موجودة")
+    if _reload_lock.locked():
+        raise HTTPException(status_code=409, detail="إعادة التحميل جارية بالفعل")
     
-    try:
-        embedding_manager.load("medical_db")
-        logger.info("🔄 تم إعادة تحميل قاعدة البيانات يدوياً")
-        return {"message": "تم إعادة تحميل قاعدة البيانات بنجاح", "documents": len(embedding_manager.documents)}
-    except Exception as e:
-        logger.error(f"❌ فشل إعادة تحميل قاعدة البيانات: {e}")
-        raise HTTPException(status_code=500, detail=f"فشل إعادة التحميل: {str(e)}")
+    async with _reload_lock:
+        reload_status.update({"state": "loading", "started_at": time.time(), "error": None})
+        try:
+            snapshot = await asyncio.to_thread(_read_warm_snapshot, "medical_db")
+        except Exception as e:
+            reload_status.update({"state": "failed", "error": str(e)})
+            logger.error(f"❌ فشل إعادة تحميل قاعدة البيانات: {e}")
+            raise HTTPException(status_code=500, detail=f"فشل إعادة التحميل: {str(e)}")
+        
+        previous = embedding_manager.snapshot.version
+        snapshot = embedding_manager.swap(snapshot)
+        reload_status.update({"state": "idle", "duration_s": round(time.time() - reload_status["started_at"], 3)})
+        logger.info(
+            f"🔄 تم إعادة تحميل قاعدة البيانات: الإصدار {previous} -> {snapshot.version} "
+            f"({len(snapshot.documents)} مستند، {snapshot.load_time:.2f} ثانية)"
+        )
+        return {
+            "message": "تم إعادة تحميل قاعدة البيانات بنجاح",
+            "documents": len(snapshot.documents),
+            "version": snapshot.version,
+            "previous_version": previous,
+            "load_time": round(snapshot.load_time, 3)
+        }
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,291 @@
+"""
+مقاييس الأداء بصيغة Prometheus النصية لنقطة /metrics، بدون اعتماديات إضافية
+
+- Counter و Histogram بتسميات (labels): كل تركيبة تسميات تُنشأ مرة واحدة، والتسجيل على
+  المسار الساخن زيادة أعداد تحت قفل قصير غير متنازع عليه تقريباً
+- Histogram بحدود ثابتة (buckets) يسمح بحساب النسب المئوية عبر histogram_quantile
+- callback: مقاييس تُقرأ لحظة الطلب من دالة، لعرض إحصائيات stats() الموجودة دون تكرارها
+- MetricsMiddleware: زمن كل طلب حسب المسار والحالة، وزمن تسلسل الاستجابة بعد انتهاء المعالج
+
+مع serve.py لكل عامل مقاييسه الخاصة، وكل قراءة لـ /metrics تصل لعامل واحد
+"""
+import contextvars
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# ثوانٍ: من أجزاء الملي ثانية (ذاكرة مؤقتة، بحث) حتى دقيقة (خدمة الذكاء الاصطناعي)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """الفرع الخاص بقيم التسميات (يُنشأ عند أول استخدام ثم يعاد نفسه)"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: التسميات المتوقعة {self.labelnames}، وصل {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, child in list(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}")
+        return lines
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.bounds = tuple(sorted(float(bound) for bound in buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """
+    مقياس يُحسب لحظة القراءة: fn ترجع رقماً (بدون تسميات) أو قاموساً
+    من قيم التسميات (tuple أو نص لتسمية واحدة) إلى رقم
+    """
+
+    def __init__(self, name: str, help_text: str, fn: Callable, labelnames: Sequence[str] = (), kind: str = "gauge"):
+        super().__init__(name, help_text, labelnames)
+        self.fn = fn
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        lines = self.header()
+        for key, value in values.items():
+            if value is None:
+                continue
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"المقياس {metric.name} مسجل مسبقاً")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(self, name: str, help_text: str, fn: Callable, labelnames: Sequence[str] = (), kind: str = "gauge") -> CallbackMetric:
+        return self._register(CallbackMetric(name, help_text, fn, labelnames, kind))
+
+    def render(self) -> str:
+        """كل المقاييس بصيغة Prometheus النصية (text/plain; version=0.0.4)"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # مقياس معطوب لا يُسقط بقية المقاييس
+                lines.append(f"# {metric.name} غير متاح: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "afya_http_request_seconds", "زمن الطلب من وصوله حتى آخر بايت من الاستجابة", ["route", "method", "status"]
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "afya_stage_seconds", "زمن كل مرحلة داخل نقطة النهاية", ["endpoint", "stage"]
+)
+
+# علامات الطلب الحالي (مثل انتهاء المعالج) يضعها المعالج ويقرؤها MetricsMiddleware
+_request_marks: contextvars.ContextVar = contextvars.ContextVar("request_marks", default=None)
+
+
+def observe_stages(endpoint: str, stages: Dict[str, float]):
+    """تسجيل أزمنة عدة مراحل (بالثواني) لنقطة نهاية، والقيم الفارغة تُتجاهل"""
+    for stage, seconds in stages.items():
+        if seconds is not None:
+            STAGE_SECONDS.labels(endpoint, stage).observe(seconds)
+
+
+def mark_handler_done(endpoint: str):
+    """يستدعيه المعالج عند انتهائه: ما بعده حتى بدء الاستجابة يُحسب مرحلة serialize لـ endpoint"""
+    marks = _request_marks.get()
+    if marks is not None:
+        marks["handler_done"] = (endpoint, time.perf_counter())
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware يسجل زمن كل طلب حسب قالب المسار (وليس المسار الفعلي حتى يبقى عدد
+    التسميات محدوداً)، وزمن serialize للمعالجات التي تستدعي mark_handler_done
+    """
+
+    def __init__(self, app, skip: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.skip = set(skip)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        marks = {}
+        token = _request_marks.set(marks)
+        status = 500
+
+        async def send_with_metrics(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                handler_done = marks.get("handler_done")
+                if handler_done is not None:
+                    endpoint, done_at = handler_done
+                    STAGE_SECONDS.labels(endpoint, "serialize").observe(time.perf_counter() - done_at)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _request_marks.reset(token)
+            REQUEST_SECONDS.labels(_route(scope), scope["method"], status).observe(time.perf_counter() - start)
+
+
+def _route(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
@@ -1,37 +1,119 @@
 import pdfplumber
-from typing import List
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import List, Dict, Iterator, Iterable, Callable
 import os
+from chunker import StreamingChunker
+
+
+def _available_cpus() -> int:
+    """عدد المعالجات المتاحة فعلياً لهذه العملية (يحترم حدود الحاويات)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[Dict]:
+    """استخراج نص الصفحات [start, end) داخل عملية منفصلة (تفتح الملف بنفسها)"""
+    records = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_num in range(start, end):
+            page = pdf.pages[page_num]
+            page_text = page.extract_text()
+            if page_text:
+                records.append({"page": page_num + 1, "text": page_text})
+            # تحرير الكائنات المخزنة للصفحة حتى لا تتراكم الذاكرة داخل العملية
+            page.close()
+    return records
+
 
 class PDFProcessor:
-    def __init__(self, pdf_path: str, chunk_size: int = 500):
+    def __init__(self, pdf_path: str, chunk_size: int = 500, workers: int = None, shard_size: int = 25,
+                 overlap: int = 50):
         """
         معالج ملفات PDF الطبية
         chunk_size: عدد الأحرف في كل جزء (chunk)
+        overlap: عدد الأحرف المشتركة بين كل جزء والجزء الذي يليه
+        workers: عدد العمليات لاستخراج الصفحات بالتوازي (الافتراضي PDF_WORKERS أو عدد المعالجات)
+        shard_size: عدد الصفحات في كل مهمة ترسل لعملية
         """
         self.pdf_path = pdf_path
         self.chunk_size = chunk_size
+        self.workers = workers or int(os.getenv("PDF_WORKERS", "0")) or _available_cpus()
+        self.shard_size = shard_size
+        self.overlap = overlap
         self.chunks = []
     
     def extract_text(self) -> str:
         """استخراج كل النص من ملف PDF"""
-        text = ""
+        parts = []
         try:
-            with pdfplumber.open(self.pdf_path) as pdf:
-                print(f"عدد الصفحات: {len(pdf.pages)}")
-                for page_num, page in enumerate(pdf.pages):
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += f"\n--- صفحة {page_num + 1} ---\n"
-                        text += page_text
-                    
-                    # طباعة التقدم كل 50 صفحة
-                    if (page_num + 1) % 50 == 0:
-                        print(f"تم معالجة {page_num + 1} صفحة...")
+            for record in self.extract_pages():
+                parts.append(f"\n--- صفحة {record['page']} ---\n")
+                parts.append(record["text"])
         except Exception as e:
             print(f"خطأ في قراءة PDF: {e}")
             return ""
         
-        return text
+        return "".join(parts)
+    
+    def page_count(self) -> int:
+        with pdfplumber.open(self.pdf_path) as pdf:
+            return len(pdf.pages)
+    
+    def extract_pages(self, workers: int = None) -> Iterator[Dict]:
+        """
+        استخراج النص صفحة بصفحة: {"page": رقم الصفحة, "text": نص الصفحة}
+        يتم تقسيم الصفحات إلى نطاقات تعالج بالتوازي، وتُعاد السجلات بترتيب الصفحات
+        """
+        workers = workers or self.workers
+        total_pages = self.page_count()
+        print(f"عدد الصفحات: {total_pages}")
+        
+        shards = [(start, min(start + self.shard_size, total_pages))
+                  for start in range(0, total_pages, self.shard_size)]
+        
+        if workers <= 1 or len(shards) <= 1:
+            results = (_extract_page_range(self.pdf_path, start, end) for start, end in shards)
+            yield from self._ordered_records(results, shards)
+            return
+        
+        # spawn بدلاً من fork: العملية الأم قد تكون خادم ويب حمّل torch وخيوطه
+        context = multiprocessing.get_context("spawn")
+        workers = min(workers, len(shards))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            try:
+                results = self._bounded_results(executor, shards, window=workers * 2)
+                yield from self._ordered_records(results, shards)
+            finally:
+                # إذا توقف المستهلك مبكراً لا تُنتظر بقية النطاقات
+                executor.shutdown(cancel_futures=True)
+    
+    def _bounded_results(self, executor, shards, window: int) -> Iterator[List[Dict]]:
+        """
+        نتائج النطاقات بترتيبها مع window نطاق على الأكثر قيد التنفيذ أو الانتظار: النطاق التالي
+        يُرسل عند استهلاك نتيجة، فلا تتراكم صفحات مستخرجة في العملية الأم إذا كان الترميز
+        أبطأ من الاستخراج (executor.map يرسل كل النطاقات دفعة واحدة)
+        """
+        remaining = iter(shards)
+        in_flight = deque(
+            executor.submit(_extract_page_range, self.pdf_path, start, end)
+            for start, end in islice(remaining, window)
+        )
+        while in_flight:
+            records = in_flight.popleft().result()
+            for start, end in islice(remaining, 1):
+                in_flight.append(executor.submit(_extract_page_range, self.pdf_path, start, end))
+            yield records
+    
+    @staticmethod
+    def _ordered_records(results, shards) -> Iterator[Dict]:
+        total_pages = shards[-1][1] if shards else 0
+        for records, (_, end) in zip(results, shards):
+            yield from records
+            print(f"تم معالجة {end}/{total_pages} صفحة...")
     
     def split_into_chunks(self, text: str) -> List[str]:
         """تقسيم النص إلى أجزاء صغيرة مع الحفاظ على السياق"""
@@ -52,13 +134,21 @@ class PDFProcessor:
         
         return chunks
     
+    def iter_chunks(self, pages: Iterable[Dict] = None, length_fn: Callable[[str], int] = None) -> Iterator[Dict]:
+        """
+        تقسيم الصفحات إلى أجزاء بشكل متدفق مع بيانات المصدر لكل جزء
+        (chunk_id, page_start, page_end, char_start, char_end)
+        length_fn: دالة قياس الطول، مثلاً عدد رموز tokenizer النموذج بدلاً من الأحرف
+        """
+        chunker = StreamingChunker(self.chunk_size, self.overlap, length_fn)
+        if pages is None:
+            pages = self.extract_pages()
+        return chunker.chunks(pages, source=os.path.basename(self.pdf_path))
+    
     def process(self) -> List[str]:
         """معالجة ملف PDF كاملاً"""
-        print("جاري استخراج النص من PDF...")
-        text = self.extract_text()
-        
-        print("جاري تقسيم النص إلى أجزاء...")
-        self.chunks = self.split_into_chunks(text)
+        print("جاري استخراج النص وتقسيمه إلى أجزاء...")
+        self.chunks = [chunk["text"] for chunk in self.iter_chunks()]
         
         print(f"تم إنشاء {len(self.chunks)} جزء من النص")
         return self.chunks
@@ -0,0 +1,111 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+# التشكيل والتطويل لا يغيران معنى الاستعلام
+_ARABIC_MARKS = re.compile(r'[\u064B-\u0652\u0640]')
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_size: int = 2048, model_name: str = ""):
+        """
+        ذاكرة تخزين مؤقت (LRU) لتضمينات الاستعلامات
+        آمنة للاستخدام من عدة threads، ومحدودة بعدد max_size عنصر
+        """
+        self.max_size = max_size
+        self.model_name = model_name
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """توحيد الاستعلام: إزالة التشكيل والمسافات الزائدة وتحويل الأحرف اللاتينية لحالة صغيرة"""
+        query = _ARABIC_MARKS.sub('', query)
+        return " ".join(query.split()).lower()
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """إرجاع التضمين المخزن أو None"""
+        key = self.normalize(query)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, query: str, vector: np.ndarray):
+        """تخزين تضمين استعلام مع إزالة الأقدم استخداماً عند الامتلاء"""
+        if self.max_size <= 0:
+            return
+        key = self.normalize(query)
+        vector = np.array(vector, dtype='float32')
+        vector.setflags(write=False)
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def save(self, path: str):
+        """حفظ محتوى الذاكرة المؤقتة على القرص (من الأقدم للأحدث)"""
+        with self._lock:
+            keys = list(self._entries.keys())
+            vectors = list(self._entries.values())
+        if not keys:
+            return
+        # الكتابة في ملف مؤقت ثم الاستبدال حتى لا يبقى ملف تالف عند التوقف المفاجئ،
+        # واسم الملف المؤقت خاص بالعملية لأن عمال serve.py يحفظون في المسار نفسه عند الإيقاف
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                keys=np.array(keys),
+                vectors=np.stack(vectors),
+                model_name=np.array(self.model_name),
+            )
+        os.replace(tmp_path, path)
+        print(f"تم حفظ {len(keys)} تضمين استعلام في {path}")
+
+    def load(self, path: str) -> int:
+        """تحميل الذاكرة المؤقتة المحفوظة، ويتم تجاهلها إذا كانت من نموذج مختلف"""
+        if not os.path.exists(path):
+            return 0
+        with np.load(path, allow_pickle=False) as data:
+            if str(data["model_name"]) != self.model_name:
+                print(f"تجاهل {path}: تم إنشاؤها بنموذج مختلف ({data['model_name']})")
+                return 0
+            keys = data["keys"].tolist()
+            vectors = data["vectors"]
+            for key, vector in zip(keys, vectors):
+                self.put(key, vector)
+        print(f"تم تحميل {len(keys)} تضمين استعلام من {path}")
+        return len(keys)
+
+    def stats(self) -> Dict:
+        """إحصائيات الاستخدام لعرضها في /status"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
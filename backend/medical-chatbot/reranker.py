@@ -0,0 +1,159 @@
+"""
+مرحلة إعادة ترتيب اختيارية بنموذج Cross-Encoder بين البحث وبناء الرسالة
+
+يُسترجع عدد أكبر من المرشحين، ثم يعاد تقييمهم مع السؤال في تمرير واحد ويبقى أفضل N.
+لكل طلب ميزانية زمنية: التكلفة لكل زوج (سؤال، نص) تقدر بمتوسط متحرك أسي من
+الطلبات السابقة، فإذا لم تتسع الميزانية يقلل عدد المرشحين أو تُتخطى المرحلة.
+وعند انشغال كل فتحات التنفيذ (ضغط عالٍ) تُتخطى المرحلة بدلاً من الانتظار.
+
+الإعدادات:
+    RERANKER_MODEL         اسم النموذج (مثلاً cross-encoder/ms-marco-MiniLM-L-6-v2)، فارغ = معطل
+    RERANK_CANDIDATES      عدد المرشحين من البحث (20)
+    RERANK_TOP_N           عدد الأجزاء المحتفظ بها (3)
+    RERANK_BUDGET_MS       الميزانية الزمنية لكل طلب بالمللي ثانية (150)
+    RERANK_MAX_CONCURRENT  عدد عمليات إعادة الترتيب المتزامنة (1)
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class Reranker:
+    def __init__(
+        self,
+        model_name: str = None,
+        candidates: int = None,
+        top_n: int = None,
+        budget_ms: float = None,
+        max_concurrent: int = None,
+        lazy: bool = False,
+    ):
+        """
+        lazy: عدم تحميل النموذج في الإنشاء، بل عند استدعاء load_model() (مثلاً في خلفية بدء الخادم)
+        """
+        self.model_name = model_name if model_name is not None else os.getenv("RERANKER_MODEL", "")
+        self.candidates = candidates or int(os.getenv("RERANK_CANDIDATES", "20"))
+        self.top_n = top_n or int(os.getenv("RERANK_TOP_N", "3"))
+        self.budget_ms = budget_ms if budget_ms is not None else float(os.getenv("RERANK_BUDGET_MS", "150"))
+        self.max_concurrent = max_concurrent or int(os.getenv("RERANK_MAX_CONCURRENT", "1"))
+
+        self.model = None
+        self._load_state = "pending" if self.model_name else "disabled"
+        self._model_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._stats_lock = threading.Lock()
+        self._ms_per_pair = None  # المتوسط المتحرك الأسي لتكلفة الزوج الواحد
+        self._alpha = 0.2
+        self.reranked = 0
+        self.skipped_busy = 0
+        self.skipped_budget = 0
+        self.trimmed = 0
+
+        if not lazy:
+            self.load_model()
+
+    def load_model(self):
+        """تحميل النموذج مرة واحدة (آمن من عدة خيوط)، وقبل تحميله تبقى المرحلة معطلة"""
+        with self._model_lock:
+            if self._load_state != "pending":
+                return self.model
+            try:
+                from sentence_transformers import CrossEncoder
+                self.model = CrossEncoder(self.model_name)
+                self._load_state = "loaded"
+                print(f"✅ تم تحميل نموذج إعادة الترتيب: {self.model_name}")
+            except Exception as e:
+                # إعادة الترتيب اختيارية: الخدمة تعمل بدونها
+                print(f"⚠️ تعذر تحميل نموذج إعادة الترتيب {self.model_name}: {e}")
+                self.model = None
+                self._load_state = "failed"
+        return self.model
+
+    @property
+    def load_state(self) -> str:
+        """disabled أو pending أو loaded أو failed"""
+        return self._load_state
+
+    @property
+    def enabled(self) -> bool:
+        return self.model is not None
+
+    def plan(self, n_candidates: int, budget_ms: float) -> int:
+        """عدد المرشحين الذين يمكن تقييمهم ضمن الميزانية (0 = تخطي المرحلة)"""
+        if self._ms_per_pair is None:
+            # أول طلب يقيس التكلفة
+            return n_candidates
+        fit = min(n_candidates, int(budget_ms / self._ms_per_pair))
+        # تقييم عدد لا يزيد على ما سنحتفظ به لا يغير النتيجة
+        return fit if fit > self.top_n else 0
+
+    def rerank(self, query: str, docs: List[Dict], budget_ms: float = None) -> Tuple[Optional[List[Dict]], Dict]:
+        """
+        إعادة ترتيب المرشحين (بترتيب البحث) وإرجاع أفضل top_n مع rerank_score
+        يرجع None بدل القائمة إذا تم تخطي المرحلة، ومعها سبب التخطي
+        """
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        info = {"reranked": False, "candidates": len(docs), "time": 0.0, "skipped": None}
+        if not self.enabled:
+            info["skipped"] = "disabled"
+            return None, info
+        if len(docs) <= self.top_n:
+            info["skipped"] = "few_candidates"
+            return None, info
+
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.skipped_busy += 1
+            info["skipped"] = "busy"
+            return None, info
+
+        try:
+            n = self.plan(len(docs), budget_ms)
+            if n == 0:
+                with self._stats_lock:
+                    self.skipped_budget += 1
+                    # بدون قياسات جديدة يبقى التقدير مرتفعاً بعد زوال الضغط، لذا يخفض
+                    # تدريجياً حتى تُجرب المرحلة مرة أخرى
+                    self._ms_per_pair *= 1 - self._alpha
+                info["skipped"] = "budget"
+                return None, info
+
+            start = time.perf_counter()
+            scores = self.model.predict(
+                [(query, doc["text"]) for doc in docs[:n]],
+                batch_size=n,
+                show_progress_bar=False
+            )
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        finally:
+            self._slots.release()
+
+        with self._stats_lock:
+            cost = elapsed_ms / n
+            self._ms_per_pair = cost if self._ms_per_pair is None else (
+                self._alpha * cost + (1 - self._alpha) * self._ms_per_pair
+            )
+            self.reranked += 1
+            if n < len(docs):
+                self.trimmed += 1
+
+        ranked = sorted(zip(scores, docs[:n]), key=lambda item: float(item[0]), reverse=True)
+        info.update({"reranked": True, "candidates": n, "time": elapsed_ms / 1000})
+        return [dict(doc, rerank_score=float(score)) for score, doc in ranked[:self.top_n]], info
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "enabled": self.enabled,
+                "model": self.model_name or None,
+                "load_state": self._load_state,
+                "candidates": self.candidates,
+                "top_n": self.top_n,
+                "budget_ms": self.budget_ms,
+                "ms_per_pair": round(self._ms_per_pair, 3) if self._ms_per_pair is not None else None,
+                "reranked": self.reranked,
+                "trimmed": self.trimmed,
+                "skipped_busy": self.skipped_busy,
+                "skipped_budget": self.skipped_budget,
+            }
@@ -0,0 +1,116 @@
+"""
+أدوات تحمل أعطال الخدمة الخارجية: إعادة المحاولة مع تأخير أسي عشوائي وقاطع دائرة
+
+الإعدادات:
+    LLM_MAX_ATTEMPTS        عدد المحاولات لكل نموذج (3)
+    LLM_RETRY_BASE_DELAY    التأخير الأساسي بالثواني (0.5)، يتضاعف مع كل محاولة
+    LLM_RETRY_MAX_DELAY     أقصى تأخير بين محاولتين بالثواني (4)
+    LLM_BREAKER_THRESHOLD   عدد الأعطال المتتالية لفتح الدائرة (5)
+    LLM_BREAKER_RECOVERY    ثواني الانتظار قبل تجربة الخدمة مرة أخرى (30)
+"""
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = None, base_delay: float = None, max_delay: float = None):
+        self.max_attempts = max_attempts or int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+        self.base_delay = base_delay if base_delay is not None else float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv("LLM_RETRY_MAX_DELAY", "4"))
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        """
+        التأخير قبل المحاولة التالية (attempt يبدأ من 0)
+        "full jitter": قيمة عشوائية بين 0 والحد الأسي حتى لا تعيد كل الطلبات المحاولة معاً
+        إذا طلبت الخدمة مهلة (Retry-After) لا ننتظر أقل منها
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = None, recovery_time: float = None):
+        """
+        قاطع دائرة لخدمة واحدة (أو نموذج واحد):
+        closed: الطلبات تمر، وبعد failure_threshold عطل متتالٍ تفتح الدائرة
+        open: الطلبات ترفض فوراً لمدة recovery_time
+        half_open: يسمح بطلب تجريبي واحد، نجاحه يغلق الدائرة وفشله يعيد فتحها
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+        self.recovery_time = recovery_time if recovery_time is not None else float(os.getenv("LLM_BREAKER_RECOVERY", "30"))
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.recovery_time:
+            self._state = HALF_OPEN
+            self._probe_started = None
+        return self._state
+
+    def allow(self) -> bool:
+        """هل يسمح بطلب الآن؟ (في half_open يسمح بطلب تجريبي واحد)"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN:
+                # الطلب التجريبي قد يلغى دون نتيجة، فيسمح بغيره بعد مهلة الاسترداد
+                if self._probe_started is None or now - self._probe_started >= self.recovery_time:
+                    self._probe_started = now
+                    return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            self._failures += 1
+            state = self._current_state(now)
+            if state == HALF_OPEN or (state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = now
+                self._probe_started = None
+                self.times_opened += 1
+
+    def retry_after(self) -> float:
+        """الثواني المتبقية حتى يسمح بطلب تجريبي"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.recovery_time - (time.monotonic() - self._opened_at))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self._current_state(time.monotonic()),
+                "consecutive_failures": self._failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
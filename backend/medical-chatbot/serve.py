@@ -0,0 +1,224 @@
+"""
+تشغيل الخادم بعدة عمليات تتشارك النموذج والفهرس (pre-fork)
+
+uvicorn --workers N يبدأ كل عامل من الصفر (spawn)، فيحمل كل عامل نسخته من أوزان النموذج
+والفهرس وفهرس الكلمات، وتتضاعف الذاكرة بعدد العمال. هنا تستورد العملية الرئيسية main وتحمل
+النموذج والفهرس مرة واحدة، ثم تنسخ نفسها (fork) إلى N عامل يستمعون على نفس المنفذ:
+- أوزان النموذج وفهرس الكلمات تبقى صفحات مشتركة (copy-on-write) لأنها لا تُكتب أثناء الخدمة
+- الفهرس والمستندات والتضمينات مربوطة بملفاتها (INDEX_MMAP، doc_store، vector_store) فتتشاركها
+  العمليات عبر ذاكرة النظام المؤقتة، حتى بعد /reload في أي عامل
+- لا يُشغل النموذج في العملية الرئيسية قبل fork (مجمعات خيوط PyTorch/OpenMP لا تنتقل مع fork)،
+  والتمرير التمهيدي وحد الخيوط (أنوية المعالج / عدد العمال) في كل عامل بعده
+- مع ENCODER_BACKEND=onnx لا تُحمل الجلسة في العملية الرئيسية أصلاً (إنشاؤها يشغل النموذج
+  ويثبت عدد خيوطه)، بل في كل عامل بعد fork بحصته من ENCODER_THREADS
+- العامل الذي يتوقف بشكل غير متوقع يعاد تشغيله من نفس النسخة المحملة، بتأخير يتضاعف مع كل
+  توقف سريع متتالٍ، وإذا تكرر توقف العمال خلال فترة قصيرة (إعداد خاطئ مثلاً) يتوقف الخادم
+  برمز خروج غير صفري بدل إعادة التشغيل إلى ما لا نهاية
+
+الاستخدام (Linux/macOS):
+    python serve.py --workers 4
+    python serve.py --workers 8 --host 0.0.0.0 --port 8000
+
+الإعدادات:
+    WEB_CONCURRENCY                  عدد العمال الافتراضي (1)
+    WORKER_RESPAWN_BASE_DELAY        تأخير إعادة تشغيل العامل بالثواني (1)، يتضاعف مع كل توقف سريع
+    WORKER_RESPAWN_MAX_DELAY         أقصى تأخير لإعادة التشغيل بالثواني (30)
+    WORKER_STABLE_AFTER              العامل الذي يعمل أطول من هذا (ثوانٍ) يعيد التأخير للأساس (30)
+    WORKER_CRASH_LIMIT               عدد توقفات العمال خلال WORKER_CRASH_WINDOW لإيقاف الخادم
+                                     (3 × عدد العمال)
+    WORKER_CRASH_WINDOW              نافذة عد التوقفات بالثواني (60)
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import uvicorn
+from uvicorn.main import STARTUP_FAILURE
+
+logger = logging.getLogger("serve")
+
+
+class RespawnPolicy:
+    def __init__(self, workers: int, base_delay: float = None, max_delay: float = None,
+                 stable_after: float = None, crash_limit: int = None, crash_window: float = None):
+        """
+        متى يعاد تشغيل العامل المتوقف:
+        التأخير يتضاعف مع كل توقف سريع متتالٍ لنفس العامل (base_delay، 2×، 4×... حتى max_delay)
+        ويعود للأساس إذا عمل العامل أطول من stable_after قبل توقفه.
+        إذا توقف العمال crash_limit مرة خلال crash_window ثانية فالمشكلة ليست عابرة،
+        و died تعيد None ليتوقف الخادم
+        """
+        self.base_delay = base_delay if base_delay is not None else float(os.getenv("WORKER_RESPAWN_BASE_DELAY", "1"))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv("WORKER_RESPAWN_MAX_DELAY", "30"))
+        self.stable_after = stable_after if stable_after is not None else float(os.getenv("WORKER_STABLE_AFTER", "30"))
+        self.crash_limit = crash_limit or int(os.getenv("WORKER_CRASH_LIMIT", str(3 * workers)))
+        self.crash_window = crash_window if crash_window is not None else float(os.getenv("WORKER_CRASH_WINDOW", "60"))
+        self._started: Dict[int, float] = {}
+        self._failures: Dict[int, int] = {}
+        self._crashes = deque()
+
+    def started(self, slot: int, now: float = None):
+        self._started[slot] = time.monotonic() if now is None else now
+
+    def died(self, slot: int, now: float = None) -> Optional[float]:
+        """تأخير إعادة تشغيل العامل بالثواني، أو None إذا كان التوقف متكرراً"""
+        now = time.monotonic() if now is None else now
+        self._crashes.append(now)
+        while self._crashes and now - self._crashes[0] > self.crash_window:
+            self._crashes.popleft()
+        if len(self._crashes) >= self.crash_limit:
+            return None
+
+        uptime = now - self._started.get(slot, now)
+        failures = 1 if uptime >= self.stable_after else self._failures.get(slot, 0) + 1
+        self._failures[slot] = failures
+        return min(self.max_delay, self.base_delay * (2 ** (failures - 1)))
+
+    def recent_crashes(self) -> int:
+        return len(self._crashes)
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(config: uvicorn.Config, sock: socket.socket, threads: int):
+    """يعمل داخل العامل بعد fork: ضبط الخيوط ثم تشغيل uvicorn على المنفذ المشترك"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    # مجمع خيوط النموذج لكل عامل حصته من الأنوية (ONNX Runtime يقرأ ENCODER_THREADS عند
+    # تحميله في هذا العامل، انظر main.preload)
+    os.environ["ENCODER_THREADS"] = str(threads)
+    import main
+    if main.embedding_manager.encoder_backend == "torch":
+        import torch
+        torch.set_num_threads(threads)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+    return 0 if server.started else STARTUP_FAILURE
+
+
+def serve(host: str, port: int, workers: int, log_level: str) -> int:
+    """يعيد رمز الخروج: 0 عند الإيقاف العادي، 1 إذا توقف العمال بشكل متكرر"""
+    import main
+
+    start = time.perf_counter()
+    main.preload()
+    shared = "النموذج والفهرس" if main.embedding_manager.model_loaded else "الفهرس"
+    logger.info(
+        f"📦 تم تحميل {shared} ({len(main.embedding_manager.documents)} مستند) "
+        f"في {time.perf_counter() - start:.2f} ثانية، سيتشاركها {workers} عامل"
+    )
+    if not main.embedding_manager.model_loaded:
+        logger.info("🧩 نموذج الترميز يُحمل في كل عامل بعد fork (ENCODER_BACKEND=onnx)")
+
+    sock = _bind(host, port)
+    config = uvicorn.Config(main.app, log_level=log_level)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    children = {}
+    pending: Dict[int, float] = {}  # عمال بانتظار إعادة التشغيل: الرقم -> وقت التشغيل
+    policy = RespawnPolicy(workers)
+    stopping = False
+    crash_loop = False
+
+    def spawn(slot: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = _run_worker(config, sock, threads)
+            except SystemExit as exc:
+                code = exc.code if isinstance(exc.code, int) else 1
+            except Exception:
+                logger.exception(f"❌ فشل العامل {slot}")
+            finally:
+                os._exit(code)
+        children[pid] = slot
+        policy.started(slot)
+        logger.info(f"🚀 العامل {slot} (pid {pid})")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for slot in range(workers):
+        spawn(slot)
+    logger.info(f"✅ الخادم على http://{host}:{port} بـ {workers} عامل (pid الرئيسي {os.getpid()})")
+
+    while children or (pending and not stopping):
+        if stopping:
+            pending.clear()
+        now = time.monotonic()
+        for slot, due in list(pending.items()):
+            if due <= now:
+                del pending[slot]
+                spawn(slot)
+
+        # بدون انتظار عند وجود عامل بانتظار إعادة التشغيل، حتى لا يتأخر عن موعده
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG if pending else 0)
+        except ChildProcessError:
+            pid, status = 0, 0
+        if pid == 0:
+            if pending:
+                time.sleep(min(0.2, max(0.0, min(pending.values()) - time.monotonic())))
+            continue
+
+        slot = children.pop(pid, None)
+        if slot is None or stopping:
+            continue
+        code = os.waitstatus_to_exitcode(status)
+        delay = policy.died(slot)
+        if delay is None:
+            logger.error(
+                f"❌ توقف العمال {policy.recent_crashes()} مرة خلال {policy.crash_window:.0f} ثانية "
+                f"(آخرها العامل {slot}، رمز الخروج {code})، إيقاف الخادم"
+            )
+            crash_loop = True
+            stop(None, None)
+            continue
+        logger.warning(
+            f"⚠️ توقف العامل {slot} (pid {pid}، رمز الخروج {code})، إعادة تشغيله بعد {delay:.1f} ثانية"
+        )
+        pending[slot] = time.monotonic() + delay
+
+    sock.close()
+    logger.info("🛑 تم إيقاف كل العمال")
+    return 1 if crash_loop else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="تشغيل الخادم بعدة عمال يتشاركون النموذج والفهرس")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("serve.py يحتاج fork (Linux/macOS)، استخدم: uvicorn main:app --workers N")
+
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(serve(args.host, args.port, args.workers, args.log_level))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+أدوات مشتركة للاختبارات: مسار الوحدات، وخادم OpenRouter وهمي محلي (upstream)
+
+الخادم الوهمي ينفذ لكل نموذج قائمة أفعال بالترتيب (آخر فعل يتكرر):
+    ("ok", latency[, answer])        إجابة ناجحة بعد latency ثانية (answer="" لإجابة أو بث فارغ)
+    ("status", code, retry_after)    رمز HTTP خطأ مع Retry-After اختياري
+    ("hang", seconds)                لا يرد قبل انتهاء المهلة
+    ("reset",)                       إغلاق الاتصال دون رد
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeUpstream:
+    def __init__(self):
+        self.scripts = {}
+        self.hits = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}/api/v1/chat/completions"
+
+    def configure(self, scripts: dict):
+        with self.lock:
+            self.scripts = {model: list(actions) for model, actions in scripts.items()}
+            self.hits = {}
+
+    def next_action(self, model: str):
+        with self.lock:
+            self.hits[model] = self.hits.get(model, 0) + 1
+            actions = self.scripts.get(model) or [("status", 404, None)]
+            return actions.pop(0) if len(actions) > 1 else actions[0]
+
+    def _handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                model = payload["model"]
+                action = upstream.next_action(model)
+
+                if action[0] == "reset":
+                    self.close_connection = True
+                    self.connection.close()
+                    return
+                if action[0] == "hang":
+                    time.sleep(action[1])
+                    return
+                if action[0] == "status":
+                    body = json.dumps({"error": {"message": f"injected {action[1]}"}}).encode("utf-8")
+                    self.send_response(action[1])
+                    if action[2] is not None:
+                        self.send_header("Retry-After", str(action[2]))
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                time.sleep(action[1])
+                answer = action[2] if len(action) > 2 else f"answer from {model}"
+                if payload.get("stream"):
+                    lines = [f"data: {json.dumps({'choices': [{'delta': {'content': word + ' '}}]})}\n\n"
+                             for word in answer.split()] + ["data: [DONE]\n\n"]
+                    body = "".join(lines).encode("utf-8")
+                    content_type = "text/event-stream"
+                else:
+                    body = json.dumps({"choices": [{"message": {"content": answer}}]}).encode("utf-8")
+                    content_type = "application/json"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture(scope="module")
+def upstream():
+    server = FakeUpstream()
+    yield server
+    server.server.shutdown()
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def test_admits_up_to_max_concurrent_without_waiting():
+    async def scenario():
+        controller = AdmissionController("chat", max_concurrent=2, max_queue=0, queue_timeout=1)
+        tickets = [await controller.acquire(), await controller.acquire()]
+        assert [ticket.wait_time for ticket in tickets] == [0.0, 0.0]
+        assert controller.stats()["active"] == 2
+        for ticket in tickets:
+            ticket.release()
+            ticket.release()  # التحرير مرة واحدة فقط
+        assert controller.stats()["active"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_rejects_with_429_and_retry_after():
+    async def scenario():
+        controller = AdmissionController("chat", max_concurrent=1, max_queue=1, queue_timeout=5)
+        ticket = await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        assert rejected.value.status_code == 429
+        assert rejected.value.retry_after >= 1
+        assert controller.rejected_queue_full == 1
+
+        ticket.release()
+        (await waiter).release()
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_rejects_with_503():
+    async def scenario():
+        controller = AdmissionController("chat", max_concurrent=1, max_queue=4, queue_timeout=0.05)
+        ticket = await controller.acquire()
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        assert rejected.value.status_code == 503
+        assert controller.stats()["queue_depth"] == 0
+        assert controller.rejected_timeout == 1
+
+        # الفتحة تبقى متاحة بعد تحريرها، ولا تضيع على الطلب المرفوض
+        ticket.release()
+        (await controller.acquire()).release()
+        assert controller.stats()["active"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_released_slot_goes_to_oldest_waiter():
+    async def scenario():
+        controller = AdmissionController("chat", max_concurrent=1, max_queue=4, queue_timeout=5)
+        ticket = await controller.acquire()
+        order = []
+
+        async def wait(name):
+            admitted = await controller.acquire()
+            order.append(name)
+            admitted.release()
+
+        waiters = [asyncio.create_task(wait(name)) for name in ("first", "second", "third")]
+        await asyncio.sleep(0)
+        ticket.release()
+        await asyncio.gather(*waiters)
+
+        assert order == ["first", "second", "third"]
+        assert controller.stats()["active"] == 0
+        assert controller.queued == 3
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    async def scenario():
+        controller = AdmissionController("chat", max_concurrent=1, max_queue=4, queue_timeout=5)
+        ticket = await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        ticket.release()
+
+        assert controller.stats()["active"] == 0
+        assert controller.stats()["queue_depth"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_grows_with_service_time_and_queue_depth():
+    async def scenario():
+        controller = AdmissionController("chat", max_concurrent=1, max_queue=2, queue_timeout=5)
+        ticket = await controller.acquire()
+        ticket.admitted_at -= 4  # زمن خدمة 4 ثوانٍ
+        ticket.release()
+
+        ticket = await controller.acquire()
+        waiters = [asyncio.create_task(controller.acquire()) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        # طابور من طلبين + الطلب الحالي بزمن خدمة ~4 ثوانٍ لكل منها
+        assert rejected.value.retry_after >= 12
+
+        ticket.release()
+        for waiter in waiters:
+            (await waiter).release()
+
+    asyncio.run(scenario())
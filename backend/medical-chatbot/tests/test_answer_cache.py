@@ -0,0 +1,71 @@
+import time
+
+import numpy as np
+
+from answer_cache import SemanticAnswerCache
+
+VECTORS = np.eye(8, dtype='float32')
+
+
+def test_similar_question_hits_only_for_same_user_type():
+    cache = SemanticAnswerCache(max_size=4, threshold=0.9)
+    cache.put("patient", "سؤال", VECTORS[0], "إجابة", [{"page": 1}])
+
+    near = VECTORS[0] + 0.1 * VECTORS[1]
+    hit = cache.lookup("patient", near)
+
+    assert hit["answer"] == "إجابة" and hit["sources"] == [{"page": 1}]
+    assert hit["similarity"] > 0.9
+    assert cache.lookup("doctor", near) is None
+    assert cache.lookup("patient", VECTORS[1]) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_full_cache_evicts_least_recently_used():
+    cache = SemanticAnswerCache(max_size=2)
+    cache.put("patient", "أ", VECTORS[0], "أ", [])
+    cache.put("patient", "ب", VECTORS[1], "ب", [])
+    cache.lookup("patient", VECTORS[0])
+
+    cache.put("patient", "ج", VECTORS[2], "ج", [])
+
+    assert cache.lookup("patient", VECTORS[0])["answer"] == "أ"
+    assert cache.lookup("patient", VECTORS[1]) is None
+    assert cache.lookup("patient", VECTORS[2])["answer"] == "ج"
+    assert cache.evictions == 1
+
+
+def test_expired_answer_is_not_returned():
+    cache = SemanticAnswerCache(max_size=2, ttl=0.05)
+    cache.put("patient", "أ", VECTORS[0], "أ", [])
+    assert cache.lookup("patient", VECTORS[0]) is not None
+
+    time.sleep(0.1)
+
+    assert cache.lookup("patient", VECTORS[0]) is None
+    assert cache.expirations == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_new_snapshot_version_invalidates_cached_answers():
+    cache = SemanticAnswerCache(max_size=4)
+    cache.put("patient", "أ", VECTORS[0], "إجابة قديمة", [], version=1)
+    assert cache.lookup("patient", VECTORS[0], version=1)["answer"] == "إجابة قديمة"
+
+    # أول طلب على الإصدار الجديد يفرغ الذاكرة
+    assert cache.lookup("patient", VECTORS[0], version=2) is None
+    assert cache.stats()["version"] == 2
+
+    # طلب بدأ على الإصدار القديم وانتهى بعد الاستبدال لا يُخزن ولا يقرأ
+    cache.put("patient", "أ", VECTORS[0], "إجابة قديمة", [], version=1)
+    assert cache.lookup("patient", VECTORS[0], version=1) is None
+    assert cache.lookup("patient", VECTORS[0], version=2) is None
+
+    cache.put("patient", "أ", VECTORS[0], "إجابة جديدة", [], version=2)
+    assert cache.lookup("patient", VECTORS[0], version=2)["answer"] == "إجابة جديدة"
+
+
+def test_disabled_cache_stores_nothing():
+    cache = SemanticAnswerCache(max_size=0)
+    cache.put("patient", "أ", VECTORS[0], "أ", [])
+    assert cache.lookup("patient", VECTORS[0]) is None
@@ -0,0 +1,57 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from batcher import EncodeBatcher
+
+
+def test_concurrent_requests_are_encoded_in_one_batch():
+    calls = []
+
+    def encode(texts):
+        calls.append(list(texts))
+        return np.array([[len(text)] for text in texts], dtype='float32')
+
+    async def scenario():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            batcher = EncodeBatcher(encode, executor, max_batch_size=32, max_wait=0.05)
+            return await asyncio.gather(
+                batcher.encode(["أ"]), batcher.encode(["بب", "ججج"]), batcher.encode(["أ"])
+            ), batcher.stats()
+
+    results, stats = asyncio.run(scenario())
+
+    # نفس النص من عدة طلبات يُرمز مرة واحدة، وكل طلب يأخذ صفوفه بترتيبه
+    assert calls == [["أ", "بب", "ججج"]]
+    assert [result[:, 0].tolist() for result in results] == [[1.0], [2.0, 3.0], [1.0]]
+    assert (stats["batches"], stats["items"]) == (1, 3)
+
+
+def test_full_batch_is_sent_without_waiting_for_window():
+    calls = []
+
+    def encode(texts):
+        calls.append(len(texts))
+        return np.zeros((len(texts), 2), dtype='float32')
+
+    async def scenario():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            batcher = EncodeBatcher(encode, executor, max_batch_size=2, max_wait=10)
+            await asyncio.wait_for(asyncio.gather(batcher.encode(["أ"]), batcher.encode(["ب"])), timeout=1)
+
+    asyncio.run(scenario())
+    assert calls == [2]
+
+
+def test_encode_error_reaches_every_request_in_batch():
+    def encode(texts):
+        raise RuntimeError("model failed")
+
+    async def scenario():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            batcher = EncodeBatcher(encode, executor, max_batch_size=32, max_wait=0.01)
+            return await asyncio.gather(batcher.encode(["أ"]), batcher.encode(["ب"]), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [str(result) for result in results] == ["model failed", "model failed"]
@@ -0,0 +1,104 @@
+"""
+ذاكرة الإجابات في /chat و /chat/stream مقابل الخادم الوهمي upstream (انظر conftest.py)
+الترميز والبحث ثابتان بدلاً من النموذج والفهرس، ودورة حياة التطبيق لا تُشغل
+"""
+import asyncio
+import json
+
+import httpx
+import numpy as np
+import pytest
+
+import main
+from answer_cache import SemanticAnswerCache
+from doc_store import DocumentStore
+from embeddings import IndexSnapshot
+from llm_client import LLMClient
+
+QUESTION = {"question": "ما هي أعراض السكري؟", "user_type": "patient"}
+
+
+@pytest.fixture
+def app(upstream, monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setenv("LLM_SINGLE_FLIGHT", "0")
+    monkeypatch.setenv("LLM_MODELS", "primary")
+    monkeypatch.setattr(main, "llm_client", LLMClient(url=upstream.url))
+
+    manager = main.embedding_manager
+    monkeypatch.setattr(manager, "snapshot", manager.snapshot)
+    manager.swap(IndexSnapshot(index=None, documents=DocumentStore.build(["نص طبي تجريبي - صفحة 1"])))
+
+    async def fixed_encode(queries):
+        return np.ones((len(queries), 8), dtype='float32')
+
+    async def fixed_search(queries, k=5, query_embeddings=None, **kwargs):
+        return [[{"text": "نص طبي تجريبي - صفحة 1", "score": 0.5, "index": 0}] for _ in queries]
+
+    monkeypatch.setattr(manager, "aencode_queries", fixed_encode)
+    monkeypatch.setattr(manager, "ahybrid_search_batch", fixed_search)
+    monkeypatch.setitem(main.initialization_status, "is_initialized", True)
+    main.answer_cache.clear()
+    yield main.app
+    main.answer_cache.clear()
+
+
+def _post_all(app, requests):
+    """تنفيذ الطلبات بالترتيب على حلقة واحدة، وقراءة أحداث SSE لطلبات البث"""
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+                results = []
+                for path in requests:
+                    response = await client.post(path, json=QUESTION)
+                    if path == "/chat/stream":
+                        results.append([
+                            (event.split("\n")[0][len("event: "):], json.loads(event.split("\n")[1][len("data: "):]))
+                            for event in response.text.strip().split("\n\n")
+                        ])
+                    else:
+                        results.append(response)
+                return results
+        finally:
+            await main.llm_client.close()
+
+    return asyncio.run(scenario())
+
+
+def test_chat_does_not_cache_empty_answer(app, upstream):
+    upstream.configure({"primary": [("ok", 0, "  "), ("ok", 0, "إجابة طبية")]})
+
+    empty, answer, cached = _post_all(app, ["/chat", "/chat", "/chat"])
+
+    assert empty.status_code == 200
+    assert answer.json()["answer"] == "إجابة طبية"
+    assert answer.json()["processing_breakdown"]["cache_hit"] is False
+    assert cached.json()["answer"] == "إجابة طبية"
+    assert cached.json()["processing_breakdown"]["cache_hit"] is True
+    assert upstream.hits == {"primary": 2}
+
+
+def test_chat_stream_reports_empty_stream_as_error(app, upstream):
+    upstream.configure({"primary": [("ok", 0, ""), ("ok", 0, "إجابة طبية")]})
+
+    empty, answer, cached = _post_all(app, ["/chat/stream", "/chat/stream", "/chat/stream"])
+
+    assert [name for name, _ in empty] == ["sources", "error"]
+    assert empty[-1][1]["status_code"] == 502
+    assert [name for name, _ in answer][-1] == "done"
+    assert answer[-1][1]["cache_hit"] is False
+    assert cached[-1][1]["cache_hit"] is True
+    assert "".join(data["text"] for name, data in cached if name == "token").strip() == "إجابة طبية"
+    assert upstream.hits == {"primary": 2}
+
+
+def test_answer_cache_refuses_empty_answer():
+    cache = SemanticAnswerCache(max_size=4)
+    vector = np.ones(8)
+
+    cache.put("patient", "سؤال", vector, "", [])
+    cache.put("patient", "سؤال", vector, " \n", [])
+
+    assert cache.stats()["size"] == 0
+    assert cache.lookup("patient", vector) is None
@@ -0,0 +1,56 @@
+import pytest
+
+from chunker import StreamingChunker
+
+PAGES = [
+    {"page": 1, "text": "Diabetes is a chronic disease. Insulin lowers blood sugar. Diet matters."},
+    {"page": 2, "text": "Metformin is a first line drug. Exercise improves insulin sensitivity."},
+    {"page": 3, "text": "Regular checkups detect complications early."},
+]
+FULL_TEXT = "\n".join(page["text"] for page in PAGES)
+
+
+def test_chunks_respect_size_and_map_back_to_full_text():
+    chunks = list(StreamingChunker(chunk_size=80, overlap=30).chunks(PAGES, source="book.pdf"))
+
+    assert [chunk["chunk_id"] for chunk in chunks] == list(range(len(chunks)))
+    for chunk in chunks:
+        assert len(chunk["text"]) <= 80
+        assert FULL_TEXT[chunk["char_start"]:chunk["char_end"]].strip() == chunk["text"]
+        assert chunk["source"] == "book.pdf"
+
+
+def test_last_sentences_are_carried_over_as_overlap():
+    chunks = list(StreamingChunker(chunk_size=80, overlap=30).chunks(PAGES))
+
+    # الجملة الأخيرة (أقصر من التداخل) تتكرر في أول الجزء التالي
+    assert chunks[1]["text"].startswith("Diet matters.")
+    assert chunks[1]["char_start"] < chunks[0]["char_end"]
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous["char_end"] - chunk["char_start"] <= 30
+
+
+def test_page_span_covers_chunk_crossing_page_boundary():
+    chunks = list(StreamingChunker(chunk_size=120, overlap=0).chunks(PAGES))
+
+    assert (chunks[0]["page_start"], chunks[0]["page_end"]) == (1, 2)
+    assert chunks[-1]["page_end"] == 3
+    # بدون تداخل تغطي الأجزاء النص كاملاً بلا فجوات
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk["char_start"] == previous["char_end"]
+    assert (chunks[0]["char_start"], chunks[-1]["char_end"]) == (0, len(FULL_TEXT))
+
+
+def test_oversized_sentence_is_split_on_words():
+    pages = [{"page": 1, "text": " ".join(["insulin"] * 40) + "."}]
+
+    chunks = list(StreamingChunker(chunk_size=50, overlap=0).chunks(pages))
+
+    assert len(chunks) > 1
+    assert all(len(chunk["text"]) <= 50 for chunk in chunks)
+    assert all(word == "insulin" for chunk in chunks for word in chunk["text"].rstrip(".").split())
+
+
+def test_overlap_must_be_smaller_than_chunk_size():
+    with pytest.raises(ValueError):
+        StreamingChunker(chunk_size=50, overlap=50)
@@ -0,0 +1,73 @@
+from context_builder import ContextBuilder
+
+
+def _doc(i: int, words: int = 80) -> dict:
+    # كلمات مختلفة لكل مصدر حتى لا تُحذف كأجزاء مكررة
+    return {"text": f"الدواء رقم {i} " + " ".join(f"كلمة{i}_{j}" for j in range(words)), "label": f"دواء {i}"}
+
+
+def test_many_sources_keep_context_when_share_is_below_min_tail():
+    builder = ContextBuilder()
+    docs = [_doc(i) for i in range(20)]
+
+    packed, info = builder.build(docs, 600, max_doc_tokens=600 // len(docs))
+
+    assert packed
+    assert [doc["label"] for doc in packed] == [f"دواء {i}" for i in range(len(packed))]
+    assert all(doc["context_tokens"] <= builder.min_tail_tokens for doc in packed)
+    assert info["tokens"] <= 600
+    assert len(packed) + info["dropped"] == len(docs)
+
+
+def test_per_doc_limit_splits_budget_between_few_sources():
+    builder = ContextBuilder()
+    docs = [_doc(i) for i in range(5)]
+
+    packed, info = builder.build(docs, 600, max_doc_tokens=600 // len(docs))
+
+    assert len(packed) == 5
+    assert all(doc["context_truncated"] and doc["context_tokens"] <= 120 for doc in packed)
+    assert info["tokens"] <= 600
+
+
+def test_boilerplate_lines_are_removed():
+    builder = ContextBuilder()
+    text = "--- صفحة 12 ---\nGALE ENCYCLOPEDIA OF MEDICINE 2 345\nالأنسولين ينظم السكر.\n\n\nيؤخذ قبل الأكل."
+
+    assert builder.clean(text) == "الأنسولين ينظم السكر.\nيؤخذ قبل الأكل."
+
+
+def test_near_duplicate_sources_are_dropped():
+    builder = ContextBuilder(dedup_threshold=0.7)
+    original = _doc(1)["text"]
+    docs = [{"text": original}, {"text": original + " إضافة"}, _doc(2)]
+
+    packed, info = builder.build(docs, 10_000)
+
+    assert [doc["text"] for doc in packed] == [original, docs[2]["text"]]
+    assert info["duplicates"] == 1
+
+
+def test_budget_packs_in_order_and_truncates_last_source():
+    builder = ContextBuilder()
+    docs = [_doc(i) for i in range(3)]
+    first = builder.count_tokens(builder.clean(docs[0]["text"]))
+    budget = first + builder.min_tail_tokens + 10
+
+    packed, info = builder.build(docs, budget)
+
+    assert [doc["label"] for doc in packed] == ["دواء 0", "دواء 1"]
+    assert not packed[0]["context_truncated"] and packed[1]["context_truncated"]
+    assert packed[1]["context_tokens"] <= budget - first
+    assert info == {"budget": budget, "tokens": sum(doc["context_tokens"] for doc in packed),
+                    "duplicates": 0, "dropped": 1, "truncated": 1}
+
+
+def test_truncate_cuts_on_word_boundaries_within_limit():
+    builder = ContextBuilder()
+    text = _doc(0)["text"]
+
+    cut = builder.truncate(text, 20)
+
+    assert builder.count_tokens(cut) <= 20
+    assert text.startswith(cut) and text[len(cut)] == " "
@@ -0,0 +1,53 @@
+import numpy as np
+
+from doc_store import DocumentStore
+
+
+def test_extended_keeps_existing_metadata_when_new_docs_have_none():
+    store = DocumentStore.build(["أ", "ب"], [{"page_start": 1, "source": "a.pdf"}, {"page_start": 2, "source": "a.pdf"}])
+
+    extended = store.extended(["ج"])
+
+    assert list(extended) == ["أ", "ب", "ج"]
+    assert extended.metadata(0) == {"page_start": 1, "source": "a.pdf"}
+    assert extended.metadata(1) == {"page_start": 2, "source": "a.pdf"}
+    assert extended.metadata(2) == {"page_start": None, "source": None}
+
+
+def test_extended_keeps_new_metadata_when_store_has_none():
+    store = DocumentStore.build(["أ", "ب"])
+
+    extended = store.extended(["ج"], [{"page_start": 7, "source": "b.pdf"}])
+
+    assert extended.metadata(0) == {"page_start": None, "source": None}
+    assert extended.metadata(1) == {"page_start": None, "source": None}
+    assert extended.metadata(2) == {"page_start": 7, "source": "b.pdf"}
+
+
+def test_extended_takes_union_of_columns():
+    store = DocumentStore.build(["أ"], [{"page_start": 1, "source": "a.pdf"}])
+
+    extended = store.extended(["ب"], [{"page_start": 3, "category": "قلب"}])
+
+    assert extended.metadata(0) == {"category": None, "page_start": 1, "source": "a.pdf"}
+    assert extended.metadata(1) == {"category": "قلب", "page_start": 3, "source": None}
+    assert all(len(column) == len(extended) for column in extended.columns.values())
+
+
+def test_extended_merges_categories():
+    store = DocumentStore.build(["أ", "ب"], [{"source": "b.pdf"}, {"source": None}])
+
+    extended = store.extended(["ج", "د"], [{"source": "a.pdf"}, {"source": "b.pdf"}])
+
+    assert [extended.metadata(i)["source"] for i in range(4)] == ["b.pdf", None, "a.pdf", "b.pdf"]
+
+
+def test_extended_store_round_trips(tmp_path):
+    store = DocumentStore.build(["أ"], [{"page_start": 1, "source": "a.pdf"}]).extended(["ب"])
+    store.save(str(tmp_path / "db"))
+
+    loaded = DocumentStore.load(str(tmp_path / "db"))
+
+    assert list(loaded) == ["أ", "ب"]
+    assert loaded.metadata(1) == {"page_start": None, "source": None}
+    assert np.array_equal(loaded.offsets, store.offsets)
@@ -0,0 +1,248 @@
+import hashlib
+import os
+import random
+
+import numpy as np
+import pytest
+
+import embeddings
+from embeddings import EmbeddingManager
+from ingest import IngestionPipeline
+from vector_store import embeddings_paths
+
+WORDS = (
+    "patient blood pressure diabetes insulin dose heart kidney liver symptom "
+    "treatment infection fever pain therapy chronic acute"
+).split()
+
+
+class HashEncoder:
+    """نموذج ترميز ثابت بدون تنزيل: متجه كل نص من بصمات كلماته"""
+
+    max_seq_length = 256
+
+    def __init__(self, dimension: int = 16):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        single = isinstance(texts, str)
+        vectors = np.zeros((1 if single else len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate([texts] if single else texts):
+            for word in text.split():
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimension] += 1
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-6)
+        return vectors[0] if single else vectors
+
+
+def make_pdf(path, pages: int, seed: int = 0):
+    """ملف PDF بسيط بصفحات من كلمات عشوائية (بدون مكتبات إنشاء PDF)"""
+    rnd = random.Random(seed)
+    objects = [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>", None]
+    kids = []
+    for _ in range(pages):
+        lines = [" ".join(rnd.choice(WORDS) for _ in range(10)) + "." for _ in range(30)]
+        stream = "\n".join(["BT /F1 9 Tf 40 800 Td 11 TL"] + [f"({line}) Tj T*" for line in lines] + ["ET"]).encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 1 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % kid for kid in kids) + b"] /Count %d >>" % pages
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, len(objects), xref)
+    with open(path, "wb") as f:
+        f.write(out)
+    return str(path)
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after_flushes(pipeline: IngestionPipeline, flushes: int):
+    """توقف المعالجة بعد عدد من نقاط الاستئناف (كأن العملية أُوقفت)"""
+    original, calls = pipeline._flush, []
+
+    def flush():
+        original()
+        calls.append(1)
+        if len(calls) == flushes:
+            raise Interrupted()
+
+    pipeline._flush = flush
+
+
+def staged_on_disk(pipeline: IngestionPipeline):
+    """عدد الأجزاء في ملفي المرحلة: (أسطر النصوص، صفوف التضمينات)"""
+    dimension = pipeline._staged()["dimension"]
+    with open(pipeline.staged_texts_path, encoding='utf-8') as f:
+        lines = sum(1 for _ in f)
+    return lines, os.path.getsize(pipeline.staged_vectors_path) // (dimension * 4)
+
+
+@pytest.fixture
+def new_pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings, "load_encoder", lambda model_name, backend=None: HashEncoder())
+    managers = []
+
+    def make(index_type: str = "flat", checkpoint_every: int = 16, db: str = "db") -> IngestionPipeline:
+        manager = EmbeddingManager(query_cache_size=0, index_type=index_type, encode_workers=1, lazy=True)
+        managers.append(manager)
+        return IngestionPipeline(
+            manager, db_filename=str(tmp_path / db), chunk_size=300, checkpoint_every=checkpoint_every, workers=1
+        )
+
+    yield make
+    for manager in managers:
+        manager.close()
+
+
+def test_rebuild_on_legacy_db_without_embeddings_file(tmp_path, new_pipeline):
+    first = new_pipeline(index_type="ivf_flat")
+    first.run([make_pdf(tmp_path / "a.pdf", pages=4, seed=1)])
+    # قاعدة بيانات قديمة: الفهرس والمستندات فقط
+    for path in embeddings_paths(str(tmp_path / "db")):
+        os.remove(path)
+
+    pipeline = new_pipeline(index_type="ivf_flat")
+    stats = pipeline.run([make_pdf(tmp_path / "b.pdf", pages=4, seed=2)])
+
+    manager = pipeline.embedding_manager
+    assert stats["chunks_added"] > 0
+    assert manager.index.ntotal == len(manager.documents) == stats["total_chunks"]
+    assert type(manager.index).__name__ == "IndexIVFFlat"
+    results = manager.hybrid_search_batch(["insulin dose"], k=3)[0]
+    assert results and all(0 <= result["index"] < len(manager.documents) for result in results)
+
+
+def test_compressed_legacy_index_keeps_current_index(tmp_path, new_pipeline):
+    first = new_pipeline(index_type="ivf_pq")
+    first.run([make_pdf(tmp_path / "a.pdf", pages=4, seed=1)])
+    for path in embeddings_paths(str(tmp_path / "db")):
+        os.remove(path)
+
+    pipeline = new_pipeline(index_type="ivf_pq")
+    stats = pipeline.run([make_pdf(tmp_path / "b.pdf", pages=4, seed=2)])
+
+    manager = pipeline.embedding_manager
+    assert manager.index.ntotal == len(manager.documents) == stats["total_chunks"]
+    assert manager.hybrid_search_batch(["insulin dose"], k=3)[0]
+
+
+def test_resume_recovers_when_staged_files_are_missing(tmp_path, new_pipeline):
+    pdf = make_pdf(tmp_path / "a.pdf", pages=4, seed=1)
+    interrupted = new_pipeline()
+    interrupted._load_existing()
+    interrupted.ingest(pdf)
+    assert interrupted._staged()["count"] > 0
+    # توقف قبل الإضافة للفهرس، ثم حُذفت ملفات المرحلة
+    os.remove(interrupted.staged_texts_path)
+    os.remove(interrupted.staged_vectors_path)
+
+    pipeline = new_pipeline()
+    stats = pipeline.run([pdf])
+
+    assert stats["chunks_added"] == interrupted.stats["chunks_added"]
+    assert stats["total_chunks"] == interrupted.stats["chunks_added"]
+    assert pipeline._staged()["count"] == 0
+    assert pipeline.manifest["sources"][pdf]["completed"]
+
+
+def test_resume_after_interruption_matches_single_run(tmp_path, new_pipeline):
+    pdf = make_pdf(tmp_path / "a.pdf", pages=4, seed=1)
+    reference = new_pipeline(db="reference")
+    reference.run([pdf])
+
+    interrupted = new_pipeline()
+    interrupt_after_flushes(interrupted, 2)
+    with pytest.raises(Interrupted):
+        interrupted.run([pdf])
+    staged = interrupted._staged()["count"]
+    assert staged == 2 * 16
+    assert not os.path.exists(f"{interrupted.db_filename}.index")
+
+    resumed = new_pipeline()
+    stats = resumed.run([pdf])
+
+    assert stats["chunks_skipped"] == staged
+    assert stats["chunks_added"] == reference.stats["chunks_added"] - staged
+    assert list(resumed.embedding_manager.documents) == list(reference.embedding_manager.documents)
+    assert resumed.embedding_manager.index.ntotal == len(resumed.embedding_manager.documents)
+
+
+def test_staged_files_match_manifest_and_torn_writes_are_dropped(tmp_path, new_pipeline):
+    pdf = make_pdf(tmp_path / "a.pdf", pages=4, seed=1)
+    interrupted = new_pipeline()
+    interrupt_after_flushes(interrupted, 2)
+    with pytest.raises(Interrupted):
+        interrupted.run([pdf])
+    staged = interrupted._staged()["count"]
+    assert staged_on_disk(interrupted) == (staged, staged)
+
+    # توقف أثناء كتابة الدفعة التالية: بيانات بعد آخر نقطة استئناف
+    with open(interrupted.staged_texts_path, 'a', encoding='utf-8') as f:
+        f.write('{"text": "جزء غير مكتمل')
+    with open(interrupted.staged_vectors_path, 'ab') as f:
+        f.write(b"\0" * 10)
+
+    resumed = new_pipeline()
+    resumed._load_existing()
+    assert staged_on_disk(resumed) == (staged, staged)
+    stats = resumed.run([pdf])
+
+    documents = list(resumed.embedding_manager.documents)
+    assert len(documents) == len(set(documents)) == stats["total_chunks"]
+    assert not os.path.exists(resumed.staged_texts_path)
+    assert resumed._staged() == {"count": 0, "dimension": None, "text_bytes": 0}
+
+
+def test_crash_after_db_save_does_not_duplicate_chunks(tmp_path, new_pipeline, monkeypatch):
+    pdf = make_pdf(tmp_path / "a.pdf", pages=4, seed=1)
+    interrupted = new_pipeline()
+    original_save = interrupted.embedding_manager.save
+
+    def save_then_crash(filename):
+        original_save(filename)
+        raise Interrupted()
+
+    monkeypatch.setattr(interrupted.embedding_manager, "save", save_then_crash)
+    with pytest.raises(Interrupted):
+        interrupted.run([pdf])
+    assert interrupted._staged()["count"] > 0
+
+    resumed = new_pipeline()
+    stats = resumed.run([pdf])
+
+    documents = list(resumed.embedding_manager.documents)
+    assert len(documents) == len(set(documents)) == interrupted.stats["chunks_added"]
+    assert stats["chunks_added"] == 0
+    assert resumed.embedding_manager.index.ntotal == len(documents)
+
+
+def test_unchanged_file_and_duplicate_chunks_are_skipped(tmp_path, new_pipeline):
+    pdf = make_pdf(tmp_path / "a.pdf", pages=4, seed=1)
+    first = new_pipeline()
+    first.run([pdf])
+    total = first.stats["total_chunks"]
+
+    again = new_pipeline()
+    assert again.run([pdf])["chunks_added"] == 0
+
+    # نفس المحتوى باسم آخر: الملف جديد لكن كل أجزائه مضافة سابقاً
+    copy = make_pdf(tmp_path / "copy.pdf", pages=4, seed=1)
+    stats = new_pipeline().run([copy])
+    assert stats["chunks_added"] == 0
+    assert stats["chunks_skipped"] == total
+    assert stats["total_chunks"] == total
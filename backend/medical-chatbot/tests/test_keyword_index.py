@@ -0,0 +1,47 @@
+from keyword_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+DOCUMENTS = [
+    "Metformin is used to treat type 2 diabetes.",
+    "Insulin lowers blood sugar in diabetes.",
+    "Aspirin relieves pain and fever.",
+    "الأنسولين يخفض سكر الدم",
+]
+
+
+def test_tokenize_normalizes_arabic_and_drops_stopwords():
+    assert tokenize("الأنسولين في السُّكَّري") == ["انسولين", "سكري"]
+    assert tokenize("nega-\ntive of the test") == ["negative", "test"]
+
+
+def test_rare_term_ranks_its_document_first():
+    index = BM25Index.build(DOCUMENTS)
+
+    results = index.search("metformin diabetes", k=5)
+
+    assert [doc_id for doc_id, _ in results] == [0, 1]
+    assert results[0][1] > results[1][1] > 0
+
+
+def test_only_matching_documents_are_returned():
+    index = BM25Index.build(DOCUMENTS)
+
+    assert [doc_id for doc_id, _ in index.search("انسولين", k=5)] == [3]
+    assert index.search("unknown words", k=5) == []
+    assert len(index.search("diabetes", k=1)) == 1
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = BM25Index.build(DOCUMENTS)
+    index.save(str(tmp_path / "db"))
+
+    loaded = BM25Index.load(str(tmp_path / "db"))
+
+    assert len(loaded) == len(DOCUMENTS)
+    assert loaded.search("aspirin fever") == index.search("aspirin fever")
+
+
+def test_reciprocal_rank_fusion_rewards_documents_in_both_rankings():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]], rrf_k=60)
+
+    assert [doc_id for doc_id, _ in fused] == [1, 3, 2, 4]
+    assert fused[0][1] == 1 / 61 + 1 / 62
@@ -0,0 +1,54 @@
+import pytest
+
+from metrics import Registry
+
+
+def test_counter_renders_labels_with_escaping():
+    registry = Registry()
+    counter = registry.counter("afya_test_total", "عداد", ["model"])
+    counter.labels('gpt "4"').inc()
+    counter.labels('gpt "4"').inc(2)
+
+    assert registry.render().splitlines() == [
+        "# HELP afya_test_total عداد",
+        "# TYPE afya_test_total counter",
+        'afya_test_total{model="gpt \\"4\\""} 3',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("afya_test_seconds", "زمن", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.labels("llm").observe(value)
+
+    lines = registry.render().splitlines()
+
+    assert lines[2:] == [
+        'afya_test_seconds_bucket{stage="llm",le="0.1"} 1',
+        'afya_test_seconds_bucket{stage="llm",le="1"} 3',
+        'afya_test_seconds_bucket{stage="llm",le="+Inf"} 4',
+        'afya_test_seconds_sum{stage="llm"} 4.25',
+        'afya_test_seconds_count{stage="llm"} 4',
+    ]
+
+
+def test_callback_metric_and_broken_metric_do_not_break_render():
+    registry = Registry()
+    registry.callback("afya_test_size", "حجم", lambda: {"answer": 3, "query": None}, ["cache"])
+    registry.callback("afya_test_broken", "معطوب", lambda: 1 / 0)
+
+    text = registry.render()
+
+    assert 'afya_test_size{cache="answer"} 3' in text
+    assert 'cache="query"' not in text
+    assert "# afya_test_broken غير متاح" in text
+    assert text.endswith("\n")
+
+
+def test_duplicate_metric_name_is_rejected():
+    registry = Registry()
+    registry.counter("afya_test_total", "عداد")
+
+    with pytest.raises(ValueError):
+        registry.counter("afya_test_total", "عداد")
@@ -0,0 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pdf_processor
+from pdf_processor import PDFProcessor
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+def test_bounded_results_keeps_window_of_shards_in_flight(monkeypatch):
+    monkeypatch.setattr(
+        pdf_processor, "_extract_page_range",
+        lambda path, start, end: [{"page": page + 1, "text": f"صفحة {page + 1}"} for page in range(start, end)],
+    )
+    shards = [(start, start + 5) for start in range(0, 50, 5)]
+    processor = PDFProcessor("unused.pdf", workers=2)
+
+    with CountingExecutor() as executor:
+        results = processor._bounded_results(executor, shards, window=4)
+        pages = []
+        for consumed, records in enumerate(results, 1):
+            # النطاق التالي يُرسل فقط عند استهلاك نتيجة
+            assert executor.submitted == min(4 + consumed, len(shards))
+            pages.extend(record["page"] for record in records)
+
+    assert pages == list(range(1, 51))
@@ -0,0 +1,48 @@
+import numpy as np
+
+from query_cache import QueryEmbeddingCache
+
+
+def test_normalized_queries_share_an_entry():
+    cache = QueryEmbeddingCache(max_size=4)
+    cache.put("ما هو  السُّكَّري؟", np.ones(4))
+
+    assert cache.get("ما هو السكري؟") is not None
+    assert QueryEmbeddingCache.normalize("  Insulin   DOSE ") == "insulin dose"
+
+
+def test_full_cache_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(max_size=2)
+    cache.put("أ", np.zeros(4))
+    cache.put("ب", np.ones(4))
+    cache.get("أ")
+
+    cache.put("ج", np.full(4, 2.0))
+
+    assert cache.get("ب") is None
+    assert cache.get("أ") is not None and cache.get("ج") is not None
+    assert cache.evictions == 1
+
+
+def test_cached_vectors_are_read_only():
+    cache = QueryEmbeddingCache(max_size=2)
+    cache.put("أ", np.zeros(4))
+
+    assert not cache.get("أ").flags.writeable
+
+
+def test_save_and_load_round_trip_and_ignore_other_model(tmp_path):
+    path = str(tmp_path / "queries.npz")
+    cache = QueryEmbeddingCache(max_size=4, model_name="model-a")
+    cache.put("أ", np.arange(4, dtype='float32'))
+    cache.put("ب", np.ones(4))
+    cache.save(path)
+
+    restored = QueryEmbeddingCache(max_size=4, model_name="model-a")
+    assert restored.load(path) == 2
+    assert np.array_equal(restored.get("أ"), np.arange(4, dtype='float32'))
+
+    other = QueryEmbeddingCache(max_size=4, model_name="model-b")
+    assert other.load(path) == 0
+    assert len(other) == 0
+    assert not [name for name in tmp_path.iterdir() if name.suffix == ".tmp"]
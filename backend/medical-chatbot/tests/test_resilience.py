@@ -0,0 +1,231 @@
+"""
+حقن أعطال لطبقة تحمل الأعطال في LLMClient (إعادة المحاولة، قاطع الدائرة، النموذج البديل)
+مقابل الخادم الوهمي upstream (انظر conftest.py)
+"""
+import asyncio
+import time
+
+import pytest
+
+from llm_client import LLMClient, LLMError
+
+MESSAGES = [{"role": "user", "content": "ما هي أعراض السكري؟"}]
+
+
+@pytest.fixture
+def new_client(upstream, monkeypatch):
+    # تأخيرات قصيرة حتى تنتهي السيناريوهات في ثوانٍ
+    for name, value in {
+        "LLM_RETRY_BASE_DELAY": "0.02",
+        "LLM_RETRY_MAX_DELAY": "0.1",
+        "LLM_MAX_ATTEMPTS": "3",
+        "LLM_BREAKER_THRESHOLD": "3",
+        "LLM_BREAKER_RECOVERY": "0.5",
+        "LLM_SINGLE_FLIGHT": "0",
+        "OPENROUTER_API_KEY": "fault-injection-key",
+    }.items():
+        monkeypatch.setenv(name, value)
+
+    def make(models: str) -> LLMClient:
+        monkeypatch.setenv("LLM_MODELS", models)
+        return LLMClient(url=upstream.url)
+
+    return make
+
+
+def test_transient_errors_are_retried(upstream, new_client):
+    """503 ثم 502 ثم نجاح: الطلب ينجح بعد إعادتي محاولة"""
+    upstream.configure({"primary": [("status", 503, None), ("status", 502, None), ("ok", 0)]})
+
+    async def scenario():
+        client = new_client("primary")
+        try:
+            assert await client.complete(MESSAGES, timeout=5) == "answer from primary"
+            assert client.retries == 2
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+    assert upstream.hits == {"primary": 3}
+
+
+def test_retry_after_is_respected(upstream, new_client):
+    """429 مع Retry-After: الانتظار لا يقل عن المهلة المطلوبة"""
+    upstream.configure({"primary": [("status", 429, 0.3), ("ok", 0)]})
+
+    async def scenario():
+        client = new_client("primary")
+        try:
+            start = time.monotonic()
+            await client.complete(MESSAGES, timeout=5)
+            return time.monotonic() - start
+        finally:
+            await client.close()
+
+    assert asyncio.run(scenario()) >= 0.3
+    assert upstream.hits == {"primary": 2}
+
+
+def test_non_retryable_error_skips_retry_and_fallback(upstream, new_client):
+    """401: لا إعادة محاولة ولا نموذج بديل"""
+    upstream.configure({"primary": [("status", 401, None)], "backup": [("ok", 0)]})
+
+    async def scenario():
+        client = new_client("primary,backup")
+        try:
+            with pytest.raises(LLMError) as error:
+                await client.complete(MESSAGES, timeout=5)
+            assert error.value.upstream_status == 401
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+    assert upstream.hits == {"primary": 1}
+
+
+def test_falls_back_after_retries_are_exhausted(upstream, new_client):
+    """النموذج الأساسي معطل: الإجابة من البديل بعد استنفاد المحاولات"""
+    upstream.configure({"primary": [("status", 500, None)], "backup": [("ok", 0)]})
+
+    async def scenario():
+        client = new_client("primary,backup")
+        try:
+            assert await client.complete(MESSAGES, timeout=5) == "answer from backup"
+            assert client.fallbacks == 1
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+    assert upstream.hits == {"primary": 3, "backup": 1}
+
+
+def test_unknown_model_falls_back_without_retry(upstream, new_client):
+    """404 للنموذج (غير متاح): انتقال فوري للبديل دون إعادة محاولة"""
+    upstream.configure({"primary": [("status", 404, None)], "backup": [("ok", 0)]})
+
+    async def scenario():
+        client = new_client("primary,backup")
+        try:
+            assert await client.complete(MESSAGES, timeout=5) == "answer from backup"
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+    assert upstream.hits == {"primary": 1, "backup": 1}
+
+
+def test_open_breaker_stops_requests_to_model(upstream, new_client):
+    """بعد فتح دائرة النموذج الأساسي لا تصله طلبات حتى انتهاء مهلة الاسترداد"""
+    upstream.configure({"primary": [("status", 503, None)], "backup": [("ok", 0)]})
+
+    async def scenario():
+        client = new_client("primary,backup")
+        try:
+            await client.complete(MESSAGES, timeout=5)
+            assert client._breaker("primary").state == "open"
+            primary_hits = upstream.hits["primary"]
+            for _ in range(10):
+                assert await client.complete(MESSAGES, timeout=5) == "answer from backup"
+            assert upstream.hits["primary"] == primary_hits
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_breaker_recovers_after_successful_probe(upstream, new_client):
+    """half_open: بعد المهلة طلب تجريبي واحد، ونجاحه يغلق الدائرة"""
+    upstream.configure({"primary": [("status", 503, None)] * 3 + [("ok", 0)], "backup": [("ok", 0)]})
+
+    async def scenario():
+        client = new_client("primary,backup")
+        try:
+            await client.complete(MESSAGES, timeout=5)
+            assert client._breaker("primary").state == "open"
+            await asyncio.sleep(0.6)
+            assert client._breaker("primary").state == "half_open"
+            assert await client.complete(MESSAGES, timeout=5) == "answer from primary"
+            assert client._breaker("primary").state == "closed"
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_all_models_down_fails_fast(upstream, new_client):
+    """كل النماذج معطلة: بعد فتح الدوائر ترفض الطلبات فوراً مع Retry-After دون الوصول للخادم"""
+    upstream.configure({"primary": [("reset",)], "backup": [("reset",)]})
+
+    async def scenario():
+        client = new_client("primary,backup")
+        try:
+            with pytest.raises(LLMError) as error:
+                await client.complete(MESSAGES, timeout=5)
+            assert error.value.status_code == 503
+            hits = dict(upstream.hits)
+
+            start = time.monotonic()
+            for _ in range(20):
+                with pytest.raises(LLMError) as error:
+                    await client.complete(MESSAGES, timeout=5)
+                assert error.value.status_code == 503
+                assert error.value.retry_after >= 1
+            assert time.monotonic() - start < 0.1
+            assert upstream.hits == hits
+            assert client.short_circuited == 20
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_deadline_holds_across_retries(upstream, new_client):
+    """خادم لا يرد: المهلة الكلية تحترم رغم إعادة المحاولة"""
+    upstream.configure({"primary": [("hang", 2)]})
+
+    async def scenario():
+        client = new_client("primary")
+        try:
+            start = time.monotonic()
+            with pytest.raises(LLMError) as error:
+                await client.complete(MESSAGES, timeout=0.5)
+            assert error.value.status_code == 504
+            return time.monotonic() - start
+        finally:
+            await client.close()
+
+    assert asyncio.run(scenario()) < 0.8
+
+
+def test_stream_retries_before_first_token(upstream, new_client):
+    """البث: عطل قبل أول جزء يعاد فيه المحاولة بشفافية"""
+    upstream.configure({"primary": [("status", 502, None), ("ok", 0)]})
+
+    async def scenario():
+        client = new_client("primary")
+        try:
+            return [token async for token in client.stream(MESSAGES, timeout=5)]
+        finally:
+            await client.close()
+
+    assert "".join(asyncio.run(scenario())).strip() == "answer from primary"
+    assert upstream.hits == {"primary": 2}
+
+
+def test_latency_brownout_stays_below_breaker_threshold(upstream, new_client):
+    """تباطؤ الخادم مع أعطال متفرقة (أقل من حد فتح الدائرة): كل الطلبات المتزامنة تنجح ضمن المهلة"""
+    upstream.configure({"primary": [("status", 503, None), ("status", 502, None), ("ok", 0.2)]})
+
+    async def scenario():
+        client = new_client("primary")
+        try:
+            start = time.monotonic()
+            answers = await asyncio.gather(*[client.complete(MESSAGES, timeout=5) for _ in range(10)])
+            assert all(answer == "answer from primary" for answer in answers)
+            assert client._breaker("primary").state == "closed"
+            return time.monotonic() - start
+        finally:
+            await client.close()
+
+    assert asyncio.run(scenario()) < 2.0
+    assert upstream.hits == {"primary": 12}
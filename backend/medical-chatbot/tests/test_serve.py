@@ -0,0 +1,60 @@
+from serve import RespawnPolicy
+
+
+def test_quick_crashes_back_off_exponentially_up_to_max():
+    policy = RespawnPolicy(workers=1, base_delay=1, max_delay=8, stable_after=30, crash_limit=100, crash_window=60)
+    delays, now = [], 0.0
+    for _ in range(6):
+        policy.started(0, now=now)
+        now += 0.5
+        delays.append(policy.died(0, now=now))
+        now += delays[-1]
+
+    assert delays == [1, 2, 4, 8, 8, 8]
+
+
+def test_stable_worker_resets_backoff():
+    policy = RespawnPolicy(workers=1, base_delay=1, max_delay=30, stable_after=30, crash_limit=100, crash_window=60)
+    policy.started(0, now=0)
+    assert policy.died(0, now=1) == 1
+    policy.started(0, now=2)
+    assert policy.died(0, now=3) == 2
+
+    policy.started(0, now=5)
+    assert policy.died(0, now=500) == 1
+
+
+def test_backoff_is_tracked_per_worker():
+    policy = RespawnPolicy(workers=2, base_delay=1, max_delay=30, stable_after=30, crash_limit=100, crash_window=60)
+    policy.started(0, now=0)
+    policy.started(1, now=0)
+    assert policy.died(0, now=1) == 1
+    policy.started(0, now=2)
+    assert policy.died(0, now=3) == 2
+
+    assert policy.died(1, now=4) == 1
+
+
+def test_repeated_crashes_within_window_stop_respawning():
+    policy = RespawnPolicy(workers=1, base_delay=1, max_delay=30, stable_after=30, crash_limit=3, crash_window=60)
+    policy.started(0, now=0)
+    assert policy.died(0, now=1) is not None
+    assert policy.died(0, now=2) is not None
+
+    assert policy.died(0, now=3) is None
+    assert policy.recent_crashes() == 3
+
+
+def test_crashes_outside_window_are_forgotten():
+    policy = RespawnPolicy(workers=1, base_delay=1, max_delay=30, stable_after=30, crash_limit=3, crash_window=60)
+    policy.started(0, now=0)
+    assert policy.died(0, now=1) is not None
+    assert policy.died(0, now=2) is not None
+
+    assert policy.died(0, now=100) is not None
+    assert policy.recent_crashes() == 1
+
+
+def test_default_crash_limit_scales_with_workers(monkeypatch):
+    monkeypatch.delenv("WORKER_CRASH_LIMIT", raising=False)
+    assert RespawnPolicy(workers=4).crash_limit == 12
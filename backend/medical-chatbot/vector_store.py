@@ -0,0 +1,93 @@
+import json
+import os
+import time
+from typing import Dict, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+class EmbeddingStoreMismatch(ValueError):
+    """التضمينات المحفوظة لا تطابق النموذج أو الفهرس الحالي"""
+
+
+def embeddings_paths(filename: str) -> Tuple[str, str]:
+    """مسارات ملف المصفوفة وملف البيانات الوصفية"""
+    return f"{filename}_embeddings.npy", f"{filename}_embeddings.json"
+
+
+def _is_normalized(embeddings: np.ndarray, sample: int = 256) -> bool:
+    if len(embeddings) == 0:
+        return False
+    norms = np.linalg.norm(embeddings[:sample], axis=1)
+    return bool(np.allclose(norms, 1.0, atol=1e-3))
+
+
+def save_embeddings(filename: str, embeddings: np.ndarray, model_name: str) -> Dict:
+    """
+    حفظ مصفوفة التضمينات (float32) بصيغة .npy قابلة للربط بالذاكرة (mmap)
+    مع ملف JSON صغير يصف النموذج والبعد والتطبيع وعدد الأجزاء
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    matrix_path, meta_path = embeddings_paths(filename)
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "model_name": model_name,
+        "dimension": int(embeddings.shape[1]),
+        "count": int(embeddings.shape[0]),
+        "dtype": "float32",
+        "normalized": _is_normalized(embeddings),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+    # الكتابة في ملفات مؤقتة ثم الاستبدال حتى لا تقرأ العمليات الأخرى ملفاً ناقصاً
+    with open(f"{matrix_path}.tmp", 'wb') as f:
+        np.save(f, embeddings)
+    with open(f"{meta_path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(f"{matrix_path}.tmp", matrix_path)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+    return meta
+
+
+def read_embeddings_meta(filename: str) -> Dict:
+    """قراءة البيانات الوصفية فقط دون تحميل المصفوفة"""
+    _, meta_path = embeddings_paths(filename)
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_embeddings(
+    filename: str,
+    model_name: str = None,
+    dimension: int = None,
+    count: int = None,
+    mmap: bool = True,
+) -> Tuple[np.ndarray, Dict]:
+    """
+    تحميل التضمينات كمصفوفة للقراءة فقط مربوطة بالذاكرة (mmap)
+    بحيث تتشارك عدة عمليات على نفس الجهاز نفس الصفحات عبر ذاكرة نظام التشغيل
+    يرفع EmbeddingStoreMismatch إذا لم يطابق النموذج أو البعد أو العدد القيم المتوقعة
+    """
+    matrix_path, _ = embeddings_paths(filename)
+    meta = read_embeddings_meta(filename)
+
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise EmbeddingStoreMismatch(f"إصدار صيغة غير مدعوم: {meta.get('format_version')}")
+    if model_name is not None and meta["model_name"] != model_name:
+        raise EmbeddingStoreMismatch(
+            f"التضمينات محفوظة بالنموذج {meta['model_name']} والنموذج الحالي {model_name}"
+        )
+    if dimension is not None and meta["dimension"] != dimension:
+        raise EmbeddingStoreMismatch(f"بعد التضمينات {meta['dimension']} لا يطابق البعد المتوقع {dimension}")
+    if count is not None and meta["count"] != count:
+        raise EmbeddingStoreMismatch(f"عدد التضمينات {meta['count']} لا يطابق العدد المتوقع {count}")
+
+    embeddings = np.load(matrix_path, mmap_mode='r' if mmap else None)
+    if embeddings.shape != (meta["count"], meta["dimension"]) or embeddings.dtype != np.float32:
+        raise EmbeddingStoreMismatch(f"ملف التضمينات {matrix_path} لا يطابق بياناته الوصفية")
+
+    return embeddings, meta